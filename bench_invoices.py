@@ -0,0 +1,414 @@
+"""
+Invoice detection benchmark.
+Generates a labeled synthetic corpus (text PDFs, scanned-image PDFs, JPEG/PNG
+receipts and DOCX files, invoices and look-alike non-invoices), runs the
+invoice detector over it and reports throughput, per-type latency and
+precision/recall at the invoice_min_score threshold.
+
+The corpus is deterministic for a given --seed and --count; --corpus keeps it
+in a folder (with a labels.json) so that runs before and after a change read
+the same files. With --baseline, the run fails if precision, recall or
+throughput regressed against a previous --json report.
+
+Image types need Tesseract; they are skipped when it is not installed.
+
+Usage:
+    python bench_invoices.py [--corpus DIR] [--count N] [--seed N]
+                             [--workers N] [--min-score N] [--types pdf,docx]
+                             [--json report.json] [--baseline report.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import unicodedata
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from utils.invoice_detector import InvoiceDetector, HAS_DOCX, HAS_OCR
+from utils.invoice_engine import InvoiceAnalysisEngine
+from utils.invoice_timing import percentile
+
+# Corpus file types: name -> extension
+TYPES = {
+    "text_pdf": ".pdf",
+    "scanned_pdf": ".pdf",
+    "jpeg": ".jpg",
+    "png": ".png",
+    "docx": ".docx",
+}
+IMAGE_TYPES = {"scanned_pdf", "jpeg", "png"}
+
+LABELS_FILE = "labels.json"
+
+COMPANIES = ["OVH SAS", "Amazon EU SARL", "Free Mobile", "EDF", "Orange SA", "Decathlon", "Leroy Merlin"]
+PRODUCTS = ["Abonnement mensuel", "Hébergement VPS", "Câble USB-C", "Forfait mobile", "Consommation électricité",
+            "Chaussures de running", "Perceuse sans fil", "Nom de domaine .fr", "Option TV"]
+
+
+# Documents
+def _amount(value: float) -> str:
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",")
+
+
+def _date(rng: random.Random) -> str:
+    return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2022, 2025)}"
+
+
+def invoice_lines(rng: random.Random) -> List[str]:
+    company = rng.choice(COMPANIES)
+    items = rng.sample(PRODUCTS, rng.randint(1, 4))
+    prices = [rng.uniform(4, 400) for _ in items]
+    total_ht = sum(prices)
+    title = rng.choice(["FACTURE", "Facture", "INVOICE / FACTURE"])
+    lines = [
+        company,
+        f"{rng.randint(1, 120)} rue de la République, {rng.randint(10, 95)}000 Paris",
+        f"SIRET : {rng.randint(100, 999)} {rng.randint(100, 999)} {rng.randint(100, 999)} {rng.randint(10000, 99999)}",
+        "",
+        f"{title} N° {rng.randint(2022, 2025)}-{rng.randint(1000, 99999)}",
+        f"Date de facture : {_date(rng)}",
+        f"Client : {rng.choice(['M. Dupont', 'Mme Martin', 'SARL Lemoine'])}",
+        "",
+    ]
+    lines += [f"{item}    {_amount(price)} €" for item, price in zip(items, prices)]
+    lines += [
+        "",
+        f"Total HT : {_amount(total_ht)} €",
+        f"TVA 20% : {_amount(total_ht * 0.2)} €",
+        f"Total TTC : {_amount(total_ht * 1.2)} €",
+        f"Échéance : {_date(rng)} - Paiement par {rng.choice(['carte bancaire', 'prélèvement', 'virement'])}",
+    ]
+    return lines
+
+
+def receipt_lines(rng: random.Random) -> List[str]:
+    company = rng.choice(COMPANIES)
+    items = rng.sample(PRODUCTS, rng.randint(1, 3))
+    prices = [rng.uniform(2, 150) for _ in items]
+    total = sum(prices)
+    lines = [company, "TICKET DE CAISSE - FACTURE SIMPLIFIÉE", f"Date : {_date(rng)}", ""]
+    lines += [f"{item[:22]:22} {_amount(price)} €" for item, price in zip(items, prices)]
+    lines += ["", f"TOTAL TTC {_amount(total)} €", f"dont TVA 20% {_amount(total / 6)} €", "Merci de votre visite"]
+    return lines
+
+
+def non_invoice_lines(rng: random.Random) -> List[str]:
+    kind = rng.choice(["notes", "newsletter", "letter", "quote"])
+    if kind == "notes":
+        return ["Compte rendu de réunion", f"Date : {_date(rng)}", "",
+                "Participants : Alice, Bruno, Chloé",
+                "- Point sur le planning du projet",
+                "- Répartition des tâches pour le sprint",
+                "- Prochaine réunion dans deux semaines"]
+    if kind == "newsletter":
+        return [f"La lettre d'information de {rng.choice(COMPANIES)}", "",
+                "Découvrez nos nouveautés du mois et nos conseils.",
+                "Vous recevez cet e-mail car vous êtes inscrit à notre newsletter.",
+                "Se désinscrire | Préférences"]
+    if kind == "letter":
+        return ["Madame, Monsieur,", "",
+                "Je vous prie de bien vouloir trouver ci-joint mon dossier de candidature.",
+                "Je reste à votre disposition pour un entretien.",
+                "Veuillez agréer mes salutations distinguées."]
+    # Hard negative: a quote mentions amounts and VAT but is not an invoice
+    total = rng.uniform(100, 3000)
+    return [rng.choice(COMPANIES), f"DEVIS N° D-{rng.randint(100, 999)}", f"Valable jusqu'au {_date(rng)}", "",
+            f"Prestation proposée : {_amount(total)} € HT",
+            "Bon pour accord, date et signature du client"]
+
+
+# Writers
+def _pdf_string(text: str) -> bytes:
+    raw = text.encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def write_text_pdf(path: str, pages: List[List[str]]):
+    """Minimal PDF with a text layer (Helvetica, WinAnsi), one list of lines per page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for lines in pages:
+        stream = b"BT /F1 11 Tf 14 TL 50 790 Td " + b" ".join(_pdf_string(line) + b" Tj T*" for line in lines) + b" ET"
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def _font(size: int) -> Tuple[ImageFont.ImageFont, bool]:
+    """A TrueType font with accents and €, or Pillow's default (ASCII only)."""
+    for name in ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf"):
+        try:
+            return ImageFont.truetype(name, size), False
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size), True
+    except TypeError:
+        # Pillow < 10.1 only has the small bitmap font
+        return ImageFont.load_default(), True
+
+
+def _ascii(text: str) -> str:
+    text = text.replace("€", "EUR").replace("°", "o")
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+
+
+def render_image(lines: List[str], rng: random.Random, width: int = 1240, scan: bool = True) -> Image.Image:
+    """Lines drawn on a white page, slightly rotated and blurred like a scan or photo."""
+    font, ascii_only = _font(30)
+    height = max(400, 80 + 44 * len(lines))
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((60, 40 + 44 * i), _ascii(line) if ascii_only else line, fill=rng.randint(0, 60), font=font)
+    if scan:
+        image = image.rotate(rng.uniform(-1.5, 1.5), fillcolor=255, expand=True)
+        image = image.filter(ImageFilter.GaussianBlur(rng.uniform(0.3, 0.8)))
+    return image
+
+
+def write_docx(path: str, lines: List[str], rng: random.Random):
+    from docx import Document
+    document = Document()
+    table_rows = [line for line in lines if line.endswith("€") and not line.startswith(("Total", "TVA"))]
+    for line in lines:
+        if line in table_rows:
+            continue
+        document.add_paragraph(line)
+    if table_rows:
+        # Line items in a table, as in most invoice templates
+        table = document.add_table(rows=0, cols=2)
+        for row in table_rows:
+            label, _, price = row.rpartition("    ")
+            cells = table.add_row().cells
+            cells[0].text, cells[1].text = label, price
+    document.save(path)
+
+
+def build_corpus(folder: str, count: int, seed: int, types: List[str]) -> Dict[str, bool]:
+    """Writes `count` files per type into `folder`; returns file name -> is invoice."""
+    rng = random.Random(seed)
+    labels = {}
+    os.makedirs(folder, exist_ok=True)
+    for file_type in types:
+        for i in range(count):
+            is_invoice = i % 2 == 0
+            if is_invoice:
+                lines = receipt_lines(rng) if file_type in ("jpeg", "png") else invoice_lines(rng)
+            else:
+                lines = non_invoice_lines(rng)
+            name = f"{file_type}_{i:03d}_{'invoice' if is_invoice else 'other'}{TYPES[file_type]}"
+            path = os.path.join(folder, name)
+
+            if file_type == "text_pdf":
+                # Some invoices carry their terms and conditions on extra pages
+                annex = [["Conditions générales de vente", "Article 1 - Objet"]] * rng.randint(0, 2)
+                write_text_pdf(path, [lines] + annex)
+            elif file_type == "scanned_pdf":
+                image = render_image(lines, rng).convert("RGB")
+                image.save(path, "PDF", resolution=150)
+            elif file_type == "jpeg":
+                render_image(lines, rng, width=900).save(path, "JPEG", quality=80)
+            elif file_type == "png":
+                render_image(lines, rng, width=900, scan=False).save(path, "PNG")
+            elif file_type == "docx":
+                write_docx(path, lines, rng)
+            labels[name] = is_invoice
+
+    with open(os.path.join(folder, LABELS_FILE), "w", encoding="utf-8") as f:
+        json.dump(labels, f, indent=2)
+    return labels
+
+
+def load_labels(folder: str) -> Dict[str, bool]:
+    with open(os.path.join(folder, LABELS_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def file_type_of(name: str) -> str:
+    return name.rsplit("_", 2)[0]
+
+
+# Scoring
+def classification(rows: List[Dict]) -> Dict[str, float]:
+    tp = sum(1 for r in rows if r["label"] and r["predicted"])
+    fp = sum(1 for r in rows if not r["label"] and r["predicted"])
+    fn = sum(1 for r in rows if r["label"] and not r["predicted"])
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"files": len(rows), "tp": tp, "fp": fp, "fn": fn,
+            "precision": precision, "recall": recall, "f1": f1}
+
+
+def latency(rows: List[Dict]) -> Dict[str, float]:
+    values = sorted(r["seconds"] for r in rows)
+    return {"mean": sum(values) / len(values), "p50": percentile(values, 50),
+            "p90": percentile(values, 90), "max": values[-1]}
+
+
+def run_benchmark(folder: str, labels: Dict[str, bool], workers: int, min_score=None) -> Tuple[List[Dict], float]:
+    """Analyzes the corpus; returns one row per file and the wall-clock time."""
+    detector = InvoiceDetector(use_cache=False)
+    if min_score is not None:
+        detector.min_score = min_score
+    paths = [os.path.join(folder, name) for name in sorted(labels)]
+
+    start = time.perf_counter()
+    if workers > 1:
+        results = list(InvoiceAnalysisEngine(detector, workers).analyze(paths))
+    else:
+        results = [detector.analyze_file(path) for path in paths]
+    elapsed = time.perf_counter() - start
+
+    rows = []
+    for result in results:
+        rows.append({
+            "file": result.file_name,
+            "type": file_type_of(result.file_name),
+            "label": labels[result.file_name],
+            "predicted": result.is_invoice,
+            "confidence": round(result.confidence_score, 3),
+            "seconds": result.timings.get("total", 0.0),
+            "error": result.error,
+        })
+    return rows, elapsed
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of `report` against `baseline`, as messages."""
+    regressions = []
+    for metric in ("precision", "recall"):
+        before, after = baseline["overall"][metric], report["overall"][metric]
+        if after < before - 1e-9:
+            regressions.append(f"{metric} dropped from {before:.1%} to {after:.1%}")
+    before, after = baseline["files_per_second"], report["files_per_second"]
+    if after < before * (1 - tolerance):
+        regressions.append(f"throughput dropped from {before:.1f} to {after:.1f} files/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Corpus folder, generated if it has no labels.json (default: temporary)")
+    parser.add_argument("--count", type=int, default=20, help="Files generated per type (default: 20)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the corpus (default: 42)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Analysis processes; 1 analyzes in this process (default: 1)")
+    parser.add_argument("--min-score", type=int, help="Threshold to evaluate (default: invoice_min_score setting)")
+    parser.add_argument("--types", default=",".join(TYPES), help=f"Types to generate (default: {','.join(TYPES)})")
+    parser.add_argument("--json", dest="json_path", help="Write the detailed report to this file")
+    parser.add_argument("--baseline", help="Previous --json report; exit with 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Throughput drop allowed against the baseline (default: 0.15)")
+    args = parser.parse_args(argv)
+
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    unknown = [t for t in types if t not in TYPES]
+    if unknown:
+        print(f"Unknown types: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    if not HAS_OCR or shutil.which("tesseract") is None:
+        skipped = [t for t in types if t in IMAGE_TYPES]
+        if skipped:
+            print(f"Tesseract not available, skipping {', '.join(skipped)}")
+        types = [t for t in types if t not in IMAGE_TYPES]
+    if not HAS_DOCX and "docx" in types:
+        print("python-docx not installed, skipping docx")
+        types.remove("docx")
+    if not types:
+        print("Nothing to benchmark")
+        return 1
+
+    temporary = args.corpus is None
+    folder = tempfile.mkdtemp(prefix="invoice-bench-") if temporary else args.corpus
+    try:
+        if not temporary and os.path.exists(os.path.join(folder, LABELS_FILE)):
+            labels = {name: label for name, label in load_labels(folder).items() if file_type_of(name) in types}
+            print(f"Using corpus {folder} ({len(labels)} files)")
+        else:
+            start = time.perf_counter()
+            labels = build_corpus(folder, args.count, args.seed, types)
+            print(f"Generated {len(labels)} files in {time.perf_counter() - start:.1f}s")
+        rows, elapsed = run_benchmark(folder, labels, args.workers, args.min_score)
+    finally:
+        if temporary:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    report = {
+        "seed": args.seed,
+        "workers": args.workers,
+        "min_score": args.min_score if args.min_score is not None else InvoiceDetector(use_cache=False).min_score,
+        "seconds": elapsed,
+        "files_per_second": len(rows) / max(elapsed, 1e-9),
+        "overall": classification(rows),
+        "types": {},
+        "misclassified": [r for r in rows if r["label"] != r["predicted"]],
+        "files": rows,
+    }
+    print()
+    print(f"{'Type':12} {'files':>5} {'mean ms':>8} {'p50 ms':>8} {'p90 ms':>8} {'max ms':>8} "
+          f"{'precision':>9} {'recall':>7} {'errors':>6}")
+    for file_type in types:
+        type_rows = [r for r in rows if r["type"] == file_type]
+        if not type_rows:
+            continue
+        stats = {**latency(type_rows), **classification(type_rows),
+                 "errors": sum(1 for r in type_rows if r["error"])}
+        report["types"][file_type] = stats
+        print(f"{file_type:12} {stats['files']:5d} {stats['mean'] * 1000:8.1f} {stats['p50'] * 1000:8.1f} "
+              f"{stats['p90'] * 1000:8.1f} {stats['max'] * 1000:8.1f} "
+              f"{stats['precision']:9.1%} {stats['recall']:7.1%} {stats['errors']:6d}")
+
+    overall = report["overall"]
+    print()
+    print(f"{len(rows)} files in {elapsed:.2f}s: {report['files_per_second']:.1f} files/s "
+          f"with {args.workers} worker(s)")
+    print(f"min_score {report['min_score']}: precision {overall['precision']:.1%}, "
+          f"recall {overall['recall']:.1%}, F1 {overall['f1']:.3f}")
+    for row in report["misclassified"]:
+        expected = "invoice" if row["label"] else "not an invoice"
+        print(f"  missed: {row['file']} should be {expected} (confidence {row['confidence']:.0%})"
+              + (f" - {row['error']}" if row["error"] else ""))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+OCR preprocessing benchmark.
+Runs Tesseract on every image of a folder with and without the NumPy
+preprocessing stage and reports OCR time and accuracy.
+
+Ground truth is optional: for `photo.jpg`, put the expected text in
+`photo.txt` next to it. Without it only timings are reported.
+
+Usage:
+    python bench_ocr.py <images_folder> [--lang eng+fra] [--json report.json]
+"""
+import argparse
+import difflib
+import json
+import os
+import statistics
+import sys
+import time
+
+import pytesseract
+from PIL import Image
+
+from utils.image_preprocess import preprocess_for_ocr, HAS_NUMPY
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif'}
+
+
+def accuracy(expected: str, actual: str) -> float:
+    """Character similarity of the two texts, whitespace-insensitive."""
+    expected = ' '.join(expected.lower().split())
+    actual = ' '.join(actual.lower().split())
+    if not expected:
+        return 0.0
+    return difflib.SequenceMatcher(None, expected, actual, autojunk=False).ratio()
+
+
+def run_ocr(image_path: str, lang: str, preprocess: bool):
+    start = time.perf_counter()
+    image = Image.open(image_path)
+    if preprocess:
+        image = preprocess_for_ocr(image)
+    prep_time = time.perf_counter() - start
+    text = pytesseract.image_to_string(image, lang=lang)
+    return text, prep_time, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="Folder containing the images to OCR")
+    parser.add_argument("--lang", default="eng+fra", help="Tesseract languages (default: eng+fra)")
+    parser.add_argument("--json", dest="json_path", help="Also write the detailed results to this file")
+    args = parser.parse_args()
+
+    if not HAS_NUMPY:
+        print("NumPy is not installed: preprocessing is disabled, nothing to compare.")
+        return 1
+
+    images = sorted(
+        os.path.join(args.folder, name) for name in os.listdir(args.folder)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+    if not images:
+        print(f"No images found in {args.folder}")
+        return 1
+
+    rows = []
+    print(f"{'Image':40} {'raw s':>8} {'prep s':>8} {'raw acc':>8} {'prep acc':>8}")
+    for image_path in images:
+        truth_path = os.path.splitext(image_path)[0] + '.txt'
+        truth = None
+        if os.path.exists(truth_path):
+            with open(truth_path, 'r', encoding='utf-8') as f:
+                truth = f.read()
+
+        raw_text, _, raw_time = run_ocr(image_path, args.lang, preprocess=False)
+        prep_text, prep_stage, prep_time = run_ocr(image_path, args.lang, preprocess=True)
+        row = {
+            "image": os.path.basename(image_path),
+            "raw_seconds": raw_time,
+            "preprocessed_seconds": prep_time,
+            "preprocess_stage_seconds": prep_stage,
+            "raw_accuracy": accuracy(truth, raw_text) if truth is not None else None,
+            "preprocessed_accuracy": accuracy(truth, prep_text) if truth is not None else None,
+        }
+        rows.append(row)
+
+        raw_acc = f"{row['raw_accuracy']:.1%}" if truth is not None else "-"
+        prep_acc = f"{row['preprocessed_accuracy']:.1%}" if truth is not None else "-"
+        print(f"{row['image'][:40]:40} {raw_time:8.2f} {prep_time:8.2f} {raw_acc:>8} {prep_acc:>8}")
+
+    raw_total = sum(r["raw_seconds"] for r in rows)
+    prep_total = sum(r["preprocessed_seconds"] for r in rows)
+    print()
+    print(f"Total OCR time: raw {raw_total:.1f}s, preprocessed {prep_total:.1f}s "
+          f"({raw_total / max(prep_total, 1e-9):.2f}x faster)")
+    print(f"Median per image: raw {statistics.median(r['raw_seconds'] for r in rows):.2f}s, "
+          f"preprocessed {statistics.median(r['preprocessed_seconds'] for r in rows):.2f}s")
+    scored = [r for r in rows if r["raw_accuracy"] is not None]
+    if scored:
+        print(f"Mean accuracy on {len(scored)} labeled images: "
+              f"raw {statistics.mean(r['raw_accuracy'] for r in scored):.1%}, "
+              f"preprocessed {statistics.mean(r['preprocessed_accuracy'] for r in scored):.1%}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({"lang": args.lang, "images": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import multiprocessing
 import flet as ft
 from views.renamer_view import RenamerView
 from views.sorter_view import SorterView
@@ -168,4 +169,6 @@ def main(page: ft.Page):
     )
 
 if __name__ == "__main__":
+    # Needed by the invoice analysis worker processes in the frozen executable
+    multiprocessing.freeze_support()
     ft.app(target=main)
@@ -0,0 +1,228 @@
+"""
+Headless invoice sorting.
+Analyzes every supported document of a folder with the parallel invoice
+engine, moves the invoices into one subfolder per company and writes a JSON
+report. Does not import Flet, so it can run on a server or from cron.
+
+Every sort is journaled in ~/.toolbox/journals; --undo moves the files of
+the last sort back and --resume finishes sorts interrupted by a crash.
+
+Usage:
+    python sort_invoices.py [--source DIR] [--dest DIR] [--workers N]
+                            [--dry-run] [--report report.json]
+    python sort_invoices.py --undo | --resume
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+from utils.duplicate_finder import KnownFileIndex
+from utils.invoice_detector import InvoiceDetector
+from utils.invoice_engine import InvoiceAnalysisEngine, default_worker_count
+from utils.invoice_mover import BatchMover
+from utils.invoice_timing import TimingReport
+from utils.settings_manager import settings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="Folder to scan (default: Downloads)")
+    parser.add_argument("--dest", help="Invoices folder (default: <source>/factures)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Analysis processes (default: invoice_workers setting, or one per CPU core)")
+    parser.add_argument("--dry-run", action="store_true", help="Analyze and report, but do not move anything")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    parser.add_argument("--recursive", action=argparse.BooleanOptionalAction, default=None,
+                        help="Also scan subfolders (default: invoice_scan_recursive setting)")
+    parser.add_argument("--max-depth", type=int, help="Subfolder depth limit (default: invoice_scan_max_depth setting)")
+    parser.add_argument("--min-score", type=int, help="Minimum score to be considered an invoice")
+    parser.add_argument("--timeout", type=float,
+                        help="Seconds allowed per file before its worker is killed, 0 for none "
+                             "(default: invoice_file_timeout setting)")
+    parser.add_argument("--max-memory", type=int,
+                        help="Memory limit of a worker in MB, 0 for none (default: invoice_max_memory_mb setting)")
+    parser.add_argument("--trash-duplicates", action=argparse.BooleanOptionalAction, default=None,
+                        help="Send copies of already filed invoices to the trash (default: invoice_trash_duplicates setting)")
+    parser.add_argument("--cache-file", help="Extraction cache database (default: ~/.toolbox/invoice_cache.sqlite3)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the extraction cache")
+    parser.add_argument("--undo", action="store_true", help="Move the files of the last sort back, then exit")
+    parser.add_argument("--resume", action="store_true", help="Finish sorts interrupted by a crash, then exit")
+    return parser.parse_args(argv)
+
+
+def in_folder(path: str, folder: str) -> bool:
+    """Whether `path` is inside `folder`."""
+    path = os.path.normcase(os.path.abspath(path))
+    return path.startswith(os.path.normcase(os.path.abspath(folder)) + os.sep)
+
+
+def sort_invoices(args) -> dict:
+    """Runs the analysis and the moves, and returns the report."""
+    detector = InvoiceDetector(use_cache=not args.no_cache, cache_file=args.cache_file)
+    if args.min_score is not None:
+        detector.min_score = args.min_score
+    source = os.path.abspath(args.source or detector.get_downloads_folder())
+    dest = os.path.abspath(args.dest or os.path.join(source, 'factures'))
+    engine = InvoiceAnalysisEngine(detector, args.workers or default_worker_count(),
+                                   timeout=args.timeout, max_memory_mb=args.max_memory)
+
+    started_at = datetime.now()
+    start = time.perf_counter()
+    trash_duplicates = args.trash_duplicates
+    if trash_duplicates is None:
+        trash_duplicates = settings.get("invoice_trash_duplicates", False)
+    # The saved index and the catalog belong to the configured invoices
+    # folder: dry runs and other destinations index dest in memory instead of
+    # overwriting it, and leave the catalog alone
+    configured = os.path.abspath(detector.get_invoices_folder())
+    shared = not args.dry_run and os.path.normcase(dest) == os.path.normcase(configured)
+    if not shared:
+        detector.invoice_index = KnownFileIndex(None)
+    # Copies of invoices already filed under dest are not analyzed again
+    detector.refresh_invoice_index(dest)
+
+    files = detector.iter_downloads_folder(source, args.recursive, args.max_depth, skip_folder=dest)
+    entries = []
+    results = {}
+    timings = TimingReport()
+    for result in engine.analyze(files):
+        results[result.file_path] = result
+        timings.add(result.file_path, result.timings)
+        entry = {
+            "path": result.file_path,
+            "is_invoice": result.is_invoice,
+            "confidence": round(result.confidence_score, 3),
+            "company": result.company_name,
+            "keywords": result.detected_keywords,
+            "destination": None,
+            "duplicate_of": result.duplicate_of,
+            "trashed": False,
+            "error": result.error,
+            "timings": {name: round(seconds, 4) for name, seconds in result.timings.items()},
+        }
+        entries.append(entry)
+        if result.duplicate_of:
+            if trash_duplicates and not args.dry_run:
+                entry["trashed"], message = detector.trash_duplicate(result)
+                if not entry["trashed"]:
+                    entry["error"] = message
+            print(f"{result.file_name}: already filed as {result.duplicate_of}")
+        elif not result.is_invoice:
+            print(f"{result.file_name}: {result.error or 'not an invoice'}")
+
+    # Destinations are planned for the whole batch, then moved in one journaled run
+    mover = BatchMover(dest)
+    invoices = [e for e in entries if e["is_invoice"]]
+    # Copies within the batch are filed once
+    copies = detector.find_batch_copies([e["path"] for e in invoices])
+    moves = mover.plan(
+        (e["path"], detector.company_folder(e["company"], dest)) for e in invoices if e["path"] not in copies
+    )
+    by_source = {e["path"]: e for e in invoices}
+    if args.dry_run:
+        for move in moves:
+            by_source[move.source]["destination"] = move.dest
+    else:
+        filed = []
+        for outcome in mover.run(moves):
+            entry = by_source[outcome.source]
+            if outcome.success:
+                entry["destination"] = outcome.dest
+                filed.append((outcome.source, outcome.dest))
+            else:
+                entry["error"] = outcome.error
+        if shared:
+            detector.record_filed(filed, results)
+    for entry in invoices:
+        first = copies.get(entry["path"])
+        if first:
+            filed_as = by_source[first]["destination"]
+            entry["duplicate_of"] = filed_as or first
+            if trash_duplicates and filed_as and not args.dry_run:
+                entry["trashed"], message = detector.trash_duplicate(results[entry["path"]])
+                if not entry["trashed"]:
+                    entry["error"] = message
+            print(f"{os.path.basename(entry['path'])}: copy of {entry['duplicate_of']}")
+            continue
+        status = f"-> {entry['destination']}" if entry["destination"] else entry["error"]
+        print(f"{os.path.basename(entry['path'])}: {status}")
+
+    return {
+        "source": source,
+        "destination": dest,
+        "dry_run": args.dry_run,
+        "journal": str(mover.journal_path) if mover.journal_path else None,
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "duration_seconds": round(time.perf_counter() - start, 3),
+        "summary": {
+            "files": len(entries),
+            "invoices": len(invoices),
+            "moved": 0 if args.dry_run else sum(1 for e in invoices if e["destination"]),
+            "move_errors": sum(1 for e in invoices if not e["destination"] and not e["duplicate_of"]),
+            "duplicates": sum(1 for e in entries if e["duplicate_of"]),
+            "companies": sorted({e["company"] or "Inconnu" for e in invoices}),
+        },
+        "timings": {
+            "stages": timings.stage_summary(),
+            "slowest_files": [
+                {k: v for k, v in row.items() if k != "stages"} for row in timings.slowest()
+            ],
+        },
+        "files": entries,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.source and not os.path.isdir(args.source):
+        print(f"Source folder not found: {args.source}", file=sys.stderr)
+        return 2
+
+    if args.undo or args.resume:
+        mover = BatchMover(args.dest or "")
+        journals = mover.incomplete_journals() if args.resume else [mover.last_journal()]
+        errors = 0
+        changed = []
+        for journal in filter(None, journals):
+            outcomes = mover.resume(journal) if args.resume else mover.undo(journal)
+            for outcome in outcomes:
+                errors += not outcome.success
+                if outcome.success:
+                    changed.append((outcome.source, outcome.dest))
+                print(f"{outcome.source} -> {outcome.dest}" if outcome.success else f"{outcome.source}: {outcome.error}")
+        # Only moves into or out of the configured invoices folder touch
+        # its saved index and catalog
+        detector = InvoiceDetector(use_cache=False)
+        configured = detector.get_invoices_folder()
+        if args.resume:
+            filed = [(source, dest) for source, dest in changed if in_folder(dest, configured)]
+            if filed:
+                detector.record_filed(filed)
+        else:
+            unfiled = [source for source, _ in changed if in_folder(source, configured)]
+            if unfiled:
+                detector.forget_filed(unfiled)
+        return 1 if errors else 0
+
+    report = sort_invoices(args)
+    summary = report["summary"]
+    moved = f"{summary['invoices']} would be moved" if args.dry_run else f"{summary['moved']} moved"
+    print(f"{summary['files']} files analyzed, {summary['invoices']} invoices, {moved}, "
+          f"{summary['move_errors']} errors in {report['duration_seconds']:.1f}s")
+    for name, stage in report["timings"]["stages"].items():
+        print(f"  {name:<12} {stage['total']:8.2f}s  p50 {stage['p50'] * 1000:7.1f} ms  "
+              f"p90 {stage['p90'] * 1000:7.1f} ms  p99 {stage['p99'] * 1000:7.1f} ms")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 1 if summary["move_errors"] else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
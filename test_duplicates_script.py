@@ -1,13 +1,18 @@
 import sys
 import os
 import shutil
+import time
 from unittest.mock import MagicMock
 
 # Mock send2trash before importing duplicate_finder
 sys.modules['send2trash'] = MagicMock()
 
 import unittest
-from utils.duplicate_finder import DuplicateFinder
+from utils.duplicate_finder import (
+    DuplicateFinder, DuplicateFile, DuplicateGroup, DuplicateResults,
+    keep_newest, keep_shortest_path, keep_under,
+)
+from utils.progress_reporter import ProgressReporter
 
 class TestDuplicateFinder(unittest.TestCase):
     def setUp(self):
@@ -51,5 +56,155 @@ class TestDuplicateFinder(unittest.TestCase):
         self.assertTrue(paths[0].endswith("file1.txt"))
         self.assertTrue(paths[1].endswith("file2.txt"))
 
+    def test_saved_results_revalidation(self):
+        finder = DuplicateFinder(results_file=os.path.join(self.test_dir, "results.json"))
+        gen = finder.scan_directory([self.test_dir])
+        try:
+            while True:
+                next(gen)
+        except StopIteration as e:
+            groups = e.value
+        finder.save_results([self.test_dir], groups)
+
+        paths, restored, complete = finder.load_results()
+        self.assertEqual(paths, [self.test_dir])
+        self.assertTrue(complete)
+        self.assertEqual(restored[0].hash_value, groups[0].hash_value)
+
+        # Same content with a new mtime stays, changed content goes
+        file1 = os.path.join(self.test_dir, "file1.txt")
+        file2 = os.path.join(self.test_dir, "file2.txt")
+        os.utime(file1, (1, 1))
+        with open(file2, "w") as f:
+            f.write("content Z")
+        gen = finder.revalidate(restored)
+        try:
+            while True:
+                next(gen)
+        except StopIteration as e:
+            stale = e.value
+        self.assertEqual(stale, {file2})
+        modified = {f.path: f.modified for f in restored[0].files}
+        self.assertEqual(modified[file1], 1)
+
+    def test_cancelled_scan_saved_as_incomplete(self):
+        finder = DuplicateFinder(results_file=os.path.join(self.test_dir, "results.json"))
+        gen = finder.scan_directory([self.test_dir])
+        next(gen)
+        finder.stop()
+        try:
+            while True:
+                next(gen)
+        except StopIteration as e:
+            groups = e.value
+        self.assertTrue(finder.stop_requested)
+        finder.save_results([self.test_dir], groups, complete=not finder.stop_requested)
+        self.assertFalse(finder.load_results()[2])
+
+    def test_library_index(self):
+        library = os.path.join(self.test_dir, "library")
+        os.makedirs(library)
+        with open(os.path.join(library, "copy.txt"), "w") as f:
+            f.write("content B")
+        index_file = os.path.join(self.test_dir, "index.json")
+        finder = DuplicateFinder(library_index_file=index_file)
+        gen = finder.index_library([library])
+        try:
+            while True:
+                next(gen)
+        except StopIteration as e:
+            self.assertEqual(e.value, 1)
+
+        # Reload from disk
+        finder = DuplicateFinder(library_index_file=index_file)
+        self.assertEqual(finder.find_copies(os.path.join(self.test_dir, "file3.txt")),
+                         [os.path.join(library, "copy.txt")])
+        self.assertFalse(finder.is_known(os.path.join(self.test_dir, "file4.txt")))
+        self.assertFalse(finder.is_known(os.path.join(self.test_dir, "file1.txt")))
+        self.assertFalse(finder.is_known(os.path.join(library, "copy.txt")))
+
+class TestDuplicateResults(unittest.TestCase):
+    def setUp(self):
+        self.results = DuplicateResults([
+            DuplicateGroup("h1", [
+                DuplicateFile(os.path.join("archive", "a.txt"), 10, 1.0),
+                DuplicateFile(os.path.join("downloads", "new", "a.txt"), 10, 3.0),
+            ]),
+            DuplicateGroup("h2", [
+                DuplicateFile(os.path.join("downloads", "b.txt"), 20, 2.0),
+                DuplicateFile(os.path.join("downloads", "b (1).txt"), 20, 1.0),
+                DuplicateFile(os.path.join("tmp", "b.txt"), 20, 5.0),
+            ]),
+        ])
+
+    def test_keep_newest(self):
+        self.assertEqual(self.results.apply_rule(keep_newest), 3)
+        self.assertEqual(self.results.selected, [[True, False], [True, True, False]])
+
+    def test_keep_shortest_path(self):
+        self.results.apply_rule(keep_shortest_path)
+        self.assertEqual(self.results.selected[1], [True, True, False])
+
+    def test_keep_under_skips_groups_without_match(self):
+        self.assertEqual(self.results.apply_rule(keep_under("archive")), 1)
+        self.assertEqual(self.results.selected, [[False, True], [False, False, False]])
+
+    def test_remove_paths_drops_resolved_groups(self):
+        self.results.select_all(True)
+        self.results.set_selected(1, 0, False)
+        self.assertEqual(self.results.selected_count, 4)
+        self.results.remove_paths({os.path.join("archive", "a.txt"), os.path.join("tmp", "b.txt")})
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(self.results.selected, [[False, True]])
+        self.assertEqual(self.results.selected_count, 1)
+
+    def test_ordered_sorts_and_filters_groups(self):
+        self.assertEqual(self.results.ordered("size"), [1, 0])
+        self.assertEqual(self.results.ordered("count"), [1, 0])
+        self.assertEqual(self.results.ordered("folder"), [0, 1])
+        self.assertEqual(self.results.ordered("size", folder_filter="new"), [0])
+
+    def test_delete_files_in_batches(self):
+        finder = DuplicateFinder()
+        gen = finder.delete_files(["a", "b", "c"], batch_size=2)
+        statuses = []
+        try:
+            while True:
+                statuses.append(next(gen))
+        except StopIteration as e:
+            deleted = e.value
+        self.assertEqual(len(statuses), 2)
+        self.assertEqual(deleted, ["a", "b", "c"])
+
+class TestProgressReporter(unittest.TestCase):
+    def test_rapid_reports_collapse_into_one_flush(self):
+        flushed = []
+        reporter = ProgressReporter(flushed.append, rate_hz=5).start()
+        for i in range(100):
+            reporter.report(i)
+        time.sleep(0.35)
+        self.assertEqual(flushed, [99])
+
+        reporter.report(100)
+        reporter.report(101)
+        reporter.stop()
+        # stop() pushes the final state without waiting for the timer
+        self.assertEqual(flushed, [99, 101])
+
+    def test_context_manager_flushes_final_state(self):
+        flushed = []
+        with ProgressReporter(flushed.append, rate_hz=1) as reporter:
+            for i in range(10):
+                reporter.report(i)
+        self.assertEqual(flushed, [9])
+
+        flushed.clear()
+        with self.assertRaises(RuntimeError):
+            with ProgressReporter(flushed.append, rate_hz=1) as reporter:
+                reporter.report("half done")
+                raise RuntimeError("stop")
+        self.assertEqual(flushed, [])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,1099 @@
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Mock send2trash before importing invoice_detector
+sys.modules.setdefault('send2trash', MagicMock())
+
+from utils.invoice_cache import ExtractionCache, CachedExtraction
+from utils.invoice_detector import InvoiceDetector, InvoiceResult
+from utils.invoice_engine import InvoiceAnalysisEngine
+from utils.duplicate_finder import KnownFileIndex
+from utils.keyword_matcher import KeywordMatcher
+from utils.invoice_watcher import DownloadsWatcher
+from utils.invoice_mover import BatchMover
+from utils.invoice_catalog import InvoiceCatalog, extract_amounts, extract_dates
+from utils.invoice_timing import TimingReport, collect, percentile
+from utils.lazy_import import LazyModule, has_module, lazy_module
+from utils.worker_pool import MB, SupervisedPool, default_start_method, process_rss
+from utils.docx_text import extract_docx_text
+from utils import image_preprocess
+
+if image_preprocess.HAS_NUMPY:
+    from PIL import Image, ImageDraw
+    from utils.ocr_batch import TesseractBatch
+
+INVOICE_TEXT = """FACTURE N° 2024001
+Date de facture: 12/03/2024
+Total HT: 100,00 €
+TVA 20%: 20,00 €
+Total TTC: 120,00 €
+SIRET: 123 456 789 00012
+OVH SAS"""
+
+class TestExtractionCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = "test_invoice_temp"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.pdf_path = os.path.join(self.test_dir, "facture.pdf")
+        with open(self.pdf_path, "wb") as f:
+            f.write(b"%PDF-1.4 fake")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_unchanged_file_is_served_from_cache(self):
+        detector = InvoiceDetector(use_cache=False)
+        detector.cache = ExtractionCache(os.path.join(self.test_dir, "cache.sqlite3"))
+        with patch.object(detector, "extract_text", return_value=(INVOICE_TEXT, None)) as extract:
+            first = detector.analyze_file(self.pdf_path)
+            second = detector.analyze_file(self.pdf_path)
+        self.assertEqual(extract.call_count, 1)
+        self.assertTrue(first.is_invoice)
+        self.assertEqual(second.confidence_score, first.confidence_score)
+        self.assertEqual(second.detected_keywords, first.detected_keywords)
+        self.assertEqual(second.company_name, first.company_name)
+
+    def test_failed_extraction_is_not_cached(self):
+        detector = InvoiceDetector(use_cache=False)
+        detector.cache = ExtractionCache(os.path.join(self.test_dir, "cache.sqlite3"))
+
+        # The fake PDF cannot be parsed: the swallowed error leaves no text
+        self.assertIsNotNone(detector.analyze_file(self.pdf_path).error)
+
+        def partial_pdf(file_path):
+            detector._extraction_failed("OCR on PDF error: tesseract is not installed")
+            return INVOICE_TEXT
+
+        with patch.object(detector, "extract_text_from_pdf", side_effect=partial_pdf):
+            detector.analyze_file(self.pdf_path)
+        with patch.object(detector, "extract_text", return_value=(INVOICE_TEXT, None)) as extract:
+            detector.analyze_file(self.pdf_path)
+            detector.analyze_file(self.pdf_path)
+        # Retried once after the failures, then cached
+        self.assertEqual(extract.call_count, 1)
+
+    def test_pdf_cache_depends_on_min_score(self):
+        detector = InvoiceDetector(use_cache=False)
+        detector.cache = ExtractionCache(os.path.join(self.test_dir, "cache.sqlite3"))
+        with patch.object(detector, "extract_text", return_value=(INVOICE_TEXT, None)) as extract:
+            detector.analyze_file(self.pdf_path)
+            # Pages read by the staged extraction depend on the threshold
+            detector.min_score += 10
+            detector.analyze_file(self.pdf_path)
+            detector.analyze_file(self.pdf_path)
+        self.assertEqual(extract.call_count, 2)
+
+    def test_lru_eviction(self):
+        cache = ExtractionCache(os.path.join(self.test_dir, "cache.sqlite3"), max_bytes=1200)
+        cache.put("a", CachedExtraction("x" * 400, 0, 0.0, []))
+        cache.put("b", CachedExtraction("y" * 400, 0, 0.0, []))
+        cache.get("a")
+        cache.put("c", CachedExtraction("z" * 400, 0, 0.0, []))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+class TestKeywordMatching(unittest.TestCase):
+    def setUp(self):
+        self.detector = InvoiceDetector(use_cache=False)
+
+    def test_matcher_finds_overlapping_terms_on_word_boundaries(self):
+        matcher = KeywordMatcher(["facture", "facture n°", "date de facture", "invoice #", "rcs"])
+        self.assertEqual(
+            matcher.find("date de facture n° 12 - invoice #42 - forces"),
+            {"facture", "facture n°", "date de facture", "invoice #"},
+        )
+
+    def test_invoice_score(self):
+        raw_score, confidence, keywords = self.detector.calculate_invoice_score(INVOICE_TEXT)
+        for keyword in ["facture", "facture n°", "date de facture", "total ttc", "tva", "siret", "montant_€", "date"]:
+            self.assertIn(keyword, keywords)
+        self.assertNotIn("rcs", keywords)
+        self.assertGreaterEqual(raw_score, self.detector.min_score)
+        self.assertEqual(confidence, 1.0)
+
+    def test_company_priority(self):
+        with patch("utils.invoice_detector.settings.get_invoice_companies", return_value=["Mon Fournisseur"]):
+            self.assertEqual(self.detector.extract_company_name("Facture Amazon - mon fournisseur"), "Mon Fournisseur")
+            self.assertEqual(self.detector.extract_company_name("Facture Amazon"), "Amazon")
+            self.assertIsNone(self.detector.extract_company_name("Facture freedom"))
+
+    def test_company_matcher_rebuilt_on_settings_change(self):
+        from utils.settings_manager import settings
+        with patch("utils.invoice_detector.settings.get_invoice_companies", return_value=["Acme"]) as companies:
+            self.assertEqual(self.detector.extract_company_name("Facture acme"), "Acme")
+            self.assertEqual(self.detector.extract_company_name("Facture acme corp"), "Acme")
+            self.assertEqual(companies.call_count, 1)
+
+            companies.return_value = ["Globex"]
+            settings._notify("invoice_companies", ["Globex"])
+            self.assertEqual(self.detector.extract_company_name("Facture globex"), "Globex")
+            self.assertEqual(companies.call_count, 2)
+
+    def test_normalize_company_name(self):
+        self.assertEqual(self.detector.normalize_company_name("OVH SAS"), "Ovh")
+        self.assertEqual(self.detector.normalize_company_name("Foo S.A.R.L."), "Foo")
+        self.assertEqual(self.detector.normalize_company_name("Bar sas sarl"), "Bar")
+        self.assertEqual(self.detector.normalize_company_name("Nasa"), "Nasa")
+        self.assertEqual(self.detector.normalize_company_name('a<b>:c/d'), "Abcd")
+        self.assertEqual(self.detector.normalize_company_name(None), "Inconnu")
+
+    def test_legal_suffix_stripping_is_linear(self):
+        start = time.perf_counter()
+        for repeats in (14, 20, 200):
+            name = "Foo" + "  sa" * repeats + "  x"
+            self.assertEqual(InvoiceDetector.LEGAL_SUFFIX_PATTERN.sub("", name), name)
+            self.assertEqual(self.detector.normalize_company_name(name + " SAS"),
+                             ("Foo" + " sa" * repeats + " x").title()[:50])
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_company_folder_reuses_existing_folder(self):
+        root = os.path.abspath("test_company_temp")
+        os.makedirs(root, exist_ok=True)
+        self.addCleanup(shutil.rmtree, root, True)
+        self.assertEqual(self.detector.company_folder("OVH SAS", root), "Ovh")
+        os.mkdir(os.path.join(root, "Ovh Sas"))
+        os.mkdir(os.path.join(root, "acme"))
+        self.assertEqual(self.detector.company_folder("OVH SAS", root), "Ovh Sas")
+        self.assertEqual(self.detector.company_folder("Ovh", root), "Ovh Sas")
+        self.assertEqual(self.detector.company_folder("ACME", root), "acme")
+        self.assertEqual(self.detector.company_folder("Globex", root), "Globex")
+
+class TestStagedExtraction(unittest.TestCase):
+    def setUp(self):
+        self.detector = InvoiceDetector(use_cache=False)
+        self.pages_read = 0
+
+    def pages(self, texts):
+        for text in texts:
+            self.pages_read += 1
+            yield text
+
+    def test_clear_invoice_stops_after_first_page(self):
+        self.detector._read_pages_staged(self.pages([INVOICE_TEXT, "annexe", "conditions"]))
+        self.assertEqual(self.pages_read, 1)
+
+    def test_clear_non_invoice_stops_early(self):
+        prose = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 10
+        self.detector._read_pages_staged(self.pages([prose] * 5))
+        self.assertEqual(self.pages_read, 1)
+
+    def test_inconclusive_document_reads_more_pages(self):
+        text, conclusive = self.detector._read_pages_staged(self.pages(["Montant", "", "Facture"]))
+        self.assertEqual(self.pages_read, 3)
+        self.assertFalse(conclusive)
+        self.assertIn("Facture", text)
+
+class TestAnalysisTimings(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_timings")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.detector = InvoiceDetector(use_cache=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_percentiles(self):
+        values = sorted(float(i) for i in range(1, 101))
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 90), 90.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_stages_recorded_while_collecting(self):
+        with collect() as timings:
+            self.detector.calculate_invoice_score(INVOICE_TEXT)
+        self.assertIn("scoring", timings)
+        self.assertGreaterEqual(timings["total"], timings["scoring"])
+        # Outside collect() nothing is recorded
+        self.detector.calculate_invoice_score(INVOICE_TEXT)
+
+    def test_docx_analysis_timings_and_report(self):
+        import docx
+        path = os.path.join(self.test_dir, "facture.docx")
+        document = docx.Document()
+        for line in INVOICE_TEXT.splitlines():
+            document.add_paragraph(line)
+        document.save(path)
+
+        result = self.detector.analyze_file(path)
+        for name in ("cache", "docx_text", "scoring", "total"):
+            self.assertIn(name, result.timings)
+
+        report = TimingReport()
+        report.add(path, result.timings)
+        report.add("scan.pdf", {"open": 0.1, "pdf_text:p1": 0.2, "pdf_text:p2": 0.3, "total": 0.6})
+        summary = report.stage_summary()
+        self.assertAlmostEqual(summary["pdf_text"]["total"], 0.5)
+        self.assertEqual(summary["total"]["files"], 2)
+        self.assertEqual(report.slowest(1)[0]["slowest_stage"], "pdf_text")
+        saved = report.save(os.path.join(self.test_dir, "timings.json"))
+        with open(saved, encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["files"], 2)
+
+
+class TestBenchmarkCorpus(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_bench_corpus")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_generated_corpus_is_labeled_and_detected(self):
+        import bench_invoices
+        labels = bench_invoices.build_corpus(self.test_dir, 4, 7, ["text_pdf", "docx"])
+        self.assertEqual(len(labels), 8)
+        self.assertEqual(bench_invoices.load_labels(self.test_dir), labels)
+        self.assertEqual(bench_invoices.file_type_of("text_pdf_003_other.pdf"), "text_pdf")
+
+        rows, _ = bench_invoices.run_benchmark(self.test_dir, labels, workers=1)
+        self.assertTrue(all(row["error"] is None for row in rows))
+        overall = bench_invoices.classification(rows)
+        self.assertEqual((overall["precision"], overall["recall"]), (1.0, 1.0))
+
+    def test_regressions_against_baseline(self):
+        import bench_invoices
+        baseline = {"overall": {"precision": 1.0, "recall": 0.9}, "files_per_second": 100.0}
+        report = {"overall": {"precision": 1.0, "recall": 0.8}, "files_per_second": 80.0}
+        self.assertEqual(len(bench_invoices.compare(report, baseline, tolerance=0.15)), 2)
+        self.assertEqual(bench_invoices.compare(baseline, baseline, tolerance=0.15), [])
+
+
+class TestSortInvoicesCli(unittest.TestCase):
+    def setUp(self):
+        import bench_invoices
+        self.root = os.path.abspath("test_cli_temp")
+        self.inbox = os.path.join(self.root, "inbox")
+        self.dest = os.path.join(self.root, "factures")
+        self.labels = bench_invoices.build_corpus(self.inbox, 2, 3, ["docx"])
+        self.index_file = Path(self.root) / "invoices_index.json"
+        self.cache_file = os.path.join(self.root, "cache.sqlite3")
+        journal_dir = os.path.join(self.root, "journals")
+        for patcher in [
+            patch("utils.invoice_detector.DEFAULT_INVOICES_INDEX_FILE", self.index_file),
+            patch("sort_invoices.BatchMover", lambda dest: BatchMover(dest, journal_dir=journal_dir)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.catalog_writes = []
+        for method in ("add", "move", "remove"):
+            patcher = patch.object(InvoiceCatalog, method, lambda *args, m=method: self.catalog_writes.append(m))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def run_cli(self, *args):
+        import sort_invoices
+        report = os.path.join(self.root, "report.json")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            code = sort_invoices.main(["--source", self.inbox, "--dest", self.dest, "--workers", "1",
+                                       "--cache-file", self.cache_file, "--report", report, *args])
+        self.assertNotIn("[DEBUG]", out.getvalue())
+        with open(report, encoding="utf-8") as f:
+            return code, json.load(f)
+
+    def test_dry_run_then_sort(self):
+        invoice = next(name for name, is_invoice in self.labels.items() if is_invoice)
+
+        code, report = self.run_cli("--dry-run")
+        self.assertEqual(code, 0)
+        self.assertEqual((report["summary"]["files"], report["summary"]["invoices"]), (2, 1))
+        self.assertEqual(report["summary"]["moved"], 0)
+        # The worker processes wrote into the cache given on the command line
+        import sqlite3
+        with contextlib.closing(sqlite3.connect(self.cache_file)) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0], 2)
+        planned = next(e["destination"] for e in report["files"] if e["is_invoice"])
+        self.assertEqual(os.path.basename(planned), invoice)
+        self.assertTrue(os.path.exists(os.path.join(self.inbox, invoice)))
+
+        code, report = self.run_cli()
+        self.assertEqual(code, 0)
+        self.assertEqual(report["summary"]["moved"], 1)
+        self.assertTrue(os.path.exists(planned))
+        # dest is not the configured invoices folder: its index and the
+        # catalog are left alone, also when undoing
+        import sort_invoices
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(sort_invoices.main(["--undo"]), 0)
+        self.assertTrue(os.path.exists(os.path.join(self.inbox, invoice)))
+        self.assertFalse(os.path.exists(self.index_file))
+        self.assertEqual(self.catalog_writes, [])
+
+    def test_copies_within_batch_are_filed_once(self):
+        invoice = next(name for name, is_invoice in self.labels.items() if is_invoice)
+        os.makedirs(os.path.join(self.inbox, "sub"))
+        copy = os.path.join(self.inbox, "sub", invoice)
+        shutil.copyfile(os.path.join(self.inbox, invoice), copy)
+
+        code, report = self.run_cli("--recursive")
+        self.assertEqual(code, 0)
+        self.assertEqual((report["summary"]["invoices"], report["summary"]["moved"]), (2, 1))
+        filed = next(e["destination"] for e in report["files"] if e["destination"])
+        copy_entry = next(e for e in report["files"] if e["path"] == copy)
+        self.assertEqual(copy_entry["duplicate_of"], filed)
+        self.assertTrue(os.path.exists(copy))
+        self.assertEqual(os.listdir(os.path.dirname(filed)), [invoice])
+
+    def test_missing_source(self):
+        import sort_invoices
+        with patch("sys.stderr"):
+            self.assertEqual(sort_invoices.main(["--source", os.path.join(self.root, "missing")]), 2)
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_has_module_does_not_import(self):
+        self.assertTrue(has_module("json"))
+        self.assertFalse(has_module("no_such_module_for_toolbox"))
+        self.assertFalse(has_module("no_such_module_for_toolbox.sub"))
+        # Test doubles registered in sys.modules count as available
+        self.assertTrue(has_module("send2trash"))
+
+    def test_lazy_module_imports_on_first_use(self):
+        module = LazyModule("colorsys")
+        self.assertIsNone(module.__dict__["_module"])
+        self.assertEqual(module.rgb_to_hsv(1, 0, 0)[0], 0.0)
+        self.assertIsNotNone(module.__dict__["_module"])
+        self.assertIs(lazy_module("json"), json)
+
+    def test_detector_import_defers_document_libraries(self):
+        code = (
+            "import sys; from unittest.mock import MagicMock; sys.modules['send2trash'] = MagicMock(); "
+            "import utils.invoice_detector; "
+            "print(','.join(m for m in ('pdfplumber', 'PyPDF2', 'docx', 'pytesseract', 'numpy') if m in sys.modules))"
+        )
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "")
+
+
+# Jobs for the supervised workers (module level, to be picklable)
+def _sleep_job(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _crash_job():
+    os._exit(3)
+
+
+def _memory_hog_job(megabytes):
+    data = b"x" * (megabytes * MB)
+    time.sleep(30)
+    return len(data)
+
+
+def _child_memory_hog_job(megabytes, pid_file):
+    # The memory is held by a program the job starts, as with tesseract
+    child = subprocess.Popen([sys.executable, "-c",
+                              f"import time; data = b'x' * ({megabytes} * {MB}); time.sleep(30)"])
+    with open(pid_file, "w") as f:
+        f.write(str(child.pid))
+    return child.wait()
+
+
+def _fake_analyze(file_paths):
+    if any("hang" in os.path.basename(path) for path in file_paths):
+        time.sleep(30)
+    return [InvoiceResult(path, os.path.basename(path), True, 1.0, "OVH", "", []) for path in file_paths]
+
+
+def _slow_first_analyze(file_paths):
+    if any("slow" in os.path.basename(path) for path in file_paths):
+        time.sleep(1.0)
+    return _fake_analyze(file_paths)
+
+
+def _paced_analyze(file_paths):
+    time.sleep(0.2)
+    return _fake_analyze(file_paths)
+
+
+def _failing_analyze(file_paths):
+    if any("bad" in os.path.basename(path) for path in file_paths):
+        raise ValueError("boom")
+    return _fake_analyze(file_paths)
+
+
+class TestAnalysisEngine(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_engine")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, self.test_dir, ignore_errors=True)
+        self.engine = InvoiceAnalysisEngine(InvoiceDetector(use_cache=False), workers=2,
+                                            timeout=0, max_memory_mb=0)
+
+    def make_files(self, names):
+        paths = []
+        for name in names:
+            paths.append(os.path.join(self.test_dir, name))
+            with open(paths[-1], "w") as f:
+                f.write(name)
+        return paths
+
+    def test_every_file_reported_once_in_completion_order(self):
+        paths = self.make_files(["slow.pdf"] + [f"doc{i}.pdf" for i in range(6)])
+        with patch("utils.invoice_engine._analyze_in_worker", _slow_first_analyze):
+            names = [r.file_name for r in self.engine.analyze(iter(paths))]
+        self.assertCountEqual(names, [os.path.basename(p) for p in paths])
+        # The slow file does not hold back the others
+        self.assertEqual(names[-1], "slow.pdf")
+
+    def test_cancel_mid_scan(self):
+        paths = self.make_files([f"doc{i}.pdf" for i in range(30)])
+        received = []
+        with patch("utils.invoice_engine._analyze_in_worker", _paced_analyze):
+            for result in self.engine.analyze(paths):
+                received.append(result)
+                if len(received) == 2:
+                    self.engine.cancel()
+        self.assertTrue(self.engine.cancelled)
+        self.assertLess(len(received), len(paths))
+        # Analysis never moves anything, and the workers are gone
+        self.assertTrue(all(os.path.exists(p) for p in paths))
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_worker_exception_becomes_error_result(self):
+        paths = self.make_files(["good.pdf", "bad.pdf"])
+        with patch("utils.invoice_engine._analyze_in_worker", _failing_analyze):
+            results = {r.file_name: r for r in self.engine.analyze(paths)}
+        self.assertIsNone(results["good.pdf"].error)
+        self.assertTrue(results["good.pdf"].is_invoice)
+        self.assertEqual(results["bad.pdf"].error, "boom")
+        self.assertFalse(results["bad.pdf"].is_invoice)
+
+    def test_duplicate_check_deferred_until_index_ready(self):
+        paths = self.make_files(["good.pdf", "other.pdf"])
+        index_ready = threading.Event()
+        with patch("utils.invoice_engine._analyze_in_worker", _failing_analyze), \
+                patch.object(self.engine.detector, "check_filed") as check_filed:
+            results = list(self.engine.analyze(paths, index_ready))
+        # Nothing waits on the index: every file is analyzed, none is checked
+        check_filed.assert_not_called()
+        self.assertEqual(len(results), 2)
+        self.assertCountEqual(self.engine.unchecked_files, paths)
+
+
+class TestSupervisedPool(unittest.TestCase):
+    def run_jobs(self, pool, count, limit=20):
+        results = {}
+        deadline = time.monotonic() + limit
+        while len(results) < count and time.monotonic() < deadline:
+            for job in pool.poll(0.2):
+                results[job.job_id] = job
+        return results
+
+    def test_workers_are_not_forked(self):
+        self.assertIn(default_start_method(), ("forkserver", "spawn"))
+        pool = SupervisedPool(1)
+        try:
+            self.assertEqual(pool._ctx.get_start_method(), default_start_method())
+            job = pool.submit(_sleep_job, 0)
+            self.assertEqual(self.run_jobs(pool, 1)[job].value, 0)
+        finally:
+            pool.shutdown()
+
+    def test_hung_job_is_killed_and_worker_replaced(self):
+        pool = SupervisedPool(1)
+        try:
+            slow = pool.submit(_sleep_job, 30, timeout=0.5)
+            quick = pool.submit(_sleep_job, 0, timeout=5)
+            results = self.run_jobs(pool, 2)
+        finally:
+            pool.shutdown()
+        self.assertTrue(results[slow].killed)
+        self.assertIn("délai", results[slow].error)
+        self.assertEqual(results[quick].value, 0)
+
+    def test_crashed_worker_fails_only_its_job(self):
+        pool = SupervisedPool(1)
+        try:
+            crash = pool.submit(_crash_job)
+            after = pool.submit(_sleep_job, 0)
+            results = self.run_jobs(pool, 2)
+        finally:
+            pool.shutdown()
+        self.assertTrue(results[crash].killed)
+        self.assertIsNone(results[after].error)
+
+    @unittest.skipIf(process_rss(os.getpid()) is None, "process memory cannot be read")
+    def test_memory_limit(self):
+        pool = SupervisedPool(1, max_rss=process_rss(os.getpid()) + 150 * MB, check_interval=0.1)
+        try:
+            hog = pool.submit(_memory_hog_job, 300)
+            results = self.run_jobs(pool, 1)
+        finally:
+            pool.shutdown()
+        self.assertTrue(results[hog].killed)
+        self.assertIn("mémoire", results[hog].error)
+
+    @unittest.skipIf(process_rss(os.getpid()) is None, "process memory cannot be read")
+    def test_memory_of_started_programs_counts(self):
+        pid_file = os.path.abspath("test_child_hog.pid")
+        self.addCleanup(lambda: os.path.exists(pid_file) and os.remove(pid_file))
+        pool = SupervisedPool(1, max_rss=process_rss(os.getpid()) + 150 * MB, check_interval=0.1)
+        try:
+            hog = pool.submit(_child_memory_hog_job, 300, pid_file)
+            results = self.run_jobs(pool, 1)
+        finally:
+            pool.shutdown()
+        self.assertTrue(results[hog].killed)
+        self.assertIn("mémoire", results[hog].error)
+        # The program went down with its worker
+        with open(pid_file) as f:
+            child = int(f.read())
+        self.assertFalse(process_rss(child))
+
+    def test_engine_retries_killed_batch_one_by_one(self):
+        test_dir = os.path.join(os.path.dirname(__file__), "test_engine_supervision")
+        os.makedirs(test_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, test_dir, ignore_errors=True)
+        paths = []
+        for name in ("a.png", "hang.png", "b.png"):
+            paths.append(os.path.join(test_dir, name))
+            with open(paths[-1], "wb") as f:
+                f.write(name.encode())
+
+        engine = InvoiceAnalysisEngine(InvoiceDetector(use_cache=False), workers=2, timeout=0.5, max_memory_mb=0)
+        with patch("utils.invoice_engine._analyze_in_worker", _fake_analyze):
+            results = {r.file_name: r for r in engine.analyze(paths)}
+        self.assertEqual(set(results), {"a.png", "hang.png", "b.png"})
+        self.assertTrue(results["a.png"].is_invoice and results["b.png"].is_invoice)
+        self.assertFalse(results["hang.png"].is_invoice)
+        self.assertIn("délai", results["hang.png"].error)
+
+
+class TestDocxExtraction(unittest.TestCase):
+    def setUp(self):
+        import docx
+        self.test_dir = os.path.join(os.path.dirname(__file__), "test_docx_text")
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.path = os.path.join(self.test_dir, "facture.docx")
+        document = docx.Document()
+        document.sections[0].header.paragraphs[0].text = "OVH SAS"
+        document.sections[0].footer.paragraphs[0].text = "SIRET 424 761 419 00045"
+        paragraph = document.add_paragraph("FACTURE N° 1")
+        paragraph.add_run().add_tab()
+        paragraph.add_run("Date de facture: 12/03/2024")
+        paragraph.add_run().add_break()
+        paragraph.add_run("Client: M. Dupont")
+        table = document.add_table(rows=2, cols=2)
+        table.cell(0, 0).text, table.cell(0, 1).text = "Hébergement VPS", "100,00 €"
+        table.cell(1, 0).text, table.cell(1, 1).text = "Total TTC", "120,00 €"
+        document.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_headers_tables_and_footers(self):
+        self.assertEqual(
+            extract_docx_text(self.path),
+            "OVH SAS\n\nFACTURE N° 1\tDate de facture: 12/03/2024\nClient: M. Dupont\n"
+            "Hébergement VPS\t100,00 €\nTotal TTC\t120,00 €\n\nSIRET 424 761 419 00045",
+        )
+
+    def test_character_budget(self):
+        self.assertEqual(extract_docx_text(self.path, max_chars=21), "OVH SAS\n\nFACTURE N° 1")
+
+    def test_invalid_file(self):
+        path = os.path.join(self.test_dir, "broken.docx")
+        with open(path, "w") as f:
+            f.write("not a zip")
+        with self.assertRaises(ValueError):
+            extract_docx_text(path)
+
+    def test_detector_falls_back_to_python_docx(self):
+        detector = InvoiceDetector(use_cache=False)
+        self.assertIn("Total TTC\t120,00 €", detector.extract_text_from_docx(self.path))
+        with patch("utils.invoice_detector.extract_docx_text", side_effect=ValueError("broken")):
+            text = detector.extract_text_from_docx(self.path)
+        self.assertIn("FACTURE N° 1", text)
+        self.assertNotIn("OVH SAS", text)
+
+
+class TestDownloadsDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.abspath("test_downloads_temp")
+        for folder in ["", "sub", "sub/deeper", "factures/OVH", ".cache"]:
+            os.makedirs(os.path.join(self.root, folder), exist_ok=True)
+        for name in ["a.pdf", "notes.txt", "sub/b.PNG", "sub/deeper/c.docx", "factures/OVH/d.pdf", ".cache/e.pdf"]:
+            with open(os.path.join(self.root, name), "wb") as f:
+                f.write(b"x")
+        self.detector = InvoiceDetector(use_cache=False)
+        patcher = patch.object(InvoiceDetector, "get_invoices_folder", return_value=os.path.join(self.root, "factures"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def names(self, **kwargs):
+        return sorted(os.path.relpath(p, self.root).replace(os.sep, "/")
+                      for p in self.detector.iter_downloads_folder(self.root, **kwargs))
+
+    def test_recursive_discovery_skips_invoices_and_hidden_folders(self):
+        self.assertEqual(self.names(recursive=True, max_depth=3), ["a.pdf", "sub/b.PNG", "sub/deeper/c.docx"])
+
+    def test_depth_limit(self):
+        self.assertEqual(self.names(recursive=True, max_depth=1), ["a.pdf", "sub/b.PNG"])
+        self.assertEqual(self.names(recursive=False), ["a.pdf"])
+
+class TestDownloadsWatcher(unittest.TestCase):
+    def setUp(self):
+        self.folder = os.path.abspath("test_watch_temp")
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, "old.pdf"), "wb") as f:
+            f.write(b"old")
+        self.seen = []
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.seen) < count and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def check_new_files_reported_once(self, use_inotify):
+        self.watcher = watcher = DownloadsWatcher(self.folder, self.seen.append, {".pdf"},
+                                   settle_seconds=0.3, poll_interval=0.05, use_inotify=use_inotify)
+        watcher.start()
+        try:
+            time.sleep(0.1)
+            # Still downloading: the browser's temporary file is next to it
+            path = os.path.join(self.folder, "new.pdf")
+            with open(path, "wb") as f:
+                f.write(b"facture")
+            with open(path + ".part", "wb") as f:
+                f.write(b"")
+            with open(os.path.join(self.folder, "notes.txt"), "wb") as f:
+                f.write(b"x")
+            time.sleep(0.6)
+            self.assertEqual(self.seen, [])
+
+            os.remove(path + ".part")
+            self.wait_for(1)
+            time.sleep(0.5)
+        finally:
+            watcher.stop()
+        self.assertEqual(self.seen, [path])
+
+    def test_polling(self):
+        self.check_new_files_reported_once(use_inotify=False)
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_inotify(self):
+        self.check_new_files_reported_once(use_inotify=True)
+        # Handled files are not kept around
+        if self.watcher.backend == "inotify":
+            self.assertNotIn(os.path.join(self.folder, "new.pdf"), self.watcher._handled)
+
+    def test_watched_files_are_analyzed_by_the_engine(self):
+        detector = InvoiceDetector(use_cache=False)
+        detector.invoice_index = KnownFileIndex(None)
+        detector.refresh_invoice_index = lambda: None
+        results = []
+        with patch("utils.invoice_engine._analyze_in_worker", _fake_analyze), \
+                patch.object(detector, "analyze_file", side_effect=AssertionError("analyzed in-process")):
+            watcher = detector.watch_downloads(lambda result, dest: results.append((result, dest)),
+                                               folder=self.folder, auto_move=False)
+            watcher.settle_seconds = 0.2
+            try:
+                time.sleep(0.2)
+                with open(os.path.join(self.folder, "new.pdf"), "wb") as f:
+                    f.write(b"facture")
+                deadline = time.monotonic() + 20
+                while not results and time.monotonic() < deadline:
+                    time.sleep(0.05)
+            finally:
+                watcher.stop()
+        self.assertEqual([(r.file_name, r.company_name, dest) for r, dest in results], [("new.pdf", "OVH", None)])
+
+    def test_watch_downloads_prepares_in_watcher_thread(self):
+        detector = InvoiceDetector(use_cache=False)
+        detector.catalog = MagicMock()
+        detector.invoice_index = MagicMock()
+        threads = []
+        detector.refresh_invoice_index = lambda: threads.append(threading.current_thread())
+        watcher = detector.watch_downloads(folder=self.folder)
+        try:
+            deadline = time.monotonic() + 5
+            while not threads and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            watcher.stop()
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+        # A watched invoice is cataloged once, with its text
+        result = InvoiceResult(os.path.join(self.folder, "old.pdf"), "old.pdf", True, 0.9,
+                               "Ovh", "", [], full_text=INVOICE_TEXT)
+        success, dest = detector.move_invoice(result.file_path, "Ovh", os.path.join(self.folder, "factures"),
+                                              result=result)
+        self.assertTrue(success)
+        detector.catalog.add.assert_called_once_with(dest, "Ovh", 0.9, INVOICE_TEXT)
+        detector.catalog.move.assert_not_called()
+
+class TestBatchMover(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.abspath("test_mover_temp")
+        self.inbox = os.path.join(self.root, "inbox")
+        self.dest = os.path.join(self.root, "factures")
+        os.makedirs(self.inbox)
+        os.makedirs(os.path.join(self.dest, "Ovh"))
+        open(os.path.join(self.dest, "Ovh", "f.pdf"), "wb").close()
+        self.files = []
+        for name in ["f.pdf", "g.pdf"]:
+            path = os.path.join(self.inbox, name)
+            with open(path, "wb") as f:
+                f.write(name.encode())
+            self.files.append(path)
+        os.makedirs(os.path.join(self.inbox, "sub"))
+        path = os.path.join(self.inbox, "sub", "f.pdf")
+        with open(path, "wb") as f:
+            f.write(b"sub")
+        self.files.append(path)
+        self.mover = BatchMover(self.dest, journal_dir=os.path.join(self.root, "journals"))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_plan_avoids_existing_and_batch_clashes(self):
+        moves = self.mover.plan((path, "Ovh") for path in self.files)
+        self.assertEqual([os.path.basename(m.dest) for m in moves], ["f_1.pdf", "g.pdf", "f_2.pdf"])
+
+    def check_run_and_undo(self):
+        moves = self.mover.plan((path, "Ovh") for path in self.files)
+        outcomes = list(self.mover.run(moves))
+        self.assertTrue(all(o.success for o in outcomes))
+        self.assertEqual(len(os.listdir(os.path.join(self.dest, "Ovh"))), 4)
+        with open(os.path.join(self.dest, "Ovh", "f_2.pdf"), "rb") as f:
+            self.assertEqual(f.read(), b"sub")
+
+        self.assertEqual(self.mover.last_journal(), self.mover.journal_path)
+        self.assertTrue(all(o.success for o in self.mover.undo()))
+        self.assertTrue(all(os.path.exists(path) for path in self.files))
+        self.assertEqual(os.listdir(os.path.join(self.dest, "Ovh")), ["f.pdf"])
+        self.assertIsNone(self.mover.last_journal())
+
+    def test_same_device_run_and_undo(self):
+        self.check_run_and_undo()
+
+    def test_cross_device_run_and_undo(self):
+        with patch.object(BatchMover, "_same_device", return_value=False):
+            self.check_run_and_undo()
+
+    def test_resume_after_crash(self):
+        moves = self.mover.plan((path, "Acme") for path in self.files)
+        # Crash after the first move, before it was journaled
+        os.makedirs(os.path.join(self.dest, "Acme"))
+        os.replace(moves[0].source, moves[0].dest)
+        journal = self.mover.journal_dir / "sort-crashed.jsonl"
+        os.makedirs(self.mover.journal_dir)
+        with open(journal, "w", encoding="utf-8") as f:
+            for m in moves:
+                f.write(json.dumps({"op": "move", "src": m.source, "dst": m.dest}) + "\n")
+
+        self.assertEqual(self.mover.incomplete_journals(), [journal])
+        self.assertTrue(all(o.success for o in self.mover.resume(journal)))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dest, "Acme"))), ["f.pdf", "f_1.pdf", "g.pdf"])
+        self.assertEqual(self.mover.incomplete_journals(), [])
+
+    def test_resume_keeps_source_when_destination_differs(self):
+        moves = self.mover.plan([(self.files[1], "Ovh")])
+        # Another file of the same size took the destination
+        with open(moves[0].dest, "wb") as f:
+            f.write(b"G.pdf")
+        journal = self.mover.journal_dir / "sort-crashed.jsonl"
+        os.makedirs(self.mover.journal_dir)
+        with open(journal, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "move", "src": moves[0].source, "dst": moves[0].dest}) + "\n")
+
+        outcomes = list(self.mover.resume(journal))
+        self.assertFalse(outcomes[0].success)
+        self.assertTrue(os.path.exists(self.files[1]))
+        with open(moves[0].dest, "rb") as f:
+            self.assertEqual(f.read(), b"G.pdf")
+
+    def check_destination_taken_after_plan(self):
+        moves = self.mover.plan((path, "Ovh") for path in self.files[:2])
+        with open(moves[1].dest, "wb") as f:
+            f.write(b"arrived meanwhile")
+        outcomes = list(self.mover.run(moves))
+        self.assertTrue(all(o.success for o in outcomes))
+        # Cross-device copies complete in any order
+        moved = next(o for o in outcomes if o.source == self.files[1])
+        self.assertEqual(os.path.basename(moved.dest), "g_1.pdf")
+        with open(os.path.join(self.dest, "Ovh", "g.pdf"), "rb") as f:
+            self.assertEqual(f.read(), b"arrived meanwhile")
+
+        # The journal follows the new destination
+        self.assertTrue(all(o.success for o in self.mover.undo()))
+        self.assertTrue(all(os.path.exists(path) for path in self.files[:2]))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dest, "Ovh"))), ["f.pdf", "g.pdf"])
+
+    def test_destination_taken_after_plan(self):
+        self.check_destination_taken_after_plan()
+
+    def test_destination_taken_after_plan_cross_device(self):
+        with patch.object(BatchMover, "_same_device", return_value=False):
+            self.check_destination_taken_after_plan()
+
+    def check_locked_source_is_not_duplicated(self):
+        source = self.files[1]
+        real_unlink = os.unlink
+
+        def unlink(path, *args, **kwargs):
+            if path == source:
+                raise PermissionError(13, "File in use", path)
+            return real_unlink(path, *args, **kwargs)
+
+        with patch("utils.invoice_mover.os.unlink", unlink):
+            outcomes = list(self.mover.run(self.mover.plan([(source, "Acme")])))
+        self.assertFalse(outcomes[0].success)
+        self.assertTrue(os.path.exists(source))
+        self.assertEqual(os.listdir(os.path.join(self.dest, "Acme")), [])
+
+        # Once released, the next sort files it under its own name
+        outcomes = list(self.mover.run(self.mover.plan([(source, "Acme")])))
+        self.assertTrue(outcomes[0].success)
+        self.assertEqual(os.listdir(os.path.join(self.dest, "Acme")), ["g.pdf"])
+
+    def test_locked_source_is_not_duplicated(self):
+        self.check_locked_source_is_not_duplicated()
+
+    def test_locked_source_is_not_duplicated_cross_device(self):
+        with patch.object(BatchMover, "_same_device", return_value=False):
+            self.check_locked_source_is_not_duplicated()
+
+    def test_finished_journals_are_pruned(self):
+        os.makedirs(self.mover.journal_dir)
+        for i in range(25):
+            with open(self.mover.journal_dir / f"sort-2024{i:04d}.jsonl", "w", encoding="utf-8") as f:
+                f.write(json.dumps({"op": "end"}) + "\n")
+        crashed = self.mover.journal_dir / "sort-00000000.jsonl"
+        crashed.write_text(json.dumps({"op": "move", "src": "a", "dst": "b"}) + "\n", encoding="utf-8")
+
+        list(self.mover.run(self.mover.plan([(self.files[1], "Ovh")])))
+        journals = self.mover.journals()
+        self.assertEqual(len(journals), 21)
+        self.assertIn(crashed, journals)
+        self.assertIn(self.mover.journal_path, journals)
+
+class TestFiledInvoices(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.abspath("test_filed_temp")
+        self.invoices = os.path.join(self.root, "factures")
+        os.makedirs(os.path.join(self.invoices, "Ovh"))
+        self.write("factures/Ovh/facture.pdf", b"invoice content")
+        self.detector = InvoiceDetector(use_cache=False)
+        self.detector.invoice_index = KnownFileIndex(os.path.join(self.root, "index.json"))
+        self.detector.catalog = InvoiceCatalog(os.path.join(self.root, "catalog.sqlite3"))
+        self.detector.refresh_invoice_index(self.invoices)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_copy_is_flagged_without_extraction(self):
+        copy = self.write("copy.pdf", b"invoice content")
+        result = self.detector.check_filed(copy)
+        self.assertEqual(result.duplicate_of, os.path.join(self.invoices, "Ovh", "facture.pdf"))
+        self.assertEqual(result.company_name, "Ovh")
+        self.assertFalse(result.is_invoice)
+
+    def test_other_files_are_not_flagged(self):
+        same_size = self.write("same_size.pdf", b"invoice CONTENT")
+        self.assertIsNone(self.detector.check_filed(same_size))
+        with patch("utils.duplicate_finder.file_hash") as file_hash:
+            self.assertIsNone(self.detector.check_filed(self.write("small.pdf", b"x")))
+        file_hash.assert_not_called()
+
+    def test_moved_invoice_is_indexed(self):
+        new = self.write("new.pdf", b"new invoice")
+        success, dest = self.detector.move_invoice(new, "Edf", self.invoices)
+        self.assertTrue(success)
+        again = self.write("new.pdf", b"new invoice")
+        self.assertEqual(self.detector.check_filed(again).duplicate_of, dest)
+
+class TestInvoiceCatalog(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.abspath("test_catalog_temp")
+        os.makedirs(os.path.join(self.root, "EDF"))
+        os.makedirs(os.path.join(self.root, "Ovh"))
+        self.catalog = InvoiceCatalog(os.path.join(self.root, "catalog.sqlite3"))
+        self.edf = self.file("EDF/facture_mars.pdf")
+        self.ovh = self.file("Ovh/facture.pdf")
+        self.catalog.add(self.edf, "EDF", 1.0, "Facture d'électricité du 12/03/2024\nTotal TTC : 142,50 €")
+        self.catalog.add(self.ovh, "Ovh", 0.8, INVOICE_TEXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def file(self, name):
+        path = os.path.join(self.root, name)
+        open(path, "wb").close()
+        return path
+
+    def paths(self, query):
+        return [entry.path for entry in self.catalog.search(query)]
+
+    def test_amounts_and_dates(self):
+        self.assertEqual(extract_amounts("Total 1 234,56 € dont TVA 20,00 - réf 12.03.2024"), ["1234,56", "20,00"])
+        self.assertEqual(extract_dates("du 12/03/2024 au 2024-04-11, 31/02/24"), ["2024-04-11", "2024-03-12"])
+
+    def test_search(self):
+        self.assertEqual(self.paths("edf 142,50"), [self.edf])
+        self.assertEqual(self.paths("electricite"), [self.edf])
+        self.assertCountEqual(self.paths("2024-03"), [self.edf, self.ovh])
+        self.assertEqual(self.paths("mars"), [self.edf])
+        self.assertCountEqual(self.paths("fact"), [self.edf, self.ovh])
+        self.assertEqual(self.paths('siret "OR"'), [])
+        entry = self.catalog.search("142,50")[0]
+        self.assertEqual((entry.company, entry.amounts, entry.dates), ("EDF", ["142,50"], ["2024-03-12"]))
+
+    def test_follows_moves_and_drops_missing_files(self):
+        new_path = os.path.join(self.root, "EDF", "renamed.pdf")
+        os.replace(self.edf, new_path)
+        self.catalog.move(self.edf, new_path)
+        self.assertEqual(self.paths("edf"), [new_path])
+        os.remove(self.ovh)
+        self.assertEqual(self.paths("ovh"), [])
+        self.assertEqual(self.catalog.count(), 1)
+
+class FakePage:
+    width, height = 600, 800
+
+    def __init__(self, text="", images=()):
+        self.text = text
+        self.chars = list(text)
+        self.images = list(images)
+
+    def extract_text(self):
+        return self.text
+
+class FakePdf:
+    def __init__(self, pages):
+        self.pages = pages
+
+class TestPdfPageClassification(unittest.TestCase):
+    def test_conclusive_scan_stops_ocr(self):
+        detector = InvoiceDetector(use_cache=False)
+        scan = {"x0": 0, "x1": 600, "top": 0, "bottom": 800}
+        pdf = FakePdf([
+            FakePage("Conditions générales de vente, voir le détail de la commande ci-joint."),
+            FakePage("1", images=[scan]),
+            FakePage(""),
+        ])
+        with patch("utils.invoice_detector.HAS_OCR", True), \
+                patch.object(detector, "_ocr_pdf_page", return_value=INVOICE_TEXT) as ocr:
+            text = detector._extract_pdf_document(pdf)
+        ocr.assert_called_once_with(pdf.pages[1])
+        self.assertIn("Conditions", text)
+        self.assertIn("FACTURE", text)
+
+    def test_textless_pages_are_ocr_d_when_inconclusive(self):
+        detector = InvoiceDetector(use_cache=False)
+        logo = {"x0": 0, "x1": 100, "top": 0, "bottom": 100}
+        pdf = FakePdf([FakePage("", images=[logo]), FakePage("")])
+        with patch("utils.invoice_detector.HAS_OCR", True), \
+                patch.object(detector, "_ocr_pdf_page", return_value="Montant") as ocr_first, \
+                patch.object(detector, "_ocr_pdf_pages", return_value=["Facture n° 42"]) as ocr_rest:
+            text = detector._extract_pdf_document(pdf)
+        ocr_first.assert_called_once_with(pdf.pages[0])
+        ocr_rest.assert_called_once_with(pdf.pages[1:])
+        self.assertIn("Facture n° 42", text)
+
+    def test_pypdf2_fallback_when_pdfplumber_finds_no_text(self):
+        detector = InvoiceDetector(use_cache=False)
+        reader = MagicMock(pages=[FakePage(INVOICE_TEXT)])
+        with patch("utils.invoice_detector.pdfplumber") as pdfplumber, \
+                patch("utils.invoice_detector.PyPDF2") as pypdf2, \
+                patch("utils.invoice_detector.HAS_OCR", False):
+            pdfplumber.open.return_value.pages = [FakePage("")]
+            pypdf2.PdfReader.return_value = reader
+            text = detector.extract_text_from_pdf("scan.pdf")
+        pypdf2.PdfReader.assert_called_once_with("scan.pdf")
+        self.assertIn("FACTURE", text)
+
+@unittest.skipUnless(image_preprocess.HAS_NUMPY, "NumPy and Pillow are required")
+class TestImagePreprocess(unittest.TestCase):
+    def make_page(self, angle):
+        image = Image.new("L", (2000, 1500), 255)
+        draw = ImageDraw.Draw(image)
+        for i in range(12):
+            # 80 px tall "text lines" made of word-sized blocks
+            for x in range(150, 1800, 140):
+                draw.rectangle((x, 150 + i * 110, x + 100, 230 + i * 110), fill=0)
+        return image.rotate(angle, fillcolor=255)
+
+    def test_layout_estimation(self):
+        scale, skew = image_preprocess.analyze_layout(self.make_page(3))
+        self.assertAlmostEqual(skew, -3.0, delta=0.3)
+        self.assertAlmostEqual(scale, image_preprocess.TARGET_LINE_HEIGHT / 80, delta=0.1)
+
+    def test_output_is_binary_and_rescaled(self):
+        out = image_preprocess.preprocess_for_ocr(self.make_page(0))
+        self.assertEqual(out.mode, "L")
+        self.assertLess(out.width, 2000)
+        self.assertLessEqual({color for _, color in out.getcolors()}, {0, 255})
+
+    def test_adaptive_threshold_matches_local_means(self):
+        import numpy as np
+        pixels = np.random.default_rng(0).integers(0, 256, (40, 300), dtype=np.uint8)
+        with patch.object(image_preprocess, "THRESHOLD_STRIP_ROWS", 16):
+            ink = image_preprocess.adaptive_threshold(pixels, window=7)
+        expected = np.zeros_like(ink)
+        for y in range(40):
+            for x in range(300):
+                mean = pixels[max(0, y - 3):y + 4, max(0, x - 3):x + 4].mean()
+                expected[y, x] = pixels[y, x] < mean - 10
+        self.assertEqual(int((ink != expected).sum()), 0)
+
+@unittest.skipUnless(image_preprocess.HAS_NUMPY, "Pillow and pytesseract are required")
+class TestTesseractBatch(unittest.TestCase):
+    def setUp(self):
+        self.images = [Image.new("L", (50, 20), 255) for _ in range(3)]
+
+    def fake_run(self, stdout):
+        def run(cmd, **kwargs):
+            with open(cmd[1], encoding="utf-8") as f:
+                self.listed = f.read().split()
+            return subprocess.CompletedProcess(cmd, 0, stdout=stdout, stderr=b"")
+        return run
+
+    def test_one_process_for_all_images(self):
+        with patch("utils.ocr_batch.subprocess.run", side_effect=self.fake_run(b"one\n\ftwo\n\fthree\n\f")) as run:
+            texts = TesseractBatch("fra").image_to_strings(self.images)
+        run.assert_called_once()
+        self.assertEqual(len(self.listed), 3)
+        self.assertEqual([t.strip() for t in texts], ["one", "two", "three"])
+
+    def test_falls_back_to_one_call_per_image(self):
+        with patch("utils.ocr_batch.subprocess.run", side_effect=self.fake_run(b"one\n\f")), \
+                patch("utils.ocr_batch.pytesseract.image_to_string", return_value="text") as single:
+            texts = TesseractBatch("fra").image_to_strings(self.images)
+        self.assertEqual(single.call_count, 3)
+        self.assertEqual(texts, ["text"] * 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,13 @@ import unittest
 from unittest.mock import MagicMock, patch
 import sys
 
-# Mock pytesseract and PIL
-sys.modules['pytesseract'] = MagicMock()
-sys.modules['PIL'] = MagicMock()
-sys.modules['PIL.Image'] = MagicMock()
-
-from utils.ocr_helper import OCRHelper
+# Mock pytesseract and PIL (only while importing, so other test modules keep the real ones)
+with patch.dict(sys.modules, {
+    'pytesseract': MagicMock(),
+    'PIL': MagicMock(),
+    'PIL.Image': MagicMock(),
+}):
+    from utils.ocr_helper import OCRHelper
 
 class TestOCRHelper(unittest.TestCase):
     def setUp(self):
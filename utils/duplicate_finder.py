@@ -1,9 +1,20 @@
 import os
+import json
+import math
 import hashlib
-import send2trash
-from typing import List, Dict, Generator, Optional
+from pathlib import Path
+from typing import Callable, List, Dict, Generator, Optional, Set, Tuple
 from dataclasses import dataclass
 
+from utils.lazy_import import lazy_module
+
+# Only imported when something is trashed: the invoice analysis workers,
+# started fresh (not forked), never do
+send2trash = lazy_module("send2trash")
+
+DEFAULT_RESULTS_FILE = Path.home() / ".toolbox" / "duplicates_results.json"
+DEFAULT_LIBRARY_INDEX_FILE = Path.home() / ".toolbox" / "library_index.json"
+
 @dataclass
 class DuplicateFile:
     path: str
@@ -23,14 +34,312 @@ class DuplicateGroup:
     def count(self) -> int:
         return len(self.files)
 
+# A keep rule receives the files of one group and returns the indices to keep.
+# Every other file of the group gets selected for deletion. Returning an empty
+# set means "no opinion" and leaves the whole group unselected.
+KeepRule = Callable[[List[DuplicateFile]], Set[int]]
+
+def keep_newest(files: List[DuplicateFile]) -> Set[int]:
+    return {max(range(len(files)), key=lambda i: files[i].modified)}
+
+def keep_oldest(files: List[DuplicateFile]) -> Set[int]:
+    return {min(range(len(files)), key=lambda i: files[i].modified)}
+
+def keep_shortest_path(files: List[DuplicateFile]) -> Set[int]:
+    return {min(range(len(files)), key=lambda i: (len(files[i].path), files[i].path))}
+
+def keep_under(folder: str) -> KeepRule:
+    """Builds a rule keeping every file located under `folder`."""
+    prefix = os.path.join(os.path.normcase(os.path.abspath(folder)), "")
+
+    def rule(files: List[DuplicateFile]) -> Set[int]:
+        return {
+            i for i, f in enumerate(files)
+            if os.path.normcase(os.path.abspath(f.path)).startswith(prefix)
+        }
+    return rule
+
+KEEP_RULES: Dict[str, KeepRule] = {
+    "newest": keep_newest,
+    "oldest": keep_oldest,
+    "shortest_path": keep_shortest_path,
+}
+
+# Sort keys for result groups; all of them sort ascending.
+GROUP_SORT_KEYS: Dict[str, Callable[[DuplicateGroup], object]] = {
+    "size": lambda g: (-g.size, g.hash_value),
+    "count": lambda g: (-g.count, -g.size),
+    "folder": lambda g: (os.path.dirname(g.files[0].path).lower(), -g.size),
+}
+
+class DuplicateResults:
+    """Duplicate groups plus the deletion selection, indexed by group.
+
+    Selection lives here rather than in UI controls so that rules and bulk
+    operations run as plain passes over lists, whatever is rendered.
+    """
+
+    def __init__(self, groups: List[DuplicateGroup]):
+        self.groups = groups
+        self.selected: List[List[bool]] = [[False] * g.count for g in groups]
+        self.selected_count = 0
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    @property
+    def total_duplicates(self) -> int:
+        return sum(g.count - 1 for g in self.groups)
+
+    @property
+    def potential_savings(self) -> int:
+        return sum(g.size * (g.count - 1) for g in self.groups)
+
+    def ordered(self, sort_by: str = "size", folder_filter: str = "") -> List[int]:
+        """Group indices matching `folder_filter`, sorted by `sort_by`."""
+        indices = range(len(self.groups))
+        if folder_filter:
+            needle = os.path.normcase(folder_filter)
+            indices = [
+                i for i in indices
+                if any(needle in os.path.normcase(os.path.dirname(f.path)) for f in self.groups[i].files)
+            ]
+        key = GROUP_SORT_KEYS[sort_by]
+        return sorted(indices, key=lambda i: key(self.groups[i]))
+
+    def is_selected(self, group_index: int, file_index: int) -> bool:
+        return self.selected[group_index][file_index]
+
+    def set_selected(self, group_index: int, file_index: int, value: bool):
+        row = self.selected[group_index]
+        if row[file_index] != value:
+            row[file_index] = value
+            self.selected_count += 1 if value else -1
+
+    def select_all(self, value: bool):
+        self.selected = [[value] * g.count for g in self.groups]
+        self.selected_count = sum(g.count for g in self.groups) if value else 0
+
+    def apply_rule(self, rule: KeepRule) -> int:
+        """Selects every file the rule does not keep. Returns the selection size."""
+        selected = []
+        count = 0
+        for group in self.groups:
+            keep = rule(group.files)
+            if keep:
+                row = [i not in keep for i in range(group.count)]
+                count += group.count - len(keep)
+            else:
+                row = [False] * group.count
+            selected.append(row)
+        self.selected = selected
+        self.selected_count = count
+        return count
+
+    def selected_paths(self) -> List[str]:
+        return [
+            f.path
+            for group, row in zip(self.groups, self.selected)
+            for f, checked in zip(group.files, row) if checked
+        ]
+
+    def remove_paths(self, paths: Set[str]):
+        """Drops files (e.g. deleted ones) and the groups left without duplicates."""
+        groups = []
+        selected = []
+        for group, row in zip(self.groups, self.selected):
+            kept = [(f, checked) for f, checked in zip(group.files, row) if f.path not in paths]
+            if len(kept) > 1:
+                groups.append(DuplicateGroup(hash_value=group.hash_value, files=[f for f, _ in kept]))
+                selected.append([checked for _, checked in kept])
+        self.groups = groups
+        self.selected = selected
+        self.selected_count = sum(sum(row) for row in selected)
+
+def file_hash(file_path: str, first_chunk_only: bool = False) -> str:
+    """Calculates MD5 hash of a file."""
+    hasher = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        if first_chunk_only:
+            chunk = f.read(4096)
+            hasher.update(chunk)
+        else:
+            for chunk in iter(lambda: f.read(4096), b""):
+                hasher.update(chunk)
+    return hasher.hexdigest()
+
+class BloomFilter:
+    """Fixed-size Bloom filter: no false negatives, ~`error_rate` false positives."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+class KnownFileIndex:
+    """Persistent size -> digest -> paths index of a set of library folders.
+
+    Lookups go through a Bloom filter of the indexed sizes first, so a file
+    whose size is not in the library is rejected without touching the index;
+    otherwise the file is hashed once and its digest looked up. Without
+    `index_file` the index only lives in memory.
+    """
+
+    def __init__(self, index_file: Optional[Path]):
+        self.index_file = Path(index_file) if index_file else None
+        self.roots: List[str] = []
+        # path -> (size, mtime, digest)
+        self.entries: Dict[str, Tuple[int, float, str]] = {}
+        self.by_size: Dict[int, Dict[str, List[str]]] = {}
+        self.bloom = BloomFilter(1)
+        self._loaded = False
+
+    def load(self):
+        self._loaded = True
+        if self.index_file is None:
+            self._rebuild_lookup()
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.roots = data["roots"]
+            self.entries = {p: (size, mtime, digest) for p, (size, mtime, digest) in data["files"].items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading library index: {e}")
+        self._rebuild_lookup()
+
+    def save(self):
+        if self.index_file is None:
+            return
+        data = {
+            "version": 1,
+            "roots": self.roots,
+            "files": {p: list(entry) for p, entry in self.entries.items()},
+        }
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.index_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            print(f"Error saving library index: {e}")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _rebuild_lookup(self):
+        self.by_size = {}
+        for path, (size, _, digest) in self.entries.items():
+            self.by_size.setdefault(size, {}).setdefault(digest, []).append(path)
+        self.bloom = BloomFilter(len(self.by_size) * 2)
+        for size in self.by_size:
+            self.bloom.add(str(size))
+
+    def build(self, roots: List[str], should_stop: Callable[[], bool] = lambda: False) -> Generator[str, None, int]:
+        """
+        Walks the roots and hashes new or changed files; unchanged files
+        (same size and mtime) keep their digest. Yields status messages.
+        Returns the number of indexed files.
+        """
+        self._ensure_loaded()
+        previous = self.entries
+        entries: Dict[str, Tuple[int, float, str]] = {}
+
+        for root_path in roots:
+            for root, _, files in os.walk(root_path):
+                if should_stop(): return len(self.entries)
+                yield f"Indexing {root}..."
+                for file in files:
+                    if file.startswith('.'): continue # Skip hidden files
+                    file_path = os.path.join(root, file)
+                    try:
+                        stats = os.stat(file_path)
+                        known = previous.get(file_path)
+                        if known and known[0] == stats.st_size and known[1] == stats.st_mtime:
+                            entries[file_path] = known
+                        else:
+                            entries[file_path] = (stats.st_size, stats.st_mtime, file_hash(file_path))
+                    except OSError:
+                        continue
+
+        self.roots = list(roots)
+        self.entries = entries
+        self._rebuild_lookup()
+        return len(entries)
+
+    def add(self, file_path: str):
+        """Indexes a single file, e.g. one just moved into the library."""
+        self._ensure_loaded()
+        self.remove(file_path)
+        stats = os.stat(file_path)
+        digest = file_hash(file_path)
+        self.entries[file_path] = (stats.st_size, stats.st_mtime, digest)
+        self.by_size.setdefault(stats.st_size, {}).setdefault(digest, []).append(file_path)
+        self.bloom.add(str(stats.st_size))
+
+    def remove(self, file_path: str):
+        self._ensure_loaded()
+        entry = self.entries.pop(file_path, None)
+        if entry:
+            size, _, digest = entry
+            paths = self.by_size[size][digest]
+            paths.remove(file_path)
+            if not paths:
+                del self.by_size[size][digest]
+            if not self.by_size[size]:
+                # The Bloom filter cannot forget; a stale size only costs a dict lookup
+                del self.by_size[size]
+
+    def find_copies(self, file_path: str) -> List[str]:
+        self._ensure_loaded()
+        try:
+            size = os.path.getsize(file_path)
+            if str(size) not in self.bloom:
+                return []
+            digests = self.by_size.get(size)
+            if not digests:
+                return []
+            copies = digests.get(file_hash(file_path), [])
+        except OSError:
+            return []
+        own_path = os.path.normcase(os.path.abspath(file_path))
+        return [p for p in copies if os.path.normcase(os.path.abspath(p)) != own_path]
+
 class DuplicateFinder:
-    def __init__(self):
+    TRASH_BATCH_SIZE = 200
+
+    def __init__(self, results_file: Optional[Path] = None, library_index_file: Optional[Path] = None):
         self._stop_requested = False
+        self.results_file = Path(results_file) if results_file else DEFAULT_RESULTS_FILE
+        self.library_index = KnownFileIndex(library_index_file or DEFAULT_LIBRARY_INDEX_FILE)
 
     def stop(self):
         """Request to stop the scanning process."""
         self._stop_requested = True
 
+    @property
+    def stop_requested(self) -> bool:
+        """The last scan was stopped before the end: its results are partial."""
+        return self._stop_requested
+
     def scan_directory(self, paths: List[str], recursive: bool = True, min_size: int = 0) -> Generator[str, None, List[DuplicateGroup]]:
         """
         Scans directories for duplicates.
@@ -48,6 +357,7 @@ class DuplicateFinder:
             if recursive:
                 for root, _, files in os.walk(root_path):
                     if self._stop_requested: break
+                    yield f"Phase 1/3: Scanning {root}..."
                     for file in files:
                         if file.startswith('.'): continue # Skip hidden files
                         file_path = os.path.join(root, file)
@@ -85,8 +395,11 @@ class DuplicateFinder:
         yield f"Phase 2/3: Pre-hashing {total_groups} groups..."
         files_by_partial_hash: Dict[str, List[str]] = {}
         
+        processed_count = 0
         for size, file_list in potential_duplicates.items():
             if self._stop_requested: break
+            processed_count += 1
+            yield f"Phase 2/3: Pre-hashing group {processed_count}/{total_groups}..."
             
             for file_path in file_list:
                 try:
@@ -111,8 +424,7 @@ class DuplicateFinder:
         for key, file_list in potential_duplicates_2.items():
             if self._stop_requested: break
             processed_count += 1
-            if processed_count % 10 == 0:
-                yield f"Phase 3/3: Verifying group {processed_count}/{total_groups_2}..."
+            yield f"Phase 3/3: Verifying group {processed_count}/{total_groups_2}..."
 
             # Group by full hash within this partial match group
             temp_groups: Dict[str, List[DuplicateFile]] = {}
@@ -140,17 +452,135 @@ class DuplicateFinder:
         yield "Scan complete."
         return list(final_duplicates.values())
 
+    def save_results(self, paths: List[str], groups: List[DuplicateGroup], complete: bool = True):
+        """Persists scan results so they survive the view being recreated.
+
+        `complete` is False for the partial results of a cancelled scan.
+        """
+        data = {
+            "version": 1,
+            "paths": paths,
+            "complete": complete,
+            "groups": [
+                {"hash": g.hash_value, "files": [[f.path, f.size, f.modified] for f in g.files]}
+                for g in groups
+            ],
+        }
+        try:
+            self.results_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.results_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.results_file)
+        except OSError as e:
+            print(f"Error saving duplicate results: {e}")
+
+    def load_results(self) -> Optional[Tuple[List[str], List[DuplicateGroup], bool]]:
+        """Returns (scanned paths, groups, complete) of the last saved scan, if any."""
+        try:
+            with open(self.results_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            groups = [
+                DuplicateGroup(
+                    hash_value=g["hash"],
+                    files=[DuplicateFile(path=p, size=size, modified=mtime) for p, size, mtime in g["files"]]
+                )
+                for g in data["groups"]
+            ]
+            return data["paths"], groups, data.get("complete", True)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading duplicate results: {e}")
+            return None
+
+    def clear_results(self):
+        try:
+            self.results_file.unlink()
+        except FileNotFoundError:
+            pass
+
+    def revalidate(self, groups: List[DuplicateGroup]) -> Generator[str, None, Set[str]]:
+        """
+        Checks saved groups against the disk.
+        Only files whose size or mtime changed are re-hashed; unchanged
+        content gets its new mtime. Yields status messages.
+        Returns the set of paths that are no longer duplicates.
+        """
+        self._stop_requested = False
+        stale: Set[str] = set()
+        total = len(groups)
+
+        for index, group in enumerate(groups, 1):
+            if self._stop_requested: break
+            yield f"Checking saved results: group {index}/{total}..."
+            for file in group.files:
+                try:
+                    stats = os.stat(file.path)
+                except OSError:
+                    stale.add(file.path)
+                    continue
+                if stats.st_size == file.size and stats.st_mtime == file.modified:
+                    continue
+                try:
+                    if stats.st_size == file.size and self._get_file_hash(file.path) == group.hash_value:
+                        file.modified = stats.st_mtime
+                        continue
+                except OSError:
+                    pass
+                stale.add(file.path)
+
+        return stale
+
     def _get_file_hash(self, file_path: str, first_chunk_only: bool = False) -> str:
-        """Calculates MD5 hash of a file."""
-        hasher = hashlib.md5()
-        with open(file_path, 'rb') as f:
-            if first_chunk_only:
-                chunk = f.read(4096)
-                hasher.update(chunk)
-            else:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hasher.update(chunk)
-        return hasher.hexdigest()
+        return file_hash(file_path, first_chunk_only)
+
+    # Library index: "do I already have this file somewhere?"
+    def index_library(self, roots: List[str]) -> Generator[str, None, int]:
+        """
+        (Re)builds the persistent index of the library roots.
+        Yields status messages.
+        Returns the number of indexed files.
+        """
+        self._stop_requested = False
+        count = yield from self.library_index.build(roots, lambda: self._stop_requested)
+        if not self._stop_requested:
+            self.library_index.save()
+        return count
+
+    def is_known(self, file_path: str) -> bool:
+        """True if a file with the same content exists in the library."""
+        return bool(self.library_index.find_copies(file_path))
+
+    def find_copies(self, file_path: str) -> List[str]:
+        """Library paths holding the same content as `file_path`."""
+        return self.library_index.find_copies(file_path)
+
+    def delete_files(self, paths: List[str], batch_size: int = TRASH_BATCH_SIZE) -> Generator[str, None, List[str]]:
+        """
+        Sends files to the trash in batches.
+        Yields status messages.
+        Returns the list of paths that are no longer on disk.
+        """
+        self._stop_requested = False
+        deleted: List[str] = []
+        total = len(paths)
+
+        for start in range(0, total, batch_size):
+            if self._stop_requested: break
+            batch = paths[start:start + batch_size]
+            try:
+                send2trash.send2trash(batch)
+                deleted.extend(batch)
+            except Exception:
+                # A batch stops at its first failure: retry file by file,
+                # counting the ones already trashed by the batch call.
+                for file_path in batch:
+                    if not os.path.exists(file_path) or self.delete_file(file_path):
+                        deleted.append(file_path)
+            yield f"Moving to trash: {min(start + batch_size, total)}/{total}..."
+
+        return deleted
 
     def delete_file(self, file_path: str) -> bool:
         """Sends a file to the trash."""
@@ -0,0 +1,170 @@
+"""
+OCR image preprocessing
+Grayscale, rescale to a target text height, deskew and adaptive binarization
+with NumPy before images are handed to Tesseract.
+"""
+
+import math
+from typing import Tuple
+
+from utils.lazy_import import has_module, lazy_module
+
+# Imported on the first preprocessed image
+HAS_NUMPY = has_module("numpy") and has_module("PIL")
+np = lazy_module("numpy")
+Image = lazy_module("PIL.Image")
+
+# Height in pixels of a text line (ascenders to descenders) after rescaling.
+# Tesseract is most accurate with an x-height of 20-30 px; full-resolution
+# phone photos are far above that and cost time for nothing.
+TARGET_LINE_HEIGHT = 40
+MIN_SCALE = 0.25
+MAX_SCALE = 2.0
+# Never produce an image with more pixels than this
+MAX_PIXELS = 16_000_000
+
+# Width of the thumbnail used to estimate line height and skew
+ANALYSIS_WIDTH = 1000
+MAX_SKEW_DEGREES = 5.0
+# Ink points sampled for the skew search
+SKEW_SAMPLE_POINTS = 20000
+# Rows binarized at a time by adaptive_threshold
+THRESHOLD_STRIP_ROWS = 256
+
+
+def _to_grayscale(image: "Image.Image") -> "Image.Image":
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        # Transparent areas become white paper, not black
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert('RGBA'))
+    return image.convert('L')
+
+
+def adaptive_threshold(pixels: "np.ndarray", window: int, offset: float = 10.0) -> "np.ndarray":
+    """Boolean ink mask: pixels darker than their local mean minus `offset`.
+
+    Local means come from an integral image, so the cost does not depend on
+    the window size. Unlike a global threshold, shadows and uneven lighting
+    on photos do not turn whole areas black. `pixels` holds 8-bit values.
+    """
+    height, width = pixels.shape
+    # Window sums are differences of integral values: computed modulo 2**32
+    # they stay exact, a window holding far less than 2**32, so a uint32
+    # integral image (4 bytes per pixel) is enough whatever the image size
+    integral = np.zeros((height + 1, width + 1), dtype=np.uint32)
+    np.cumsum(pixels, axis=0, dtype=np.uint32, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, dtype=np.uint32, out=integral[1:, 1:])
+
+    radius = window // 2
+    cols = np.arange(width)
+    x0 = np.clip(cols - radius, 0, width)
+    x1 = np.clip(cols + radius + 1, 0, width)
+    widths = (x1 - x0).astype(np.float32)
+
+    # Row strips bound the temporaries to a few megabytes
+    ink = np.empty((height, width), dtype=bool)
+    for start in range(0, height, THRESHOLD_STRIP_ROWS):
+        rows = np.arange(start, min(start + THRESHOLD_STRIP_ROWS, height))
+        top = integral[np.clip(rows - radius, 0, height)]
+        bottom = integral[np.clip(rows + radius + 1, 0, height)]
+        sums = bottom[:, x1] - top[:, x1] - bottom[:, x0] + top[:, x0]
+        heights = (np.minimum(rows + radius + 1, height) - np.maximum(rows - radius, 0)).astype(np.float32)
+        means = sums.astype(np.float32) / (heights[:, None] * widths[None, :])
+        ink[rows[0]:rows[-1] + 1] = pixels[rows[0]:rows[-1] + 1] < means - offset
+    return ink
+
+
+def _row_profile(ys: "np.ndarray", xs: "np.ndarray", angle: float) -> "np.ndarray":
+    """Ink count per row once the points are rotated by `angle` radians."""
+    rows = np.round(ys - xs * math.tan(angle)).astype(np.int64)
+    rows -= rows.min()
+    return np.bincount(rows)
+
+
+def estimate_skew(ink: "np.ndarray") -> float:
+    """Text skew in degrees (positive when lines go down to the right).
+
+    Projection profile search: the angle whose row profile is the most
+    peaked is the one aligning text lines with rows.
+    """
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > SKEW_SAMPLE_POINTS:
+        step = len(ys) // SKEW_SAMPLE_POINTS
+        ys, xs = ys[::step], xs[::step]
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+
+    def sharpness(degrees: float) -> float:
+        profile = _row_profile(ys, xs, math.radians(degrees)).astype(np.float64)
+        return float(np.sum(profile ** 2))
+
+    # Coarse search, then refine around the best angle
+    best = max(np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 0.01, 0.5), key=sharpness)
+    best = max(np.arange(best - 0.5, best + 0.51, 0.1), key=sharpness)
+    return float(best)
+
+
+def estimate_line_height(ink: "np.ndarray", skew: float = 0.0) -> float:
+    """Median height in pixels of the text line bands, 0 if none found."""
+    ys, xs = np.nonzero(ink)
+    if len(ys) < 100:
+        return 0.0
+    profile = _row_profile(ys.astype(np.float64), xs.astype(np.float64), math.radians(skew))
+    has_ink = profile > max(1, profile.max() * 0.05)
+
+    # Lengths of the runs of inked rows
+    edges = np.diff(np.concatenate(([0], has_ink.astype(np.int8), [0])))
+    starts = np.nonzero(edges == 1)[0]
+    ends = np.nonzero(edges == -1)[0]
+    heights = ends - starts
+    heights = heights[heights >= 3]
+    if len(heights) == 0:
+        return 0.0
+    return float(np.median(heights))
+
+
+def analyze_layout(gray: "Image.Image") -> Tuple[float, float]:
+    """Returns (scale to reach TARGET_LINE_HEIGHT, skew in degrees)."""
+    thumb_scale = min(1.0, ANALYSIS_WIDTH / float(gray.width))
+    thumb = gray
+    if thumb_scale < 1.0:
+        thumb = gray.resize((max(1, int(gray.width * thumb_scale)), max(1, int(gray.height * thumb_scale))), Image.BILINEAR)
+    pixels = np.asarray(thumb, dtype=np.uint8)
+    ink = adaptive_threshold(pixels, window=31)
+
+    skew = estimate_skew(ink)
+    line_height = estimate_line_height(ink, skew) / thumb_scale
+    if line_height <= 0:
+        scale = 1.0
+    else:
+        scale = min(max(TARGET_LINE_HEIGHT / line_height, MIN_SCALE), MAX_SCALE)
+    return scale, skew
+
+
+def preprocess_for_ocr(image: "Image.Image") -> "Image.Image":
+    """Grayscale, rescaled, deskewed and binarized copy of `image`.
+
+    Returns the image unchanged if NumPy is not available.
+    """
+    if not HAS_NUMPY:
+        return image
+
+    gray = _to_grayscale(image)
+    scale, skew = analyze_layout(gray)
+
+    max_scale = math.sqrt(MAX_PIXELS / float(gray.width * gray.height))
+    scale = min(scale, max_scale)
+    if abs(scale - 1.0) > 0.05:
+        size = (max(1, int(gray.width * scale)), max(1, int(gray.height * scale)))
+        gray = gray.resize(size, Image.LANCZOS if scale < 1.0 else Image.BICUBIC)
+
+    if abs(skew) >= 0.2:
+        # PIL rotates counter-clockwise, which levels lines going down to the right
+        gray = gray.rotate(skew, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    pixels = np.asarray(gray, dtype=np.uint8)
+    window = 2 * TARGET_LINE_HEIGHT + 1
+    ink = adaptive_threshold(pixels, window=window)
+    return Image.fromarray(np.where(ink, np.uint8(0), np.uint8(255)), mode='L')
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from utils.settings_manager import settings
+
+
+DEFAULT_CACHE_FILE = Path.home() / ".toolbox" / "invoice_cache.sqlite3"
+
+
+@dataclass
+class CachedExtraction:
+    """Extraction and scoring output stored for one document content."""
+    text: str
+    raw_score: int
+    confidence: float
+    keywords: List[str]
+
+
+class ExtractionCache:
+    """Persistent cache of extracted text and invoice scores.
+
+    Entries are keyed by content hash + OCR language + extractor version, so
+    a renamed or re-downloaded file is still a hit while any change to the
+    content or to the extraction code is a miss. SQLite keeps the cache safe
+    to share between the analysis worker processes. When the stored text
+    grows past `max_bytes`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.db_path = Path(db_path) if db_path else DEFAULT_CACHE_FILE
+        if max_bytes is None:
+            max_bytes = settings.get("invoice_cache_max_mb", 64) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._initialized = False
+
+    @staticmethod
+    def content_hash(file_path: str) -> str:
+        """SHA-256 of the file content."""
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, ocr_lang: str, extractor_version: int) -> str:
+        return f"{extractor_version}:{ocr_lang}:{content_hash}"
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " key TEXT PRIMARY KEY,"
+                " text TEXT NOT NULL,"
+                " raw_score INTEGER NOT NULL,"
+                " confidence REAL NOT NULL,"
+                " keywords TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON extractions(last_used)")
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def get(self, key: str) -> Optional[CachedExtraction]:
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT text, raw_score, confidence, keywords FROM extractions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+            finally:
+                conn.close()
+            text, raw_score, confidence, keywords = row
+            return CachedExtraction(text, raw_score, confidence, json.loads(keywords))
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Extraction cache error: {e}")
+            return None
+
+    def put(self, key: str, entry: CachedExtraction):
+        # Approximate row size, so that empty entries still count
+        size = len(entry.text.encode('utf-8')) + 128
+        if size > self.max_bytes:
+            return
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, entry.text, entry.raw_score, entry.confidence,
+                     json.dumps(entry.keywords), size, time.time())
+                )
+                self._evict(conn)
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Extraction cache error: {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Evict down to 90% so that eviction does not run on every insert
+        to_free = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM extractions ORDER BY last_used").fetchall():
+            stale.append((key,))
+            freed += size
+            if freed >= to_free:
+                break
+        conn.executemany("DELETE FROM extractions WHERE key = ?", stale)
+
+    def clear(self):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM extractions")
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Extraction cache error: {e}")
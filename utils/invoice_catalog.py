@@ -0,0 +1,217 @@
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
+
+
+DEFAULT_CATALOG_FILE = Path.home() / ".toolbox" / "invoice_catalog.sqlite3"
+
+# 142,50 / 1 234,56 / 1.234,56 / 99.90
+AMOUNT_PATTERN = re.compile(r'(?<![\d,.])(\d{1,3}(?:[ \u00a0\u202f.]\d{3})+|\d+)[,.](\d{2})(?![\d,.]\d)')
+# 12/03/2024, 12-03-24, 12.03.2024
+DMY_DATE_PATTERN = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\b')
+ISO_DATE_PATTERN = re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b')
+
+
+def extract_amounts(text: str) -> List[str]:
+    """Distinct amounts of the text, as "1234,56" without thousands separators."""
+    amounts = []
+    for units, cents in AMOUNT_PATTERN.findall(text):
+        amount = f"{re.sub(r'[^0-9]', '', units)},{cents}"
+        if amount not in amounts:
+            amounts.append(amount)
+    return amounts
+
+
+def extract_dates(text: str) -> List[str]:
+    """Distinct valid dates of the text, as ISO "2024-03-12"."""
+    dates = []
+    found = [(y, m, d) for y, m, d in ISO_DATE_PATTERN.findall(text)]
+    found += [(y, m, d) for d, m, y in DMY_DATE_PATTERN.findall(text)]
+    for year, month, day in found:
+        year = int(year) + 2000 if len(year) == 2 else int(year)
+        try:
+            iso = date(year, int(month), int(day)).isoformat()
+        except ValueError:
+            continue
+        if iso not in dates:
+            dates.append(iso)
+    return dates
+
+
+def match_query(query: str) -> str:
+    """FTS5 query for free user input: every term must match, as a prefix.
+
+    Terms are quoted so that punctuation ("142,50", "l'électricité") and FTS
+    operators typed by the user are searched as plain text; "quoted words"
+    are kept together as a phrase.
+    """
+    parts = []
+    for term in re.findall(r'"[^"]*"|\S+', query):
+        term = term.replace('"', ' ').strip()
+        if term:
+            parts.append(f'"{term}"*')
+    return " ".join(parts)
+
+
+@dataclass
+class CatalogEntry:
+    """One filed invoice returned by a catalog search."""
+    path: str
+    company: str
+    score: float
+    amounts: List[str]
+    dates: List[str]
+    snippet: str
+
+
+class InvoiceCatalog:
+    """Full-text catalog of the filed invoices (SQLite FTS5).
+
+    Holds the text extracted during analysis together with company, score,
+    amounts and dates, so that invoices can be found without opening them.
+    The catalog follows the files as they are moved; entries whose file has
+    disappeared are dropped when a search returns them.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else DEFAULT_CATALOG_FILE
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invoices ("
+                " id INTEGER PRIMARY KEY,"
+                " path TEXT NOT NULL UNIQUE,"
+                " company TEXT NOT NULL,"
+                " score REAL NOT NULL,"
+                " amounts TEXT NOT NULL,"
+                " dates TEXT NOT NULL,"
+                " filed_at REAL NOT NULL)"
+            )
+            # rowid = invoices.id
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5("
+                " company, file_name, amounts, dates, text,"
+                " tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def add(self, path: str, company: str, score: float, text: str):
+        """Index (or re-index) the invoice filed at `path`."""
+        amounts = extract_amounts(text)
+        dates = extract_dates(text)
+        try:
+            conn = self._connect()
+            try:
+                self._delete(conn, path)
+                cursor = conn.execute(
+                    "INSERT INTO invoices (path, company, score, amounts, dates, filed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, company, score, " ".join(amounts), " ".join(dates), time.time())
+                )
+                conn.execute(
+                    "INSERT INTO invoices_fts (rowid, company, file_name, amounts, dates, text) VALUES (?, ?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, company, os.path.basename(path), " ".join(amounts), " ".join(dates), text)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Invoice catalog error: {e}")
+
+    def move(self, old_path: str, new_path: str):
+        """Follow a file moved from `old_path` to `new_path`."""
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT id FROM invoices WHERE path = ?", (old_path,)).fetchone()
+                if row:
+                    self._delete(conn, new_path)
+                    conn.execute("UPDATE invoices SET path = ? WHERE id = ?", (new_path, row[0]))
+                    conn.execute("UPDATE invoices_fts SET file_name = ? WHERE rowid = ?",
+                                 (os.path.basename(new_path), row[0]))
+                    conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Invoice catalog error: {e}")
+
+    def remove(self, paths: List[str]):
+        try:
+            conn = self._connect()
+            try:
+                for path in paths:
+                    self._delete(conn, path)
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Invoice catalog error: {e}")
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, path: str):
+        row = conn.execute("SELECT id FROM invoices WHERE path = ?", (path,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM invoices_fts WHERE rowid = ?", (row[0],))
+            conn.execute("DELETE FROM invoices WHERE id = ?", (row[0],))
+
+    def search(self, query: str, limit: int = 50) -> List[CatalogEntry]:
+        """Invoices matching every term of `query`, best matches first.
+
+        Terms are matched as prefixes in the company, file name, amounts
+        ("142,50"), dates ("2024-03") and text.
+        """
+        fts_query = match_query(query)
+        if not fts_query:
+            return []
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT i.path, i.company, i.score, i.amounts, i.dates,"
+                    " snippet(invoices_fts, 4, '[', ']', '…', 12)"
+                    " FROM invoices_fts JOIN invoices i ON i.id = invoices_fts.rowid"
+                    " WHERE invoices_fts MATCH ?"
+                    # Company and file name hits rank above body text hits
+                    " ORDER BY bm25(invoices_fts, 5.0, 3.0, 2.0, 2.0, 1.0)"
+                    " LIMIT ?",
+                    (fts_query, limit)
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Invoice catalog error: {e}")
+            return []
+
+        entries = []
+        missing = []
+        for path, company, score, amounts, dates, snippet in rows:
+            if not os.path.exists(path):
+                missing.append(path)
+                continue
+            entries.append(CatalogEntry(path, company, score, amounts.split(), dates.split(), snippet))
+        if missing:
+            self.remove(missing)
+        return entries
+
+    def count(self) -> int:
+        try:
+            conn = self._connect()
+            try:
+                return conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Invoice catalog error: {e}")
+            return 0
@@ -1,40 +1,52 @@
 import os
 import re
+import logging
 import platform
+import functools
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+from typing import Callable, Iterator, List, Dict, Optional, Set, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
 
 from utils.settings_manager import settings
+from utils.invoice_cache import CachedExtraction, ExtractionCache
+from utils.keyword_matcher import KeywordMatcher
+from utils.image_preprocess import preprocess_for_ocr
+from utils.invoice_watcher import DownloadsWatcher
+from utils.invoice_mover import BatchMover
+from utils.duplicate_finder import KnownFileIndex, file_hash
+from utils.invoice_catalog import InvoiceCatalog
+from utils.invoice_timing import collect, stage, timed
+from utils.lazy_import import has_module, lazy_module
+from utils.docx_text import extract_docx_text
+from utils.ocr_batch import TesseractBatch
 
-# PDF Libraries
-try:
-    import pdfplumber
-    HAS_PDFPLUMBER = True
-except ImportError:
-    HAS_PDFPLUMBER = False
+# Scores and company matches, for debugging the detection
+logger = logging.getLogger(__name__)
+
+# Content hashes of the invoices already filed in the invoices folder
+DEFAULT_INVOICES_INDEX_FILE = Path.home() / ".toolbox" / "invoices_index.json"
 
-try:
-    from PyPDF2 import PdfReader
-    HAS_PYPDF2 = True
-except ImportError:
-    HAS_PYPDF2 = False
+# Imported on the first duplicate sent to the trash, never in analysis workers
+send2trash = lazy_module("send2trash")
+
+# Optional libraries are probed without importing them: they are imported
+# when the first document that needs them is analyzed
+# PDF Libraries
+HAS_PDFPLUMBER = has_module("pdfplumber")
+HAS_PYPDF2 = has_module("PyPDF2")
+pdfplumber = lazy_module("pdfplumber")
+PyPDF2 = lazy_module("PyPDF2")
 
 # OCR
-try:
-    import pytesseract
-    from PIL import Image
-    HAS_OCR = True
-except ImportError:
-    HAS_OCR = False
+HAS_OCR = has_module("pytesseract") and has_module("PIL")
+pytesseract = lazy_module("pytesseract")
+Image = lazy_module("PIL.Image")
 
 # Word documents
-try:
-    from docx import Document
-    HAS_DOCX = True
-except ImportError:
-    HAS_DOCX = False
+HAS_DOCX = has_module("docx")
+docx = lazy_module("docx")
 
 
 class FileType(Enum):
@@ -55,11 +67,39 @@ class InvoiceResult:
     extracted_text: str
     detected_keywords: List[str]
     error: Optional[str] = None
+    # Already filed copy of this file in the invoices folder, if any
+    duplicate_of: Optional[str] = None
+    # Extracted text of invoices, for the catalog: the pages the staged
+    # extraction read before deciding, not necessarily the whole document
+    full_text: str = ""
+    # Seconds spent per analysis stage (see utils.invoice_timing)
+    timings: Dict[str, float] = field(default_factory=dict)
 
 
 class InvoiceDetector:
     """Detects invoices and extracts company names from documents."""
     
+    # Bump whenever extraction or scoring changes, to invalidate cached results
+    EXTRACTOR_VERSION = 9
+    
+    # Extensions picked up when scanning the Downloads folder
+    SUPPORTED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.docx'}
+    
+    # Staged PDF extraction: pages are read one at a time and reading stops
+    # once the score is clearly above or clearly below min_score
+    MAX_PDF_PAGES = 5
+    EARLY_ACCEPT_MARGIN = 15
+    # Score ratio of min_score under which the text is rejected after 1, 2 pages
+    EARLY_REJECT_RATIOS = (0.2, 0.4)
+    # Pages with less text (covers, blank pages) never trigger a rejection
+    EARLY_REJECT_MIN_CHARS = 200
+    
+    # Per-page classification: a page needs this many characters in its text
+    # layer to be read as text, otherwise it is OCR'd if images cover enough of it
+    MIN_TEXT_LAYER_CHARS = 20
+    MIN_SCANNED_IMAGE_COVERAGE = 0.3
+    PDF_OCR_RESOLUTION = 200
+    
     # Keywords for invoice detection (French & English)
     INVOICE_KEYWORDS = {
         'facture': 15,
@@ -93,6 +133,20 @@ class InvoiceDetector:
         'payment': 6,
     }
     
+    # Patterns adding to the invoice score: (pattern, weight, keyword)
+    SCORE_PATTERNS = [
+        # Currency amounts (€, $, EUR)
+        (re.compile(r'[\d\s,.]+\s*[€$]|EUR\s*[\d\s,.]+|[\d\s,.]+\s*EUR', re.IGNORECASE), 10, 'montant_€'),
+        # Invoice number pattern
+        (re.compile(r'(facture|invoice|fact|inv)[^\d]{0,10}(\d{4,})', re.IGNORECASE), 10, 'n°_facture'),
+        # SIRET pattern (14 digits)
+        (re.compile(r'\b\d{3}\s?\d{3}\s?\d{3}\s?\d{5}\b'), 8, 'siret'),
+        # Date patterns (common invoice dates)
+        (re.compile(r'\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4}'), 5, 'date'),
+        # IBAN pattern
+        (re.compile(r'\b[A-Z]{2}\d{2}[A-Z0-9]{10,30}\b'), 8, 'iban'),
+    ]
+    
     # Legal entity suffixes for company detection
     LEGAL_ENTITIES = [
         'sarl', 's.a.r.l', 'sas', 's.a.s', 'sa', 's.a', 'eurl', 'e.u.r.l',
@@ -100,6 +154,17 @@ class InvoiceDetector:
         'corp', 'plc', 'ag', 'bv', 'nv'
     ]
     
+    # One or more trailing legal suffixes ("Ovh SAS", "Foo S.A.R.L."). Every
+    # space can only be matched one way, so that names read from untrusted
+    # documents cannot make the search backtrack exponentially
+    LEGAL_SUFFIX_PATTERN = re.compile(
+        r'(?:(?:^|\s+)(?:' + '|'.join(re.escape(e) for e in sorted(LEGAL_ENTITIES, key=len, reverse=True)) + r')\.?)+\s*$',
+        re.IGNORECASE
+    )
+    
+    # Characters not allowed in folder names
+    ILLEGAL_PATH_CHARS = str.maketrans('', '', '<>:"/\\|?*')
+    
     # Known companies (common invoices)
     KNOWN_COMPANIES = {
         'amazon': 'Amazon',
@@ -140,9 +205,26 @@ class InvoiceDetector:
         'digitalocean': 'DigitalOcean',
     }
     
-    def __init__(self, ocr_lang: str = 'eng+fra'):
+    def __init__(self, ocr_lang: str = 'eng+fra', use_cache: bool = True, cache_file: Optional[Path] = None):
         self.ocr_lang = ocr_lang
-        self.min_score = 25  # Minimum score to be considered an invoice
+        self.ocr_preprocess = settings.get("ocr_preprocess", True)
+        # Minimum score to be considered an invoice
+        self.min_score = settings.get("invoice_min_score", 25)
+        self.cache: Optional[ExtractionCache] = ExtractionCache(cache_file) if use_cache else None
+        # Keyword/company matcher and the user companies it was built with,
+        # as (lowercase, display name); reset when the company list changes
+        self._matcher: Optional[Tuple[KeywordMatcher, Tuple[Tuple[str, str], ...]]] = None
+        settings.subscribe(self._on_setting_changed)
+        self.invoice_index = KnownFileIndex(DEFAULT_INVOICES_INDEX_FILE)
+        self.catalog = InvoiceCatalog()
+        # The watcher and scan threads share the index and the catalog
+        self._filed_lock = threading.RLock()
+        # (text, matcher, found terms) of the last match, shared by scoring and company extraction
+        self._last_match: Optional[Tuple[str, KeywordMatcher, Set[str]]] = None
+        # Per-thread flag set when an extractor swallowed an error
+        self._extraction = threading.local()
+        # (invoices folder, mtime, normalized key -> existing folder) for company_folder()
+        self._company_folders: Optional[Tuple[str, int, Dict[str, str]]] = None
     
     @staticmethod
     def get_downloads_folder() -> str:
@@ -170,74 +252,220 @@ class InvoiceDetector:
             return FileType.WORD
         return FileType.UNKNOWN
     
+    def is_conclusive(self, text: str, pages_read: int) -> bool:
+        """Whether the text read so far is clearly an invoice or clearly not one."""
+        raw_score, _, _ = self.calculate_invoice_score(text)
+        if raw_score >= self.min_score + self.EARLY_ACCEPT_MARGIN:
+            return True
+        if pages_read <= len(self.EARLY_REJECT_RATIOS) and len(text.strip()) >= self.EARLY_REJECT_MIN_CHARS:
+            return raw_score < self.min_score * self.EARLY_REJECT_RATIOS[pages_read - 1]
+        return False
+    
+    def _read_pages_staged(self, page_texts, text: str = "", pages_read: int = 0) -> Tuple[str, bool]:
+        """Accumulate lazily extracted page texts until the result is conclusive.
+        
+        Returns the text and whether it became conclusive.
+        """
+        for page_text in page_texts:
+            pages_read += 1
+            if page_text:
+                text += page_text + "\n"
+            if text.strip() and self.is_conclusive(text, pages_read):
+                return text, True
+        return text, False
+    
+    def _has_text_layer(self, page) -> bool:
+        return len(page.chars) >= self.MIN_TEXT_LAYER_CHARS
+    
+    def _is_scanned_page(self, page) -> bool:
+        """A page without text layer whose images cover a good part of it."""
+        page_area = float(page.width * page.height) or 1.0
+        covered = 0.0
+        for image in page.images:
+            width = min(image['x1'], page.width) - max(image['x0'], 0)
+            height = min(image['bottom'], page.height) - max(image['top'], 0)
+            if width > 0 and height > 0:
+                covered += width * height
+        return covered / page_area >= self.MIN_SCANNED_IMAGE_COVERAGE
+    
+    def _ocr_pdf_page(self, page) -> str:
+        try:
+            with stage("rasterize"):
+                img = page.to_image(resolution=self.PDF_OCR_RESOLUTION)
+            return self._ocr_image(img.original)
+        except Exception as e:
+            self._extraction_failed(f"OCR on PDF error: {e}")
+            return ""
+    
+    def _ocr_pdf_pages(self, pages) -> List[str]:
+        """OCR several scanned pages with a single tesseract run."""
+        try:
+            with stage("rasterize"):
+                images = [page.to_image(resolution=self.PDF_OCR_RESOLUTION).original for page in pages]
+            return self._ocr_images(images)
+        except Exception as e:
+            self._extraction_failed(f"OCR on PDF error: {e}")
+            return [""] * len(pages)
+    
+    def _extract_pdf_document(self, pdf) -> str:
+        """Staged extraction from an open pdfplumber document.
+        
+        Text-layer pages are read first; pages without one are set aside
+        and only OCR'd if the text layer was not conclusive, those mostly
+        covered by images (scans) first.
+        """
+        text_pages = []
+        scanned_pages = []
+        # No text layer and little image area: logos, vector or blank pages
+        other_pages = []
+        
+        def text_layer_pages():
+            for number, page in enumerate(pdf.pages[:self.MAX_PDF_PAGES], 1):
+                with stage(f"pdf_text:p{number}"):
+                    page_text = page.extract_text() if self._has_text_layer(page) else None
+                if page_text is not None:
+                    text_pages.append(page)
+                    yield page_text
+                elif self._is_scanned_page(page):
+                    scanned_pages.append(page)
+                else:
+                    other_pages.append(page)
+        
+        text, conclusive = self._read_pages_staged(text_layer_pages())
+        scanned_pages += other_pages
+        if conclusive or not scanned_pages:
+            return text
+        if not HAS_OCR:
+            self._extraction_failed("OCR unavailable, scanned pages skipped")
+            return text
+        
+        # The first scanned page alone often settles it; the remaining
+        # ones share one tesseract run instead of one process per page
+        first, rest = scanned_pages[0], scanned_pages[1:]
+        pages_read = len(text_pages)
+        text, conclusive = self._read_pages_staged([self._ocr_pdf_page(first)], text, pages_read)
+        if conclusive or not rest:
+            return text
+        text, _ = self._read_pages_staged(self._ocr_pdf_pages(rest), text, pages_read + 1)
+        return text
+    
     def extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF using pdfplumber or PyPDF2."""
-        text = ""
+        """Extract text from PDF using pdfplumber, falling back to PyPDF2
+        when pdfplumber is unavailable, fails or finds no text.
         
-        # Try pdfplumber first (better for structured PDFs)
+        The document is opened once. Pages are extracted one by one and
+        scored as they come, so a clear invoice or a clear non-invoice stops
+        after the first page or two. OCR only runs on pages without text
+        layer, and only when the text layer was not conclusive.
+        """
         if HAS_PDFPLUMBER:
             try:
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages[:5]:  # Limit to first 5 pages
-                        page_text = page.extract_text()
-                        if page_text:
-                            text += page_text + "\n"
+                with stage("open"):
+                    pdf = pdfplumber.open(file_path)
+                with pdf:
+                    text = self._extract_pdf_document(pdf)
                 if text.strip():
                     return text
             except Exception as e:
-                print(f"pdfplumber error: {e}")
+                self._extraction_failed(f"pdfplumber error: {e}")
         
-        # Fallback to PyPDF2
+        # Fallback to PyPDF2 (text layer only)
         if HAS_PYPDF2:
             try:
-                reader = PdfReader(file_path)
-                for page in reader.pages[:5]:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                if text.strip():
-                    return text
-            except Exception as e:
-                print(f"PyPDF2 error: {e}")
-        
-        # If no text extracted, try OCR on first page
-        if HAS_OCR and HAS_PDFPLUMBER:
-            try:
-                with pdfplumber.open(file_path) as pdf:
-                    if pdf.pages:
-                        # Convert first page to image
-                        img = pdf.pages[0].to_image(resolution=200)
-                        # OCR the image
-                        text = pytesseract.image_to_string(img.original, lang=self.ocr_lang)
+                with stage("open"):
+                    reader = PyPDF2.PdfReader(file_path)
+                
+                def page_texts():
+                    for number, page in enumerate(reader.pages[:self.MAX_PDF_PAGES], 1):
+                        with stage(f"pypdf2_text:p{number}"):
+                            page_text = page.extract_text()
+                        yield page_text
+                
+                text, _ = self._read_pages_staged(page_texts())
+                return text
             except Exception as e:
-                print(f"OCR on PDF error: {e}")
+                self._extraction_failed(f"PyPDF2 error: {e}")
         
-        return text
+        return ""
+    
+    def _extraction_failed(self, message: str):
+        """Logs an error swallowed by an extractor; the text is then not cached."""
+        print(message)
+        self._extraction.failed = True
     
     def extract_text_from_image(self, file_path: str) -> str:
         """Extract text from image using OCR."""
         if not HAS_OCR:
+            self._extraction_failed("OCR unavailable")
             return ""
         
         try:
-            image = Image.open(file_path)
-            text = pytesseract.image_to_string(image, lang=self.ocr_lang)
-            return text.strip()
+            with stage("open"):
+                image = Image.open(file_path)
+                image.load()
+            return self._ocr_image(image).strip()
         except Exception as e:
-            print(f"OCR error: {e}")
+            self._extraction_failed(f"OCR error: {e}")
             return ""
     
+    def _ocr_image(self, image) -> str:
+        """OCR a PIL image, after the shared preprocessing stage."""
+        if self.ocr_preprocess:
+            with stage("preprocess"):
+                image = preprocess_for_ocr(image)
+        with stage("ocr"):
+            return pytesseract.image_to_string(image, lang=self.ocr_lang)
+    
+    def _ocr_images(self, images) -> List[str]:
+        """OCR several PIL images with a single tesseract process."""
+        if self.ocr_preprocess:
+            with stage("preprocess"):
+                images = [preprocess_for_ocr(image) for image in images]
+        with stage("ocr"):
+            return TesseractBatch(self.ocr_lang).image_to_strings(images)
+    
+    def extract_texts_from_images(self, file_paths: List[str]) -> List[str]:
+        """Extract text from several images using one OCR run."""
+        if not HAS_OCR:
+            self._extraction_failed("OCR unavailable")
+            return [""] * len(file_paths)
+        
+        images = []
+        readable = []
+        for file_path in file_paths:
+            try:
+                with stage("open"), Image.open(file_path) as image:
+                    image.load()
+                    images.append(image.copy())
+                readable.append(True)
+            except Exception as e:
+                self._extraction_failed(f"OCR error: {e}")
+                readable.append(False)
+        
+        try:
+            texts = iter(self._ocr_images(images))
+        except Exception as e:
+            self._extraction_failed(f"OCR error: {e}")
+            return [""] * len(file_paths)
+        return [next(texts).strip() if ok else "" for ok in readable]
+    
+    @timed("docx_text")
     def extract_text_from_docx(self, file_path: str) -> str:
-        """Extract text from Word document."""
+        """Extract text from Word document (headers, body with tables, footers)."""
+        try:
+            return extract_docx_text(file_path, settings.get("invoice_docx_max_chars", 100_000))
+        except (OSError, ValueError) as e:
+            print(f"DOCX fast extraction error, falling back to python-docx: {e}")
+        
         if not HAS_DOCX:
             return ""
         
         try:
-            doc = Document(file_path)
+            doc = docx.Document(file_path)
             text = "\n".join([para.text for para in doc.paragraphs])
             return text
         except Exception as e:
-            print(f"DOCX error: {e}")
+            self._extraction_failed(f"DOCX error: {e}")
             return ""
     
     def extract_text(self, file_path: str) -> Tuple[str, Optional[str]]:
@@ -260,6 +488,37 @@ class InvoiceDetector:
         
         return text, error
     
+    def _on_setting_changed(self, key: str, value):
+        if key == "invoice_companies":
+            self._matcher = None
+        elif key == "invoice_min_score":
+            self.min_score = value
+        elif key == "ocr_preprocess":
+            self.ocr_preprocess = value
+    
+    def _get_matcher(self) -> Tuple[KeywordMatcher, Tuple[Tuple[str, str], ...]]:
+        """Matcher for invoice keywords and company names, built once per company list."""
+        matcher = self._matcher
+        if matcher is None:
+            companies = tuple((company.lower(), company) for company in settings.get_invoice_companies())
+            terms = list(self.INVOICE_KEYWORDS)
+            terms += [lower for lower, _ in companies]
+            terms += list(self.KNOWN_COMPANIES)
+            matcher = (KeywordMatcher(terms), companies)
+            self._matcher = matcher
+        return matcher
+    
+    def _match_terms(self, text: str) -> Set[str]:
+        """All keywords and company names found in the text, in one pass."""
+        matcher = self._get_matcher()[0]
+        last = self._last_match
+        if last and last[1] is matcher and last[0] == text:
+            return last[2]
+        found = matcher.find(text.lower())
+        self._last_match = (text, matcher, found)
+        return found
+    
+    @timed("scoring")
     def calculate_invoice_score(self, text: str) -> Tuple[int, float, List[str]]:
         """Calculate score that document is an invoice.
         
@@ -269,46 +528,27 @@ class InvoiceDetector:
         if not text:
             return 0, 0.0, []
         
-        text_lower = text.lower()
+        found = self._match_terms(text)
         total_score = 0
         detected_keywords = []
         
         for keyword, weight in self.INVOICE_KEYWORDS.items():
-            if keyword in text_lower:
+            if keyword in found:
                 total_score += weight
                 detected_keywords.append(keyword)
         
         # Additional scoring for patterns
-        # Currency amounts (€, $, EUR)
-        if re.search(r'[\d\s,.]+\s*[€$]|EUR\s*[\d\s,.]+|[\d\s,.]+\s*EUR', text, re.IGNORECASE):
-            total_score += 10
-            detected_keywords.append('montant_€')
-        
-        # Invoice number pattern
-        if re.search(r'(facture|invoice|fact|inv)[^\d]{0,10}(\d{4,})', text_lower):
-            total_score += 10
-            detected_keywords.append('n°_facture')
-        
-        # SIRET pattern (14 digits)
-        if re.search(r'\b\d{3}\s?\d{3}\s?\d{3}\s?\d{5}\b', text):
-            total_score += 8
-            detected_keywords.append('siret')
-        
-        # Date patterns (common invoice dates)
-        if re.search(r'\d{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4}', text):
-            total_score += 5
-            detected_keywords.append('date')
-        
-        # IBAN pattern
-        if re.search(r'\b[A-Z]{2}\d{2}[A-Z0-9]{10,30}\b', text):
-            total_score += 8
-            detected_keywords.append('iban')
+        for pattern, weight, keyword in self.SCORE_PATTERNS:
+            if pattern.search(text):
+                total_score += weight
+                detected_keywords.append(keyword)
         
         # Calculate confidence as percentage (50 points = 100% confident)
         confidence = min(total_score / 50.0, 1.0)
         
         return total_score, confidence, detected_keywords
     
+    @timed("company")
     def extract_company_name(self, text: str) -> Optional[str]:
         """Extract company name from document text.
         
@@ -321,57 +561,229 @@ class InvoiceDetector:
         if not text:
             return None
         
-        text_lower = text.lower()
+        found = self._match_terms(text)
         
         # 1. PRIORITY: Check user-defined companies from settings first
-        user_companies = settings.get_invoice_companies()
-        for company in user_companies:
-            # Search for the company name (case insensitive)
-            if company.lower() in text_lower:
-                print(f"[DEBUG] Société trouvée (liste utilisateur): {company}")
+        for lower, company in self._get_matcher()[1]:
+            if lower in found:
+                logger.debug("Société trouvée (liste utilisateur): %s", company)
                 return company
         
         # 2. Check built-in known companies
         for key, name in self.KNOWN_COMPANIES.items():
-            if key in text_lower:
-                print(f"[DEBUG] Société trouvée (liste intégrée): {name}")
+            if key in found:
+                logger.debug("Société trouvée (liste intégrée): %s", name)
                 return name
         
         # 3. If no predefined company found, return None -> will be "Inconnu"
         # We don't try to guess the company name anymore to avoid errors
-        print(f"[DEBUG] Aucune société reconnue, sera classé dans 'Inconnu'")
+        logger.debug("Aucune société reconnue, sera classé dans 'Inconnu'")
         return None
     
     def normalize_company_name(self, name: str) -> str:
-        """Normalize company name for folder creation."""
-        if not name:
-            return "Inconnu"
+        """Normalize company name for folder creation.
         
-        # Remove legal suffixes
-        for entity in self.LEGAL_ENTITIES:
-            name = re.sub(rf'\s*{entity}\s*\.?\s*$', '', name, flags=re.IGNORECASE)
-        
-        # Remove extra whitespace
-        name = ' '.join(name.split())
+        Legal suffixes are dropped ("OVH SAS" -> "Ovh"); use company_folder()
+        to reuse folders created with another spelling.
+        """
+        return _normalize_company_name(name)
+    
+    def company_folder(self, name: Optional[str], invoices_folder: Optional[str] = None) -> str:
+        """Name of the folder to file a company's invoices in.
         
-        # Remove special characters not allowed in folder names
-        name = re.sub(r'[<>:"/\\|?*]', '', name)
+        An existing folder whose name matches case-insensitively, with or
+        without its legal suffix (e.g. "Ovh Sas" filed before suffixes were
+        stripped), is reused; otherwise the normalized name is returned.
+        """
+        normalized = _normalize_company_name(name)
+        folder = invoices_folder or self.get_invoices_folder()
+        try:
+            mtime = os.stat(folder).st_mtime_ns
+        except OSError:
+            return normalized
+        cached = self._company_folders
+        if cached is None or cached[0] != folder or cached[1] != mtime:
+            existing: Dict[str, str] = {}
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in sorted(entries, key=lambda e: e.name):
+                        if entry.is_dir() and not entry.name.startswith('.'):
+                            key = _normalize_company_name(entry.name).lower()
+                            # A folder already named in normalized form wins
+                            if key not in existing or entry.name == _normalize_company_name(entry.name):
+                                existing[key] = entry.name
+            except OSError as e:
+                print(f"Error listing {folder}: {e}")
+            cached = self._company_folders = (folder, mtime, existing)
+        return cached[2].get(normalized.lower(), normalized)
+    
+    def refresh_invoice_index(self, invoices_folder: Optional[str] = None) -> int:
+        """Bring the index of filed invoices up to date; returns the number of files.
         
-        # Capitalize properly
-        name = name.strip().title()
+        Only files added or changed since the last refresh are hashed.
+        """
+        with self._filed_lock:
+            generator = self.invoice_index.build([invoices_folder or self.get_invoices_folder()])
+            try:
+                while True:
+                    next(generator)
+            except StopIteration as e:
+                count = e.value
+            self.invoice_index.save()
+        return count
+    
+    def check_filed(self, file_path: str) -> Optional[InvoiceResult]:
+        """Result for a file already filed in the invoices folder, or None.
         
-        # Limit length
-        if len(name) > 50:
-            name = name[:50]
+        Checked before any extraction: the size is looked up first and the
+        file is only hashed when an indexed invoice has the same size.
+        """
+        with self._filed_lock:
+            copies = self.invoice_index.find_copies(file_path)
+        if not copies:
+            return None
+        return InvoiceResult(
+            file_path=file_path,
+            file_name=os.path.basename(file_path),
+            is_invoice=False,
+            confidence_score=0.0,
+            company_name=os.path.basename(os.path.dirname(copies[0])),
+            extracted_text="",
+            detected_keywords=[],
+            duplicate_of=copies[0],
+        )
+    
+    def find_batch_copies(self, file_paths: List[str]) -> Dict[str, str]:
+        """Files of a batch about to be filed that have the same content as
+        an earlier file of the batch, mapped to that file.
         
-        return name if name else "Inconnu"
+        Only files sharing their size with another one are hashed.
+        """
+        by_size: Dict[int, List[str]] = {}
+        for file_path in file_paths:
+            try:
+                by_size.setdefault(os.path.getsize(file_path), []).append(file_path)
+            except OSError:
+                continue
+        copies = {}
+        for paths in by_size.values():
+            if len(paths) < 2:
+                continue
+            first_by_digest: Dict[str, str] = {}
+            for file_path in paths:
+                try:
+                    first = first_by_digest.setdefault(file_hash(file_path), file_path)
+                except OSError:
+                    continue
+                if first != file_path:
+                    copies[file_path] = first
+        return copies
+    
+    def record_filed(self, moved: List[Tuple[str, str]], results: Optional[Dict[str, InvoiceResult]] = None):
+        """Update the index and the catalog after (source, destination) moves
+        into the invoices folder. `results` maps sources to their analysis,
+        whose text is cataloged; other files keep their catalog entry, if any.
+        """
+        with self._filed_lock:
+            for source, dest in moved:
+                self.invoice_index.remove(source)
+                try:
+                    self.invoice_index.add(dest)
+                except OSError:
+                    pass
+                result = (results or {}).get(source)
+                if result:
+                    self.catalog.add(dest, os.path.basename(os.path.dirname(dest)),
+                                     result.confidence_score, result.full_text)
+                else:
+                    self.catalog.move(source, dest)
+            self.invoice_index.save()
+    
+    def forget_filed(self, paths: List[str]):
+        """Update the index and the catalog after files left the invoices folder."""
+        with self._filed_lock:
+            for path in paths:
+                self.invoice_index.remove(path)
+            self.invoice_index.save()
+            self.catalog.remove(paths)
+    
+    def trash_duplicate(self, result: InvoiceResult) -> Tuple[bool, str]:
+        """Send a file already filed in the invoices folder to the trash."""
+        try:
+            send2trash.send2trash(result.file_path)
+            return True, result.file_path
+        except Exception as e:
+            return False, str(e)
     
     def analyze_file(self, file_path: str) -> InvoiceResult:
         """Analyze a single file to determine if it's an invoice."""
+        return self.analyze_files([file_path])[0]
+    
+    def analyze_files(self, file_paths: List[str]) -> List[InvoiceResult]:
+        """Analyze several files, in order.
+        
+        Images that are not in the cache are OCR'd together by a single
+        tesseract process, which saves its startup and language model
+        loading for every image but the first.
+        """
+        entries = []
+        batch_images = []
+        for file_path in file_paths:
+            # Unchanged content: reuse the text and score of a previous analysis
+            with collect() as lookup_timings, stage("cache"):
+                cache_key = self._cache_key(file_path)
+                cached = self.cache.get(cache_key) if cache_key else None
+            entries.append((file_path, cache_key, cached, lookup_timings))
+            if not cached and self.get_file_type(file_path) == FileType.IMAGE:
+                batch_images.append(file_path)
+        
+        ocr_texts = {}
+        batch_share = {}
+        batch_complete = True
+        if len(batch_images) > 1:
+            self._extraction.failed = False
+            with collect() as batch_timings:
+                ocr_texts = dict(zip(batch_images, self.extract_texts_from_images(batch_images)))
+            batch_complete = not self._extraction.failed
+            # The batch run is shared equally between its images
+            batch_share = {name: seconds / len(batch_images) for name, seconds in batch_timings.items()}
+        
+        results = []
+        for file_path, cache_key, cached, lookup_timings in entries:
+            with collect() as timings:
+                result = self._analyze(file_path, cache_key, cached, ocr_texts.get(file_path), batch_complete)
+            shares = [lookup_timings, batch_share if file_path in ocr_texts else {}]
+            for share in shares:
+                for name, seconds in share.items():
+                    timings[name] = timings.get(name, 0.0) + seconds
+            result.timings = timings
+            results.append(result)
+        return results
+    
+    def _analyze(self, file_path: str, cache_key: Optional[str],
+                 cached: Optional[CachedExtraction], ocr_text: Optional[str] = None,
+                 ocr_complete: bool = True) -> InvoiceResult:
         file_name = os.path.basename(file_path)
         
-        # Extract text
-        text, error = self.extract_text(file_path)
+        if cached:
+            text, error = cached.text, None
+            raw_score, confidence, keywords = cached.raw_score, cached.confidence, cached.keywords
+        else:
+            # Extract text, unless already OCR'd as part of a batch
+            if ocr_text is not None:
+                text, error, complete = ocr_text, None, ocr_complete
+            else:
+                self._extraction.failed = False
+                text, error = self.extract_text(file_path)
+                complete = not self._extraction.failed
+            
+            if not error:
+                # Calculate invoice score
+                raw_score, confidence, keywords = self.calculate_invoice_score(text)
+                # Failed or partial extractions are retried next time (e.g.
+                # once tesseract is installed) instead of being cached
+                if cache_key and complete and text.strip():
+                    self.cache.put(cache_key, CachedExtraction(text, raw_score, confidence, keywords))
         
         if error:
             return InvoiceResult(
@@ -398,12 +810,10 @@ class InvoiceDetector:
                 error="Aucun texte extrait du document"
             )
         
-        # Calculate invoice score
-        raw_score, confidence, keywords = self.calculate_invoice_score(text)
         is_invoice = raw_score >= self.min_score
         
-        # Debug output
-        print(f"[DEBUG] {file_name}: score={raw_score}, confidence={confidence:.0%}, keywords={keywords[:5]}")
+        logger.debug("%s: score=%s, confidence=%.0f%%, keywords=%s",
+                     file_name, raw_score, confidence * 100, keywords[:5])
         
         # Extract company name if it's an invoice
         company_name = None
@@ -419,50 +829,149 @@ class InvoiceDetector:
             confidence_score=confidence,
             company_name=company_name,
             extracted_text=text[:500] if text else "",  # Preview only
-            detected_keywords=keywords
+            detected_keywords=keywords,
+            full_text=text if is_invoice else "",
         )
     
-    def scan_downloads_folder(self) -> List[str]:
+    def _cache_key(self, file_path: str) -> Optional[str]:
+        """Cache key for the file content, or None if caching is off or the file is unreadable."""
+        if not self.cache or self.get_file_type(file_path) == FileType.UNKNOWN:
+            return None
+        try:
+            content_hash = ExtractionCache.content_hash(file_path)
+        except OSError:
+            return None
+        ocr_profile = f"{self.ocr_lang}:pre" if self.ocr_preprocess else self.ocr_lang
+        if self.get_file_type(file_path) == FileType.PDF:
+            # Staged reading stops relative to min_score: the pages read,
+            # hence the text, depend on it
+            ocr_profile += f":s{self.min_score}"
+        return ExtractionCache.make_key(content_hash, ocr_profile, self.EXTRACTOR_VERSION)
+    
+    def scan_downloads_folder(self, folder: Optional[str] = None) -> List[str]:
         """Scan downloads folder and return list of supported files."""
-        downloads = self.get_downloads_folder()
-        supported_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.docx'}
-        files = []
-        
-        if not os.path.exists(downloads):
-            return files
-        
-        for item in os.listdir(downloads):
-            item_path = os.path.join(downloads, item)
-            if os.path.isfile(item_path):
-                ext = os.path.splitext(item)[1].lower()
-                if ext in supported_extensions:
-                    files.append(item_path)
-        
-        return files
+        return list(self.iter_downloads_folder(folder))
+    
+    def iter_downloads_folder(self, folder: Optional[str] = None, recursive: Optional[bool] = None,
+                              max_depth: Optional[int] = None, skip_folder: Optional[str] = None) -> Iterator[str]:
+        """Yield supported files of the downloads folder as they are found.
+        
+        Uses os.scandir, whose entries already know their type, so no extra
+        stat per file. Subfolders are walked up to `max_depth` levels deep
+        (settings "invoice_scan_recursive" and "invoice_scan_max_depth" by
+        default); hidden folders and the invoices folder (or `skip_folder`)
+        are skipped.
+        """
+        folder = folder or self.get_downloads_folder()
+        if recursive is None:
+            recursive = settings.get("invoice_scan_recursive", True)
+        if max_depth is None:
+            max_depth = settings.get("invoice_scan_max_depth", 3)
+        if not recursive:
+            max_depth = 0
+        invoices_folder = os.path.normcase(os.path.abspath(skip_folder or self.get_invoices_folder()))
+        
+        stack = [(folder, 0)]
+        while stack:
+            directory, depth = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    subdirs = []
+                    for entry in entries:
+                        try:
+                            if entry.is_file():
+                                if os.path.splitext(entry.name)[1].lower() in self.SUPPORTED_EXTENSIONS:
+                                    yield entry.path
+                            elif (depth < max_depth and not entry.name.startswith('.')
+                                    and entry.is_dir(follow_symlinks=False)
+                                    and os.path.normcase(os.path.abspath(entry.path)) != invoices_folder):
+                                subdirs.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError as e:
+                print(f"Scan error in {directory}: {e}")
+                continue
+            # Files of a folder come before those of its subfolders
+            stack.extend((subdir, depth + 1) for subdir in reversed(subdirs))
+    
+    def watch_downloads(self, on_result: Optional[Callable[[InvoiceResult, Optional[str]], None]] = None,
+                        folder: Optional[str] = None, auto_move: bool = True, engine=None) -> DownloadsWatcher:
+        """Start sorting new downloads as they arrive.
+        
+        Each new file is analyzed once, when completely downloaded, and moved
+        to its company folder if it is an invoice and `auto_move` is set.
+        `on_result(result, dest_path)` is then called from the watcher
+        thread, with dest_path None if the file was not moved. The index of
+        filed invoices is refreshed in that thread before the first file.
+        
+        Files are analyzed by `engine` (an InvoiceAnalysisEngine, one worker
+        by default), under the same time and memory limits as a scan.
+        """
+        if engine is None:
+            # Imported here: the engine module builds on this one
+            from utils.invoice_engine import InvoiceAnalysisEngine
+            engine = InvoiceAnalysisEngine(self, workers=1)
+        
+        def handle(file_path: str):
+            # A second download of a filed invoice is not analyzed again
+            results = list(engine.analyze([file_path]))
+            if not results:
+                return
+            result = results[0]
+            dest_path = None
+            if result.duplicate_of and settings.get("invoice_trash_duplicates", False):
+                self.trash_duplicate(result)
+            elif auto_move and result.is_invoice:
+                success, message = self.move_invoice(file_path, self.company_folder(result.company_name),
+                                                     result=result)
+                if success:
+                    dest_path = message
+                else:
+                    print(f"Error moving {result.file_name}: {message}")
+            if on_result:
+                on_result(result, dest_path)
+        
+        watcher = DownloadsWatcher(folder or self.get_downloads_folder(), handle, self.SUPPORTED_EXTENSIONS,
+                                   on_start=self.refresh_invoice_index)
+        watcher.start()
+        return watcher
     
-    def move_invoice(self, file_path: str, company_name: str) -> Tuple[bool, str]:
-        """Move invoice to the appropriate folder."""
+    def move_invoice(self, file_path: str, company_name: str, invoices_folder: Optional[str] = None,
+                     result: Optional[InvoiceResult] = None) -> Tuple[bool, str]:
+        """Move invoice to the appropriate folder (under the invoices folder by default).
+        
+        The text of `result`, if given, is cataloged with the moved file.
+        """
         try:
-            invoices_folder = self.get_invoices_folder()
-            company_folder = os.path.join(invoices_folder, company_name)
-            
-            # Create folders if needed
-            os.makedirs(company_folder, exist_ok=True)
-            
-            # Handle duplicate filenames
-            file_name = os.path.basename(file_path)
-            dest_path = os.path.join(company_folder, file_name)
-            
-            counter = 1
-            base_name, ext = os.path.splitext(file_name)
-            while os.path.exists(dest_path):
-                dest_path = os.path.join(company_folder, f"{base_name}_{counter}{ext}")
-                counter += 1
-            
-            # Move the file
-            os.rename(file_path, dest_path)
-            
-            return True, dest_path
+            mover = BatchMover(invoices_folder or self.get_invoices_folder())
+            outcome = next(mover.run(mover.plan([(file_path, company_name)]), journal=False))
+            if not outcome.success:
+                return False, outcome.error
+            self.record_filed([(outcome.source, outcome.dest)], {outcome.source: result} if result else None)
+            return True, outcome.dest
         except Exception as e:
             return False, str(e)
 
+
+@functools.lru_cache(maxsize=1024)
+def _normalize_company_name(name: Optional[str]) -> str:
+    """Memoized body of InvoiceDetector.normalize_company_name: the same
+    few companies come back for most invoices."""
+    if not name:
+        return "Inconnu"
+    
+    # Remove extra whitespace, then legal suffixes
+    name = ' '.join(name.split())
+    name = InvoiceDetector.LEGAL_SUFFIX_PATTERN.sub('', name)
+    
+    # Remove special characters not allowed in folder names
+    name = name.translate(InvoiceDetector.ILLEGAL_PATH_CHARS)
+    
+    # Capitalize properly
+    name = name.strip().title()
+    
+    # Limit length
+    if len(name) > 50:
+        name = name[:50]
+    
+    return name if name else "Inconnu"
@@ -0,0 +1,193 @@
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+from utils.invoice_detector import InvoiceDetector, InvoiceResult, FileType
+from utils.settings_manager import settings
+from utils.worker_pool import MB, SupervisedPool
+
+
+# End of the discovered files in the discovery queue
+_END = object()
+
+# Detector living in each worker process (set by _init_worker)
+_worker_detector: Optional[InvoiceDetector] = None
+
+
+def _init_worker(ocr_lang: str, min_score: int, cache_file: Optional[str]):
+    global _worker_detector
+    # Workers start fresh: the cache database of the parent's detector is passed explicitly
+    _worker_detector = InvoiceDetector(ocr_lang, use_cache=cache_file is not None, cache_file=cache_file)
+    _worker_detector.min_score = min_score
+
+
+def _analyze_in_worker(file_paths: List[str]) -> List[InvoiceResult]:
+    return _worker_detector.analyze_files(file_paths)
+
+
+def default_worker_count() -> int:
+    """Worker count from settings, or one per CPU core left to the UI."""
+    workers = settings.get("invoice_workers", 0)
+    if workers and workers > 0:
+        return workers
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def failed_result(file_path: str, error: str) -> InvoiceResult:
+    return InvoiceResult(
+        file_path=file_path,
+        file_name=os.path.basename(file_path),
+        is_invoice=False,
+        confidence_score=0.0,
+        company_name=None,
+        extracted_text="",
+        detected_keywords=[],
+        error=error
+    )
+
+
+class InvoiceAnalysisEngine:
+    """Analyzes documents in a pool of worker processes.
+
+    Text extraction and OCR are CPU-bound, so threads would serialize on the
+    GIL. Results are yielded in completion order, not submission order.
+    Images are sent to the workers in small batches so each worker OCRs
+    them with a single tesseract process. Files already filed in the
+    invoices folder are reported without being analyzed.
+
+    Workers are supervised: a file taking longer than `timeout` seconds, or
+    a worker going above `max_memory_mb`, gets the worker killed and the
+    file reported as failed. The other files of a killed image batch are
+    analyzed again one by one.
+    """
+
+    IMAGE_BATCH_SIZE = 4
+    # Discovered files waiting for a worker
+    DISCOVERY_QUEUE_SIZE = 256
+
+    def __init__(self, detector: InvoiceDetector, workers: Optional[int] = None,
+                 timeout: Optional[float] = None, max_memory_mb: Optional[int] = None):
+        self.detector = detector
+        self.workers = workers or default_worker_count()
+        # 0 disables the limit
+        self.timeout = timeout if timeout is not None else settings.get("invoice_file_timeout", 120)
+        self.max_memory_mb = max_memory_mb if max_memory_mb is not None else settings.get("invoice_max_memory_mb", 1536)
+        self._cancel_event = threading.Event()
+        # Files analyzed before the index of filed invoices was ready (see analyze())
+        self.unchecked_files: List[str] = []
+
+    def cancel(self):
+        """Stops submitting files and drops the ones not started yet."""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def _discover(self, files: Iterable[str], source: "queue.Queue", stop: threading.Event):
+        """Producer: feeds the discovered files into the bounded queue."""
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    source.put(item, timeout=0.2)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for file_path in files:
+                if not put(file_path):
+                    return
+        except Exception as e:
+            print(f"File discovery error: {e}")
+        put(_END)
+
+    def analyze(self, files: Iterable[str], filed_index_ready: Optional[threading.Event] = None) -> Iterator[InvoiceResult]:
+        """Yields one InvoiceResult per file, as soon as each one is ready.
+
+        `files` is consumed by a discovery thread into a bounded queue, so it
+        may be a generator still walking the folders: analysis starts with
+        the first file found, and slow discovery never holds back results.
+
+        With `filed_index_ready`, the index of filed invoices is still being
+        refreshed: until the event is set, files are analyzed without the
+        duplicate check and listed in `unchecked_files` for a later one.
+        """
+        self._cancel_event.clear()
+        self.unchecked_files = []
+        max_in_flight = self.workers * 2
+        source: "queue.Queue" = queue.Queue(maxsize=self.DISCOVERY_QUEUE_SIZE)
+        stop = threading.Event()
+        threading.Thread(target=self._discover, args=(files, source, stop), daemon=True).start()
+
+        pool = SupervisedPool(
+            self.workers,
+            initializer=_init_worker,
+            initargs=(self.detector.ocr_lang, self.detector.min_score,
+                      str(self.detector.cache.db_path) if self.detector.cache else None),
+            max_rss=self.max_memory_mb * MB if self.max_memory_mb else None,
+        )
+        pending = {}
+
+        def submit(batch: List[str]):
+            # The timeout applies per file
+            timeout = self.timeout * len(batch) if self.timeout else None
+            pending[pool.submit(_analyze_in_worker, batch, timeout=timeout)] = batch
+
+        image_batch = []
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < max_in_flight and not self.cancelled:
+                    try:
+                        # Only wait for discovery when there is nothing else to do
+                        file_path = source.get(block=not pending and not image_batch, timeout=0.2)
+                    except queue.Empty:
+                        break
+                    if file_path is _END:
+                        exhausted = True
+                        break
+                    # Copies of invoices already filed skip the workers entirely
+                    if filed_index_ready is None or filed_index_ready.is_set():
+                        filed = self.detector.check_filed(file_path)
+                        if filed:
+                            yield filed
+                            continue
+                    else:
+                        self.unchecked_files.append(file_path)
+                    if self.detector.get_file_type(file_path) == FileType.IMAGE:
+                        image_batch.append(file_path)
+                        if len(image_batch) < self.IMAGE_BATCH_SIZE:
+                            continue
+                        batch, image_batch = image_batch, []
+                    else:
+                        batch = [file_path]
+                    submit(batch)
+
+                # A partial batch goes out once no more files are coming or
+                # the workers would otherwise sit idle
+                if image_batch and (exhausted or not pending) and not self.cancelled:
+                    submit(image_batch)
+                    image_batch = []
+
+                if self.cancelled or (exhausted and not pending):
+                    break
+                if not pending:
+                    continue
+
+                for job in pool.poll(timeout=0.2):
+                    batch = pending.pop(job.job_id)
+                    if job.killed and len(batch) > 1:
+                        # Find out which file of the batch was at fault
+                        for file_path in batch:
+                            submit([file_path])
+                    elif job.error is not None:
+                        yield from (failed_result(file_path, job.error) for file_path in batch)
+                    else:
+                        yield from job.value
+        finally:
+            stop.set()
+            # Also stops files still being analyzed
+            pool.shutdown()
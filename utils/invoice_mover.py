@@ -0,0 +1,350 @@
+"""
+Journaled batch moves
+Plans the destination of a whole batch of invoices in memory, moves them with
+a rename that never overwrites (hard link + unlink) on the same device or
+copy + fsync + unlink across devices, and records every step in a journal so
+a sort can be undone or resumed after a crash.
+"""
+
+import errno
+import filecmp
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+DEFAULT_JOURNAL_DIR = Path.home() / ".toolbox" / "journals"
+
+# Suffix of a cross-device copy not yet complete
+PARTIAL_SUFFIX = ".toolbox-partial"
+# Finished journals kept for undo, most recent first
+JOURNALS_KEPT = 20
+
+
+@dataclass
+class PlannedMove:
+    source: str
+    dest: str
+
+
+@dataclass
+class MoveOutcome:
+    source: str
+    dest: str
+    error: Optional[str] = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
+class _Journal:
+    """Append-only JSON lines file describing one batch of moves."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, *records: Dict, sync: bool = False):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def read(self) -> Tuple[List[PlannedMove], Set[str], Set[str], Set[str]]:
+        """(planned moves, sources moved, sources moved back, ops finished)."""
+        # A source planned again (destination taken meanwhile) keeps its last destination
+        moves: Dict[str, PlannedMove] = {}
+        done, undone, finished = set(), set(), set()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line cut short by a crash
+                        continue
+                    op = record.get("op")
+                    if op == "move":
+                        moves[record["src"]] = PlannedMove(record["src"], record["dst"])
+                    elif op == "done":
+                        done.add(record["src"])
+                    elif op == "undone":
+                        undone.add(record["src"])
+                    elif op in ("end", "undo_end"):
+                        finished.add(op)
+        except OSError as e:
+            print(f"Error reading journal {self.path}: {e}")
+        return list(moves.values()), done, undone, finished
+
+
+def _unlink_or_roll_back(source: str, dest: str):
+    """Removes `source` once `dest` holds its content; if that fails (file
+    open on Windows), removes `dest` again so the file is in one place."""
+    try:
+        os.unlink(source)
+    except OSError:
+        try:
+            os.unlink(dest)
+        except OSError as e:
+            print(f"Error rolling back {dest}: {e}")
+        raise
+
+
+def _rename_no_clobber(source: str, dest: str):
+    """os.replace that raises FileExistsError instead of overwriting `dest`."""
+    try:
+        os.link(source, dest)
+    except OSError as e:
+        if e.errno in (errno.EEXIST, errno.EXDEV):
+            raise
+        # No hard links on this file system (FAT, some network shares)
+        if os.path.lexists(dest):
+            raise FileExistsError(errno.EEXIST, "Destination already exists", dest)
+        os.replace(source, dest)
+        return
+    _unlink_or_roll_back(source, dest)
+
+
+class BatchMover:
+    """Moves files into per-company folders of the invoices folder."""
+
+    def __init__(self, invoices_folder: str, journal_dir: Optional[Path] = None, copy_workers: int = 4):
+        self.invoices_folder = invoices_folder
+        self.journal_dir = Path(journal_dir) if journal_dir else DEFAULT_JOURNAL_DIR
+        self.copy_workers = copy_workers
+        self.journal_path: Optional[Path] = None
+        self._devices: Dict[str, int] = {}
+
+    # Planning
+    def plan(self, items: Iterable[Tuple[str, str]]) -> List[PlannedMove]:
+        """Destinations for (file path, company folder name) pairs.
+
+        Each company folder is listed once; name clashes with existing files
+        and within the batch get a _1, _2... suffix, as move_invoice did.
+        """
+        taken: Dict[str, Set[str]] = {}
+        moves = []
+        for file_path, company in items:
+            folder = os.path.join(self.invoices_folder, company)
+            names = taken.get(folder)
+            if names is None:
+                try:
+                    names = {name.lower() for name in os.listdir(folder)}
+                except OSError:
+                    names = set()
+                taken[folder] = names
+
+            file_name = os.path.basename(file_path)
+            base_name, ext = os.path.splitext(file_name)
+            candidate, counter = file_name, 1
+            while candidate.lower() in names:
+                candidate = f"{base_name}_{counter}{ext}"
+                counter += 1
+            names.add(candidate.lower())
+            moves.append(PlannedMove(file_path, os.path.join(folder, candidate)))
+        return moves
+
+    # Moving
+    def run(self, moves: List[PlannedMove], journal: bool = True) -> Iterator[MoveOutcome]:
+        """Executes the planned moves and yields one outcome per file.
+
+        With `journal`, the plan is written (and synced) before the first
+        move and each completed move is appended, see undo() and resume().
+        """
+        log = None
+        if journal and moves:
+            self.journal_dir.mkdir(parents=True, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+            self.journal_path = self.journal_dir / f"sort-{stamp}.jsonl"
+            log = _Journal(self.journal_path)
+            log.write(*({"op": "move", "src": m.source, "dst": m.dest} for m in moves), sync=True)
+
+        yield from self._execute(moves, log, "done", replan=True)
+        if log:
+            log.write({"op": "end"})
+            self.prune_journals()
+
+    def resume(self, journal_path: Path) -> Iterator[MoveOutcome]:
+        """Finishes a batch interrupted by a crash."""
+        log = _Journal(Path(journal_path))
+        moves, done, _, finished = log.read()
+        if "end" not in finished:
+            yield from self._execute([m for m in moves if m.source not in done], log, "done", recover=True)
+            log.write({"op": "end"})
+
+    def undo(self, journal_path: Optional[Path] = None) -> Iterator[MoveOutcome]:
+        """Moves the files of a batch back where they came from (the last one by default)."""
+        journal_path = journal_path or self.last_journal()
+        if journal_path is None:
+            return
+        log = _Journal(Path(journal_path))
+        moves, done, undone, _ = log.read()
+        back = []
+        for m in reversed(moves):
+            if m.source not in done or m.source in undone:
+                continue
+            if os.path.exists(m.source) and os.path.exists(m.dest):
+                # Never overwrite a file that took the original place
+                yield MoveOutcome(m.dest, m.source, f"Destination already exists: {m.source}")
+                continue
+            back.append(PlannedMove(m.dest, m.source))
+        yield from self._execute(back, log, "undone", key=lambda move: move.dest, recover=True)
+        log.write({"op": "undo_end"})
+        # Company folders emptied by the undo
+        for folder in {os.path.dirname(move.source) for move in back}:
+            try:
+                os.rmdir(folder)
+            except OSError:
+                pass
+
+    def _execute(self, moves: List[PlannedMove], log: Optional[_Journal], op: str,
+                 key=lambda move: move.source, recover: bool = False,
+                 replan: bool = False) -> Iterator[MoveOutcome]:
+        """Moves the files, journaling `op` for each success.
+
+        Existing files are never overwritten: with `replan`, a file that
+        appeared at a destination since plan() gets the move the next free
+        _N name, otherwise the move fails. With `recover`, a failed move is
+        checked against what a previous interrupted run may already have done.
+        """
+        for folder in {os.path.dirname(move.dest) for move in moves}:
+            os.makedirs(folder, exist_ok=True)
+
+        def record(move: PlannedMove, error: Optional[Exception]) -> MoveOutcome:
+            message = None
+            if error is not None:
+                message = self._recover(move) if recover else str(error)
+            if message is None and log:
+                log.write({"op": op, "src": key(move)})
+            return MoveOutcome(move.source, move.dest, message)
+
+        cross_device = []
+        for move in moves:
+            try:
+                if self._same_device(move.source, move.dest):
+                    self._place(move.source, move, log, replan)
+                    yield record(move, None)
+                else:
+                    cross_device.append(move)
+            except OSError as e:
+                if e.errno == errno.EXDEV:
+                    cross_device.append(move)
+                else:
+                    yield record(move, e)
+
+        if not cross_device:
+            return
+        with ThreadPoolExecutor(max_workers=self.copy_workers) as pool:
+            futures = {pool.submit(self._copy_then_unlink, move, log, replan): move for move in cross_device}
+            for future in as_completed(futures):
+                move = futures[future]
+                try:
+                    future.result()
+                    yield record(move, None)
+                except OSError as e:
+                    yield record(move, e)
+
+    def _same_device(self, source: str, dest: str) -> bool:
+        return self._device(os.path.dirname(os.path.abspath(source))) == self._device(os.path.dirname(dest))
+
+    def _device(self, folder: str) -> int:
+        device = self._devices.get(folder)
+        if device is None:
+            device = os.stat(folder).st_dev
+            self._devices[folder] = device
+        return device
+
+    @staticmethod
+    def _place(path: str, move: PlannedMove, log: Optional[_Journal], replan: bool):
+        """Renames `path` to the destination of `move`, planning the next
+        free name (journaled before use) when `replan` and it is taken."""
+        while True:
+            try:
+                _rename_no_clobber(path, move.dest)
+                return
+            except FileExistsError:
+                if not replan:
+                    raise
+            folder = os.path.dirname(move.dest)
+            base_name, ext = os.path.splitext(os.path.basename(move.source))
+            counter = 1
+            while os.path.lexists(os.path.join(folder, f"{base_name}_{counter}{ext}")):
+                counter += 1
+            move.dest = os.path.join(folder, f"{base_name}_{counter}{ext}")
+            if log:
+                log.write({"op": "move", "src": move.source, "dst": move.dest}, sync=True)
+
+    def _copy_then_unlink(self, move: PlannedMove, log: Optional[_Journal], replan: bool):
+        partial = move.dest + PARTIAL_SUFFIX
+        with open(move.source, 'rb') as src, open(partial, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            dst.flush()
+            os.fsync(dst.fileno())
+        shutil.copystat(move.source, partial)
+        try:
+            self._place(partial, move, log, replan)
+        except OSError:
+            os.unlink(partial)
+            raise
+        _unlink_or_roll_back(move.source, move.dest)
+
+    @staticmethod
+    def _recover(move: PlannedMove) -> Optional[str]:
+        """On resume, a move may already be complete or half done.
+
+        Returns None if the file ended up at its destination, an error
+        message otherwise.
+        """
+        if not os.path.exists(move.source) and os.path.exists(move.dest):
+            return None
+        if os.path.exists(move.source) and os.path.exists(move.dest):
+            # Copied (or linked) but not unlinked: the copy was synced before
+            # the rename. Any other file there is left alone with the source.
+            try:
+                if filecmp.cmp(move.source, move.dest, shallow=False):
+                    os.unlink(move.source)
+                    return None
+            except OSError as e:
+                return str(e)
+            return f"Destination already exists: {move.dest}"
+        return None if os.path.exists(move.dest) else f"File not found: {move.source}"
+
+    # Journals
+    def journals(self) -> List[Path]:
+        """All journals, oldest first."""
+        if not self.journal_dir.exists():
+            return []
+        return sorted(self.journal_dir.glob("sort-*.jsonl"))
+
+    def last_journal(self) -> Optional[Path]:
+        """Most recent batch that still has moves to undo."""
+        for path in reversed(self.journals()):
+            moves, done, undone, _ = _Journal(path).read()
+            if done - undone:
+                return path
+        return None
+
+    def incomplete_journals(self) -> List[Path]:
+        """Batches interrupted before their end, to pass to resume()."""
+        return [path for path in self.journals() if "end" not in _Journal(path).read()[3]]
+
+    def prune_journals(self, keep: int = JOURNALS_KEPT):
+        """Deletes finished journals but the `keep` most recent ones.
+
+        Interrupted batches are kept until resumed.
+        """
+        for path in self.journals()[:-keep or None]:
+            if "end" in _Journal(path).read()[3]:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    print(f"Error deleting journal {path}: {e}")
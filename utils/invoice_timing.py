@@ -0,0 +1,154 @@
+"""
+Invoice analysis timings
+Per-file, per-stage durations collected while a document is analyzed, and a
+report aggregating them over a scan with percentiles.
+"""
+
+import functools
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_TIMINGS_DIR = Path.home() / ".toolbox" / "timings"
+
+# Stages, in pipeline order. A stage may be suffixed with a page number
+# ("pdf_text:p2"); the report folds pages into their stage.
+STAGES = [
+    "cache", "open", "pdf_text", "pypdf2_text", "rasterize", "preprocess",
+    "ocr", "docx_text", "scoring", "company", "total",
+]
+
+_current = threading.local()
+
+
+@contextmanager
+def collect() -> Iterator[Dict[str, float]]:
+    """Collects the stages timed in this thread into the returned dict."""
+    previous = getattr(_current, "timings", None)
+    timings: Dict[str, float] = {}
+    _current.timings = timings
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings["total"] = time.perf_counter() - start
+        _current.timings = previous
+
+
+@contextmanager
+def stage(name: str):
+    """Adds the time spent in the block to `name`, if collecting."""
+    timings = getattr(_current, "timings", None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def timed(name: str):
+    """Decorator timing every call of the function as stage `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class TimingReport:
+    """Aggregates the timings of the files of a scan."""
+
+    def __init__(self):
+        # (file path, file type, timings)
+        self.files: List[tuple] = []
+
+    def add(self, file_path: str, timings: Dict[str, float]):
+        if timings:
+            self.files.append((file_path, file_path.rsplit('.', 1)[-1].lower(), timings))
+
+    @staticmethod
+    def _by_stage(timings: Dict[str, float]) -> Dict[str, float]:
+        stages: Dict[str, float] = {}
+        for name, seconds in timings.items():
+            base = name.split(":", 1)[0]
+            stages[base] = stages.get(base, 0.0) + seconds
+        return stages
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Per stage: files, total, mean, p50, p90, p99 and max seconds."""
+        values: Dict[str, List[float]] = {}
+        for _, _, timings in self.files:
+            for name, seconds in self._by_stage(timings).items():
+                values.setdefault(name, []).append(seconds)
+        order = {name: i for i, name in enumerate(STAGES)}
+        summary = {}
+        for name in sorted(values, key=lambda n: (order.get(n, len(STAGES)), n)):
+            stage_values = sorted(values[name])
+            summary[name] = {
+                "files": len(stage_values),
+                "total": sum(stage_values),
+                "mean": sum(stage_values) / len(stage_values),
+                "p50": percentile(stage_values, 50),
+                "p90": percentile(stage_values, 90),
+                "p99": percentile(stage_values, 99),
+                "max": stage_values[-1],
+            }
+        return summary
+
+    def slowest(self, count: int = 10) -> List[Dict]:
+        """The slowest files, with their slowest stage."""
+        rows = []
+        for file_path, file_type, timings in self.files:
+            stages = self._by_stage(timings)
+            total = stages.pop("total", sum(stages.values()))
+            top = max(stages, key=stages.get) if stages else None
+            rows.append({"path": file_path, "type": file_type, "total": total,
+                         "slowest_stage": top, "stages": timings})
+        rows.sort(key=lambda row: row["total"], reverse=True)
+        return rows[:count]
+
+    def as_dict(self) -> Dict:
+        return {
+            "files": len(self.files),
+            "stages": self.stage_summary(),
+            "slowest_files": self.slowest(),
+            "per_file": [{"path": p, "type": t, "timings": timings} for p, t, timings in self.files],
+        }
+
+    def summary_text(self, stages: int = 3) -> str:
+        """One line naming the stages where most of the time went."""
+        summary = self.stage_summary()
+        summary.pop("total", None)
+        if not summary:
+            return ""
+        busiest = sorted(summary.items(), key=lambda item: item[1]["total"], reverse=True)[:stages]
+        return " · ".join(
+            f"{name} {s['total']:.1f}s (p50 {s['p50'] * 1000:.0f} ms, p90 {s['p90'] * 1000:.0f} ms)"
+            for name, s in busiest
+        )
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        """Writes the report as JSON (in DEFAULT_TIMINGS_DIR by default)."""
+        if path is None:
+            DEFAULT_TIMINGS_DIR.mkdir(parents=True, exist_ok=True)
+            path = DEFAULT_TIMINGS_DIR / f"scan-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2, ensure_ascii=False)
+        return Path(path)
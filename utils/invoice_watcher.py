@@ -0,0 +1,210 @@
+"""
+Downloads watcher
+Reports new files of a folder once they are completely written, so they can
+be sorted as they arrive. Uses inotify on Linux and falls back to comparing
+os.scandir snapshots elsewhere.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+# Suffixes of files browsers are still downloading
+TEMP_SUFFIXES = ('.part', '.crdownload', '.tmp', '.download', '.partial', '.opdownload')
+
+# inotify event masks (sys/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+_EVENT_HEADER = struct.Struct('iIII')
+
+# (size, mtime_ns) of a file
+Signature = Tuple[int, int]
+
+
+def _stat_signature(path: str) -> Optional[Signature]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class _Inotify:
+    """Minimal inotify binding through ctypes (Linux only)."""
+
+    def __init__(self, folder: str):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {folder}")
+
+    def read(self, timeout: float) -> Iterable[str]:
+        """Names of the files with events, waiting at most `timeout` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        names = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.append(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DownloadsWatcher:
+    """Calls `on_file(path)` once for every new complete file of `folder`.
+
+    Files already present when the watcher starts are ignored. A file is
+    reported once its size has not changed for `settle_seconds` and no
+    browser temporary file (.part, .crdownload...) remains for it. A file
+    is reported again only if its content changes. `on_start()`, if given,
+    runs first in the watcher thread (slow preparation kept off the caller).
+    """
+
+    def __init__(self, folder: str, on_file: Callable[[str], None],
+                 extensions: Optional[Set[str]] = None,
+                 settle_seconds: float = 2.0, poll_interval: float = 1.0,
+                 use_inotify: bool = True, on_start: Optional[Callable[[], None]] = None):
+        self.folder = folder
+        self.on_file = on_file
+        self.on_start = on_start
+        self.extensions = {ext.lower() for ext in extensions} if extensions else None
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith('linux')
+        self.backend = None
+        self._handled: Dict[str, Signature] = {}
+        # path -> (last signature seen, time it was first seen unchanged)
+        self._candidates: Dict[str, Tuple[Signature, float]] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._handled = self._snapshot()
+        self._candidates.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _is_watched(self, name: str) -> bool:
+        if name.startswith('.') or name.lower().endswith(TEMP_SUFFIXES):
+            return False
+        return self.extensions is None or os.path.splitext(name)[1].lower() in self.extensions
+
+    def _snapshot(self) -> Dict[str, Signature]:
+        files = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    try:
+                        if self._is_watched(entry.name) and entry.is_file():
+                            st = entry.stat()
+                            files[entry.path] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"Watch error on {self.folder}: {e}")
+        return files
+
+    def _run(self):
+        if self.on_start:
+            try:
+                self.on_start()
+            except Exception as e:
+                print(f"Watch start error on {self.folder}: {e}")
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify(self.folder)
+            except (OSError, AttributeError) as e:
+                print(f"inotify unavailable, polling instead: {e}")
+        self.backend = "inotify" if inotify else "polling"
+
+        try:
+            while not self._stop_event.is_set():
+                if inotify:
+                    # Events only flag candidates; readiness is decided below
+                    for name in inotify.read(self.poll_interval):
+                        if self._is_watched(name):
+                            self._add_candidate(os.path.join(self.folder, name))
+                else:
+                    self._stop_event.wait(self.poll_interval)
+                    snapshot = self._snapshot()
+                    for path, signature in snapshot.items():
+                        if self._handled.get(path) != signature:
+                            self._add_candidate(path)
+                    # Forget files moved away, a new download may reuse the name
+                    self._handled = {path: sig for path, sig in self._handled.items() if path in snapshot}
+                self._check_candidates()
+        finally:
+            if inotify:
+                inotify.close()
+
+    def _add_candidate(self, path: str):
+        if path not in self._candidates:
+            self._candidates[path] = ((-1, -1), time.monotonic())
+
+    def _check_candidates(self):
+        now = time.monotonic()
+        for path, (last, since) in list(self._candidates.items()):
+            signature = _stat_signature(path)
+            if signature is None:
+                # Renamed or deleted before it settled
+                del self._candidates[path]
+                continue
+            if signature != last:
+                self._candidates[path] = (signature, now)
+                continue
+            if now - since < self.settle_seconds or signature[0] == 0:
+                continue
+            if any(os.path.exists(path + suffix) for suffix in TEMP_SUFFIXES):
+                continue
+
+            del self._candidates[path]
+            if self._handled.get(path) == signature:
+                continue
+            if self.backend == "inotify":
+                # Only new writes raise events, so nothing needs remembering,
+                # and the entries would pile up as files are sorted away
+                self._handled.pop(path, None)
+            else:
+                self._handled[path] = signature
+            try:
+                self.on_file(path)
+            except Exception as e:
+                print(f"Watch handler error on {path}: {e}")
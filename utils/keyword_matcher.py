@@ -0,0 +1,74 @@
+import re
+from typing import Dict, Iterable, List, Set
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """Builds a regex alternation factored by common prefixes.
+
+    Python's `re` tries alternatives one after another; sharing prefixes
+    makes the match at each position cost about one walk down the trie, as
+    in an Aho-Corasick automaton. Longer terms are tried before their
+    prefixes, so the longest term is matched first.
+    """
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node: Dict) -> str:
+        is_end = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if is_end else group
+
+    return build(trie)
+
+
+# Word boundary that only applies to term edges made of word characters:
+# "rcs" must not match inside "forces", but "invoice #" matches "invoice #42"
+_EDGE = r'(?:(?<!\w)|(?!\w))'
+
+
+class KeywordMatcher:
+    """Finds all occurrences of a fixed set of terms in a single pass.
+
+    Terms match on word boundaries. Matching is case sensitive: pass
+    lowercase terms and lowercase text.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = sorted({t for t in terms if t})
+        if not self.terms:
+            self._pattern = None
+            self._implied: Dict[str, List[str]] = {}
+            return
+        # Zero-width lookahead: a match is tried at every position, so
+        # overlapping terms ("date de facture n°") are all found
+        self._pattern = re.compile(_EDGE + '(?=(' + _trie_pattern(self.terms) + ')' + _EDGE + ')')
+        # A term found inside a longer one at the same position is hidden by
+        # the longest match ("facture" in "facture n°"): precompute them
+        self._implied = {
+            term: [
+                other for other in self.terms
+                if other != term and re.search(_EDGE + re.escape(other) + _EDGE, term)
+            ]
+            for term in self.terms
+        }
+
+    def find(self, text: str) -> Set[str]:
+        """Returns the set of terms present in `text`."""
+        found: Set[str] = set()
+        if self._pattern is None:
+            return found
+        for match in self._pattern.finditer(text):
+            term = match.group(1)
+            if term not in found:
+                found.add(term)
+                found.update(self._implied[term])
+        return found
@@ -0,0 +1,56 @@
+"""
+Lazy imports
+Probes optional dependencies without importing them, and defers the import
+of heavy modules (PDF, OCR, Word, NumPy) to their first use, so that the
+application starts without paying for tools that are never opened.
+"""
+
+import importlib
+import importlib.util
+import sys
+import threading
+from types import ModuleType
+
+
+def has_module(name: str) -> bool:
+    """Whether `name` can be imported, without importing it."""
+    if name in sys.modules:
+        # Already imported (or replaced, e.g. by a test double)
+        return sys.modules[name] is not None
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        # ImportError: missing parent package of a dotted name
+        # ValueError: parent module present without a __spec__
+        return False
+
+
+class LazyModule(ModuleType):
+    """Stands for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lock"] = threading.Lock()
+        self.__dict__["_module"] = None
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_module(name: str) -> ModuleType:
+    """The module if already imported, otherwise a proxy importing it when used."""
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
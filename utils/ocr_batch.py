@@ -0,0 +1,98 @@
+"""
+Batched Tesseract OCR
+Feeds many images to a single tesseract process through a list file, so the
+process startup and language model loading are paid once per batch instead
+of once per image.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from typing import List, Union
+
+from utils.lazy_import import lazy_module
+
+pytesseract = lazy_module("pytesseract")
+Image = lazy_module("PIL.Image")
+
+# Tesseract ends the text of every page with a form feed
+PAGE_SEPARATOR = '\f'
+
+
+class TesseractBatch:
+    """OCR of several images with one tesseract invocation."""
+
+    def __init__(self, lang: str = 'eng+fra'):
+        self.lang = lang
+
+    def image_to_strings(self, images: List[Union[str, "Image.Image"]]) -> List[str]:
+        """Returns the text of each image, in order.
+
+        Falls back to one pytesseract call per image if the batch output
+        cannot be split back into exactly one text per image.
+        """
+        if len(images) < 2:
+            return [self._image_to_string(image) for image in images]
+
+        with tempfile.TemporaryDirectory(prefix="toolbox_ocr_") as tmp_dir:
+            try:
+                paths = [self._as_single_page_file(image, tmp_dir, index) for index, image in enumerate(images)]
+            except OSError as e:
+                print(f"Batch OCR error: {e}")
+                return [self._image_to_string(image) for image in images]
+            list_file = os.path.join(tmp_dir, "images.txt")
+            with open(list_file, 'w', encoding='utf-8') as f:
+                f.write("\n".join(paths) + "\n")
+            texts = self._run(list_file, len(images))
+
+        if texts is None:
+            return [self._image_to_string(image) for image in images]
+        return texts
+
+    @staticmethod
+    def _as_single_page_file(image, tmp_dir: str, index: int) -> str:
+        """Path tesseract can read as exactly one page."""
+        if isinstance(image, str):
+            # Multi-frame files (TIFF, GIF) would yield several pages, and
+            # tesseract may not read non-ASCII list entries on Windows
+            with Image.open(image) as img:
+                if getattr(img, 'n_frames', 1) == 1 and image.isascii():
+                    return os.path.abspath(image)
+                image = img.convert('RGB') if img.mode not in ('L', 'RGB') else img.copy()
+        path = os.path.join(tmp_dir, f"{index}.png")
+        image.save(path, "PNG")
+        return path
+
+    def _run(self, list_file: str, count: int):
+        cmd = [pytesseract.pytesseract.tesseract_cmd, list_file, 'stdout', '-l', self.lang]
+        kwargs = {}
+        if sys.platform == "win32":
+            kwargs['creationflags'] = subprocess.CREATE_NO_WINDOW
+        try:
+            result = subprocess.run(cmd, capture_output=True, **kwargs)
+        except OSError as e:
+            print(f"Batch OCR error: {e}")
+            return None
+        if result.returncode != 0:
+            print(f"Batch OCR error: {result.stderr.decode('utf-8', errors='replace').strip()}")
+            return None
+
+        pages = result.stdout.decode('utf-8', errors='replace').split(PAGE_SEPARATOR)
+        # Text after the last separator is only the trailing newline
+        if pages and not pages[-1].strip():
+            pages.pop()
+        if len(pages) != count:
+            print(f"Batch OCR error: {len(pages)} pages for {count} images")
+            return None
+        return pages
+
+    def _image_to_string(self, image) -> str:
+        try:
+            if isinstance(image, str):
+                with Image.open(image) as img:
+                    return pytesseract.image_to_string(img, lang=self.lang)
+            return pytesseract.image_to_string(image, lang=self.lang)
+        except Exception as e:
+            print(f"OCR error: {e}")
+            return ""
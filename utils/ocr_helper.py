@@ -1,23 +1,45 @@
-import pytesseract
-from PIL import Image
 import os
 import re
 from typing import List, Optional
+from utils.image_preprocess import preprocess_for_ocr
+from utils.lazy_import import lazy_module
+from utils.ocr_batch import TesseractBatch
+
+pytesseract = lazy_module("pytesseract")
+Image = lazy_module("PIL.Image")
 
 class OCRHelper:
-    def __init__(self, lang: str = 'eng+fra'):
+    def __init__(self, lang: str = 'eng+fra', preprocess: bool = True):
         self.lang = lang
+        self.preprocess = preprocess
 
     def extract_text(self, image_path: str) -> str:
         """Extracts text from an image using Tesseract."""
         try:
             image = Image.open(image_path)
+            if self.preprocess:
+                image = preprocess_for_ocr(image)
             text = pytesseract.image_to_string(image, lang=self.lang)
             return text.strip()
         except Exception as e:
             print(f"Error extracting text from {image_path}: {e}")
             return ""
 
+    def extract_texts(self, image_paths: List[str]) -> List[str]:
+        """Extracts text from several images with a single Tesseract run."""
+        images = []
+        for image_path in image_paths:
+            try:
+                image = Image.open(image_path)
+                images.append(preprocess_for_ocr(image) if self.preprocess else image)
+            except Exception as e:
+                print(f"Error extracting text from {image_path}: {e}")
+                images.append(None)
+
+        readable = [image for image in images if image is not None]
+        texts = iter(TesseractBatch(self.lang).image_to_strings(readable))
+        return [next(texts).strip() if image is not None else "" for image in images]
+
     def generate_filename(self, text: str, original_ext: str, max_words: int = 3) -> str:
         """Generates a filename from extracted text."""
         # 1. Clean text: remove special chars, keep alphanumeric and spaces
@@ -0,0 +1,61 @@
+import threading
+from typing import Any, Callable, Optional
+
+
+class ProgressReporter:
+    """Coalesces progress updates and pushes only the latest one at a fixed rate.
+
+    Worker threads call `report()` as often as they like; it only stores the
+    state. A timer thread calls `flush(state)` at most `rate_hz` times per
+    second, so UI round-trips no longer scale with the amount of progress
+    reported and a slow UI never blocks the worker.
+    """
+
+    def __init__(self, flush: Callable[[Any], None], rate_hz: float = 10.0):
+        self._flush = flush
+        self._interval = 1.0 / rate_hz
+        self._lock = threading.Lock()
+        self._pending: Optional[tuple] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ProgressReporter":
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def report(self, state: Any):
+        """Records the latest state; never waits on the UI."""
+        with self._lock:
+            self._pending = (state,)
+
+    def stop(self, flush: bool = True):
+        """Stops the timer, optionally pushing the last reported state."""
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        if flush:
+            self._flush_pending()
+
+    def _run(self):
+        while not self._stop_event.wait(self._interval):
+            self._flush_pending()
+
+    def _flush_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        try:
+            self._flush(pending[0])
+        except Exception as e:
+            print(f"Progress update failed: {e}")
+
+    def __enter__(self) -> "ProgressReporter":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        # The last state is pushed unless the block failed
+        self.stop(flush=exc_type is None)
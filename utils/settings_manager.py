@@ -1,6 +1,8 @@
 import json
 import os
-from typing import List, Dict, Any
+import threading
+import weakref
+from typing import Callable, List, Dict, Any
 from pathlib import Path
 
 
@@ -26,12 +28,23 @@ class SettingsManager:
             "Adobe",
         ],
         "invoice_min_score": 25,
+        "invoice_workers": 0,  # 0 = one per CPU core
+        "invoice_cache_max_mb": 64,
+        "invoice_scan_recursive": True,
+        "invoice_scan_max_depth": 3,
+        "invoice_trash_duplicates": False,
+        "invoice_file_timeout": 120,  # seconds per file, 0 = no limit
+        "invoice_max_memory_mb": 1536,  # per worker process, 0 = no limit
+        "invoice_docx_max_chars": 100000,  # characters read from Word documents
+        "ocr_preprocess": True,
     }
     
     def __init__(self):
         self.settings_dir = Path.home() / ".toolbox"
         self.settings_file = self.settings_dir / "settings.json"
         self._settings: Dict[str, Any] = {}
+        self._subscribers: List[Callable[[], Any]] = []
+        self._subscribers_lock = threading.Lock()
         self._load_settings()
     
     def _load_settings(self):
@@ -64,6 +77,38 @@ class SettingsManager:
         """Set a setting value and save."""
         self._settings[key] = value
         self._save_settings()
+        self._notify(key, value)
+    
+    # Change notification
+    def subscribe(self, callback: Callable[[str, Any], None]):
+        """Call `callback(key, value)` after every setting change.
+        
+        Bound methods are held weakly, so subscribing does not keep their
+        object alive.
+        """
+        if hasattr(callback, "__self__"):
+            ref = weakref.WeakMethod(callback)
+        else:
+            ref = lambda: callback
+        with self._subscribers_lock:
+            self._subscribers.append(ref)
+    
+    def unsubscribe(self, callback: Callable[[str, Any], None]):
+        """Stop notifying `callback`."""
+        with self._subscribers_lock:
+            self._subscribers = [ref for ref in self._subscribers if ref() not in (None, callback)]
+    
+    def _notify(self, key: str, value: Any):
+        with self._subscribers_lock:
+            self._subscribers = [ref for ref in self._subscribers if ref() is not None]
+            callbacks = [ref() for ref in self._subscribers]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(key, value)
+            except Exception as e:
+                print(f"Error in settings subscriber: {e}")
     
     # Invoice companies specific methods
     def get_invoice_companies(self) -> List[str]:
@@ -83,6 +128,7 @@ class SettingsManager:
         
         self._settings["invoice_companies"] = clean_companies
         self._save_settings()
+        self._notify("invoice_companies", clean_companies)
     
     def add_invoice_company(self, company: str) -> bool:
         """Add a company to the list. Returns True if added, False if already exists."""
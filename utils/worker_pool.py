@@ -0,0 +1,365 @@
+"""
+Supervised worker processes
+A small process pool whose workers can be killed. Every job has a wall-clock
+timeout and the resident memory of busy workers is watched, so a job that
+hangs or runs away is stopped, its worker replaced, and the job reported as
+failed instead of blocking the pool.
+"""
+
+import ctypes
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from utils.lazy_import import has_module, lazy_module
+
+HAS_PSUTIL = has_module("psutil")
+psutil = lazy_module("psutil")
+
+MB = 1024 * 1024
+
+
+def default_start_method() -> str:
+    """forkserver where available, spawn otherwise (Windows).
+
+    Never plain fork: the parent runs threads (UI, discovery, watcher) and
+    a forked child could inherit one of their locks in a held state.
+    """
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def process_rss(pid: int) -> Optional[int]:
+    """Resident memory of a process in bytes, or None if it cannot be read."""
+    if HAS_PSUTIL:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except Exception:
+            return None
+    try:
+        # Linux without psutil: resident pages are the second field
+        with open(f"/proc/{pid}/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def descendant_pids(pid: int) -> List[int]:
+    """Children of a process, and their children (tesseract started by a worker)."""
+    if HAS_PSUTIL:
+        try:
+            return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except Exception:
+            return []
+    # Linux without psutil: parent pid is the second field after the command name
+    children: dict = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", 'r') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    found, pending = [], [pid]
+    while pending:
+        for child in children.get(pending.pop(), ()):
+            found.append(child)
+            pending.append(child)
+    return found
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """Resident memory of a process and all its descendants, in bytes."""
+    rss = process_rss(pid)
+    if rss is None:
+        return None
+    for child in descendant_pids(pid):
+        # A child that exited meanwhile counts for nothing
+        rss += process_rss(child) or 0
+    return rss
+
+
+class _WindowsJob:
+    """Job object holding a worker and every process it starts (Windows only).
+
+    Windows has no process groups: killing the worker alone would leave its
+    tesseract running, terminating the job stops them all.
+    """
+
+    PROCESS_SET_QUOTA = 0x0100
+    PROCESS_TERMINATE = 0x0001
+
+    def __init__(self, pid: int):
+        from ctypes import wintypes
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+        kernel32.CreateJobObjectW.argtypes = (ctypes.c_void_p, wintypes.LPCWSTR)
+        kernel32.OpenProcess.restype = wintypes.HANDLE
+        kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+        kernel32.AssignProcessToJobObject.argtypes = (wintypes.HANDLE, wintypes.HANDLE)
+        kernel32.TerminateJobObject.argtypes = (wintypes.HANDLE, wintypes.UINT)
+        kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+        self._kernel32 = kernel32
+
+        self.handle = kernel32.CreateJobObjectW(None, None)
+        if not self.handle:
+            raise ctypes.WinError(ctypes.get_last_error())
+        process = kernel32.OpenProcess(self.PROCESS_SET_QUOTA | self.PROCESS_TERMINATE, False, pid)
+        assigned = bool(process) and bool(kernel32.AssignProcessToJobObject(self.handle, process))
+        error = ctypes.get_last_error()
+        if process:
+            kernel32.CloseHandle(process)
+        if not assigned:
+            self.close()
+            raise ctypes.WinError(error)
+
+    def terminate(self):
+        if self.handle:
+            self._kernel32.TerminateJobObject(self.handle, 1)
+
+    def close(self):
+        if self.handle:
+            self._kernel32.CloseHandle(self.handle)
+            self.handle = None
+
+
+@dataclass
+class JobResult:
+    job_id: int
+    value: Any = None
+    error: Optional[str] = None
+    # The worker was killed (timeout, memory) or died while running the job
+    killed: bool = False
+
+
+def _worker_main(conn, initializer: Optional[Callable], initargs: Tuple):
+    if hasattr(os, "setsid"):
+        # Own process group, so that killing the worker also stops the
+        # programs it started (tesseract)
+        try:
+            os.setsid()
+        except OSError:
+            pass
+    if initializer:
+        initializer(*initargs)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        job_id, func, args = job
+        try:
+            reply = (job_id, func(*args), None)
+        except Exception as e:
+            reply = (job_id, None, str(e) or type(e).__name__)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Result that cannot be pickled
+            conn.send((job_id, None, str(e)))
+
+
+class _Worker:
+    def __init__(self, ctx, initializer: Optional[Callable], initargs: Tuple):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, initializer, initargs), daemon=True)
+        self.process.start()
+        child_conn.close()
+        # (job id, timeout, deadline) of the running job
+        self.job: Optional[Tuple[int, Optional[float], Optional[float]]] = None
+        self._job_object: Optional[_WindowsJob] = None
+        if sys.platform == "win32":
+            # Assigned before any job is sent, so tesseract is always inside it
+            try:
+                self._job_object = _WindowsJob(self.process.pid)
+            except OSError as e:
+                print(f"Job object indisponible pour le processus d'analyse : {e}")
+
+    def kill(self):
+        pid = self.process.pid
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(pid, signal.SIGKILL)
+            elif self._job_object:
+                self._job_object.terminate()
+            else:
+                self._kill_tree()
+        except OSError:
+            # setsid() not reached yet: no process group
+            self.process.kill()
+        self.process.join(timeout=2)
+        self.close()
+
+    def _kill_tree(self):
+        # Children first: once the worker is gone they can no longer be found
+        for child in descendant_pids(self.process.pid):
+            try:
+                os.kill(child, signal.SIGTERM)
+            except OSError:
+                pass
+        self.process.kill()
+
+    def close(self):
+        self.conn.close()
+        if self._job_object:
+            self._job_object.close()
+            self._job_object = None
+
+
+class SupervisedPool:
+    """Runs jobs in worker processes and kills the ones that misbehave.
+
+    A job exceeding its timeout, or running in a worker whose resident
+    memory (counting the programs it started) goes above `max_rss` bytes,
+    is reported with `killed` set and the worker is replaced by a fresh one. Call poll() regularly: results
+    are collected and limits enforced there. Jobs and the initializer must
+    be picklable module-level functions, as workers do not fork the parent.
+    """
+
+    def __init__(self, workers: int, initializer: Optional[Callable] = None, initargs: Tuple = (),
+                 max_rss: Optional[int] = None, check_interval: float = 0.5,
+                 start_method: Optional[str] = None):
+        self._ctx = multiprocessing.get_context(start_method or default_start_method())
+        self._initializer = initializer
+        self._initargs = initargs
+        self.max_rss = max_rss
+        self.check_interval = check_interval
+        self._workers = [self._spawn() for _ in range(max(1, workers))]
+        self._queue: Deque[Tuple[int, Callable, Tuple, Optional[float]]] = deque()
+        self._next_id = 0
+        self._last_check = 0.0
+        # Jobs that failed outside poll(), reported by the next poll()
+        self._finished: List[JobResult] = []
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self._initializer, self._initargs)
+
+    def submit(self, func: Callable, *args, timeout: Optional[float] = None) -> int:
+        """Queues `func(*args)`; returns the job id reported by poll()."""
+        self._next_id += 1
+        self._queue.append((self._next_id, func, args, timeout))
+        self._dispatch()
+        return self._next_id
+
+    @property
+    def pending(self) -> int:
+        """Jobs queued or running."""
+        return len(self._queue) + sum(1 for w in self._workers if w.job)
+
+    def _dispatch(self):
+        for index in range(len(self._workers)):
+            worker = self._workers[index]
+            if not self._queue:
+                return
+            if worker.job is not None:
+                continue
+            if not worker.process.is_alive():
+                # Exited after its last job
+                self._replace(worker)
+                worker = self._workers[index]
+            job_id, func, args, timeout = self._queue.popleft()
+            try:
+                worker.conn.send((job_id, func, args))
+            except OSError as e:
+                # Worker died while idle
+                self._finished.append(self._fail(worker, job_id, f"Processus d'analyse indisponible : {e}"))
+                continue
+            except Exception as e:
+                # Job that cannot be pickled: nothing was sent
+                self._finished.append(JobResult(job_id, error=str(e)))
+                continue
+            worker.job = (job_id, timeout, time.monotonic() + timeout if timeout else None)
+
+    def poll(self, timeout: float = 0.2) -> List[JobResult]:
+        """Waits up to `timeout` seconds and returns the jobs finished or killed."""
+        self._dispatch()
+        results, self._finished = self._finished, []
+        busy = [w for w in self._workers if w.job]
+        if not busy:
+            if not results and timeout:
+                time.sleep(min(timeout, 0.05))
+            return results
+
+        now = time.monotonic()
+        deadlines = [w.job[2] for w in busy if w.job[2] is not None]
+        wait_for = timeout
+        if deadlines:
+            wait_for = min(wait_for, max(0.0, min(deadlines) - now))
+        if self.max_rss:
+            wait_for = min(wait_for, self.check_interval)
+        handles = [w.conn for w in busy] + [w.process.sentinel for w in busy]
+        ready = set(multiprocessing.connection.wait(handles, wait_for))
+
+        for worker in busy:
+            if worker.conn not in ready and worker.process.sentinel not in ready:
+                continue
+            job_id = worker.job[0]
+            try:
+                if not worker.conn.poll():
+                    raise EOFError
+                reply_id, value, error = worker.conn.recv()
+                worker.job = None
+                results.append(JobResult(reply_id, value, error))
+            except (EOFError, OSError):
+                code = worker.process.exitcode
+                results.append(self._fail(worker, job_id, f"Processus d'analyse arrêté (code {code})"))
+
+        now = time.monotonic()
+        check_memory = self.max_rss and now - self._last_check >= self.check_interval
+        if check_memory:
+            self._last_check = now
+        for worker in busy:
+            if worker.job is None:
+                continue
+            job_id, job_timeout, deadline = worker.job
+            if deadline is not None and now >= deadline:
+                results.append(self._fail(worker, job_id, f"Analyse interrompue : délai de {job_timeout:g} s dépassé"))
+            elif check_memory:
+                # Includes tesseract and any other program the job started
+                rss = process_tree_rss(worker.process.pid)
+                if rss is not None and rss > self.max_rss:
+                    results.append(self._fail(
+                        worker, job_id,
+                        f"Analyse interrompue : mémoire dépassée ({rss // MB} Mo > {self.max_rss // MB} Mo)"
+                    ))
+        self._dispatch()
+        return results
+
+    def _fail(self, worker: _Worker, job_id: int, error: str) -> JobResult:
+        self._replace(worker)
+        return JobResult(job_id, error=error, killed=True)
+
+    def _replace(self, worker: _Worker):
+        worker.job = None
+        worker.kill()
+        self._workers[self._workers.index(worker)] = self._spawn()
+
+    def shutdown(self):
+        """Stops the idle workers and kills the busy ones."""
+        self._queue.clear()
+        for worker in self._workers:
+            if worker.job:
+                worker.kill()
+                continue
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=2)
+            if worker.process.is_alive():
+                worker.kill()
+            worker.close()
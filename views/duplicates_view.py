@@ -4,19 +4,34 @@ import time
 import os
 import subprocess
 import sys
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from utils.styles import ColorPalette, TextStyles
-from utils.duplicate_finder import DuplicateFinder, DuplicateGroup
+from utils.duplicate_finder import DuplicateFinder, DuplicateGroup, DuplicateResults, KEEP_RULES, keep_under
+from utils.progress_reporter import ProgressReporter
 
 class DuplicatesView(ft.Container):
+    # Number of group cards built at a time; more are added while scrolling.
+    PAGE_SIZE = 40
+
     def __init__(self):
         super().__init__(expand=True)
         self.finder = DuplicateFinder()
         self.scan_thread: Optional[threading.Thread] = None
-        self.duplicate_groups: List[DuplicateGroup] = []
+        self.results = DuplicateResults([])
+        self.scanned_paths: List[str] = []
+        # False when the scan was cancelled and the results are partial
+        self.scan_complete = True
+        self.revalidating = False
+        # (group index, file index) -> rendered checkbox
+        self.checkboxes: Dict[Tuple[int, int], ft.Checkbox] = {}
+        # Group indices in display order (sorted/filtered) and how many are rendered
+        self.visible_groups: List[int] = []
+        self.rendered_count = 0
+        self.render_lock = threading.Lock()
         
         # UI Components - State 1: Config
         self.folder_picker = ft.FilePicker(on_result=self.on_folder_selected)
+        self.keep_folder_picker = ft.FilePicker(on_result=self.on_keep_folder_selected)
         self.selected_folder_text = ft.Text("No folder selected", style=TextStyles.BODY, color=ColorPalette.TEXT_SECONDARY)
         self.recursive_switch = ft.Switch(label="Scan subfolders", value=True, active_color=ColorPalette.PRIMARY)
         self.min_size_slider = ft.Slider(min=0, max=10, divisions=10, label="{value} MB", value=0)
@@ -34,13 +49,35 @@ class DuplicatesView(ft.Container):
         )
 
         # UI Components - State 2: Scanning
+        self.scanning_title = ft.Text("Scanning...", style=TextStyles.HEADER)
         self.progress_bar = ft.ProgressBar(width=400, color=ColorPalette.PRIMARY, bgcolor=ColorPalette.SURFACE)
         self.status_text = ft.Text("Ready", style=TextStyles.BODY)
         self.cancel_btn = ft.OutlinedButton("Cancel", on_click=self.cancel_scan, style=ft.ButtonStyle(color=ColorPalette.ERROR))
 
         # UI Components - State 3: Results
-        self.results_list = ft.ListView(expand=True, spacing=10, padding=20)
+        self.results_list = ft.ListView(
+            expand=True, spacing=10, padding=20,
+            on_scroll=self.on_results_scroll, on_scroll_interval=100
+        )
         self.results_summary = ft.Text("", style=TextStyles.SUBHEADER)
+        self.sort_dropdown = ft.Dropdown(
+            value="size",
+            width=170,
+            options=[
+                ft.dropdown.Option("size", "Sort by size"),
+                ft.dropdown.Option("count", "Sort by count"),
+                ft.dropdown.Option("folder", "Sort by folder"),
+            ],
+            on_change=lambda _: self.show_results(),
+        )
+        self.folder_filter = ft.TextField(
+            hint_text="Filter by folder",
+            prefix_icon=ft.Icons.FILTER_LIST,
+            width=220,
+            on_submit=lambda _: self.show_results(),
+        )
+        self.new_scan_btn = ft.OutlinedButton("New Scan", icon=ft.Icons.REFRESH, on_click=self.new_scan)
+        self.load_more_btn = ft.TextButton("Show more groups", icon=ft.Icons.EXPAND_MORE, on_click=lambda _: self.render_more())
         self.delete_btn = ft.ElevatedButton(
             "Delete Selected", 
             icon=ft.Icons.DELETE, 
@@ -94,7 +131,7 @@ class DuplicatesView(ft.Container):
 
         self.scanning_container = ft.Column(
             [
-                ft.Text("Scanning...", style=TextStyles.HEADER),
+                self.scanning_title,
                 ft.Container(height=20),
                 self.progress_bar,
                 ft.Container(height=10),
@@ -112,6 +149,8 @@ class DuplicatesView(ft.Container):
                 ft.Row([
                     self.results_summary,
                     ft.Container(expand=True),
+                    self.folder_filter,
+                    self.sort_dropdown,
                     ft.PopupMenuButton(
                         icon=ft.Icons.SELECT_ALL,
                         items=[
@@ -119,8 +158,11 @@ class DuplicatesView(ft.Container):
                             ft.PopupMenuItem(text="Deselect All", on_click=lambda _: self.select_all(False)),
                             ft.PopupMenuItem(text="Select All Except Newest", on_click=lambda _: self.select_smart("newest")),
                             ft.PopupMenuItem(text="Select All Except Oldest", on_click=lambda _: self.select_smart("oldest")),
+                            ft.PopupMenuItem(text="Select All Except Shortest Path", on_click=lambda _: self.select_smart("shortest_path")),
+                            ft.PopupMenuItem(text="Keep Files In Folder...", on_click=lambda _: self.keep_folder_picker.get_directory_path()),
                         ]
                     ),
+                    self.new_scan_btn,
                     self.delete_btn
                 ]),
                 ft.Divider(),
@@ -132,11 +174,68 @@ class DuplicatesView(ft.Container):
 
         self.content = ft.Stack([
             self.folder_picker,
+            self.keep_folder_picker,
             self.config_container,
             self.scanning_container,
             self.results_container
         ])
 
+    def did_mount(self):
+        # Restore the last scan instantly, then check it against the disk
+        saved = self.finder.load_results()
+        if saved and saved[1]:
+            self.scanned_paths, groups, self.scan_complete = saved
+            self.results = DuplicateResults(groups)
+            if self.scanned_paths:
+                self.selected_folder_text.value = self.scanned_paths[0]
+                self.scan_btn.disabled = False
+            self.revalidating = True
+            self.show_results()
+            threading.Thread(target=self.run_revalidate, args=(self.results,), daemon=True).start()
+
+    def run_revalidate(self, results: DuplicateResults):
+        reporter = ProgressReporter(self.set_summary_status).start()
+        try:
+            gen = self.finder.revalidate(results.groups)
+            try:
+                while True:
+                    reporter.report(next(gen))
+            except StopIteration as e:
+                stale = e.value
+            reporter.stop(flush=False)
+        except Exception as e:
+            reporter.stop(flush=False)
+            print(f"Error checking saved results: {e}")
+            stale = set()
+
+        # A new scan may have replaced the restored results meanwhile
+        if results is not self.results:
+            return
+        self.revalidating = False
+        if stale:
+            self.results.remove_paths(stale)
+        self.finder.save_results(self.scanned_paths, self.results.groups, self.scan_complete)
+        if len(self.results):
+            self.show_results()
+        else:
+            self.new_scan(None)
+
+    def set_summary_status(self, status: str):
+        self.results_summary.value = status
+        self.update()
+
+    def new_scan(self, e):
+        self.finder.stop()
+        self.finder.clear_results()
+        self.results = DuplicateResults([])
+        self.revalidating = False
+        self.results_list.controls.clear()
+        self.checkboxes.clear()
+        self.config_container.visible = True
+        self.scanning_container.visible = False
+        self.results_container.visible = False
+        self.update()
+
     def on_folder_selected(self, e: ft.FilePickerResultEvent):
         if e.path:
             self.selected_folder_text.value = e.path
@@ -144,6 +243,8 @@ class DuplicatesView(ft.Container):
             self.update()
 
     def start_scan(self, e):
+        self.scanning_title.value = "Scanning..."
+        self.progress_bar.value = None
         self.config_container.visible = False
         self.scanning_container.visible = True
         self.results_container.visible = False
@@ -159,40 +260,31 @@ class DuplicatesView(ft.Container):
         )
         self.scan_thread.start()
 
+    def set_status(self, status: str):
+        self.status_text.value = status
+        self.update()
+
     def run_scan(self, paths, recursive, min_size):
+        # The scan may report thousands of statuses per second: only the
+        # latest one is pushed to the client, at most 10 times per second.
+        reporter = ProgressReporter(self.set_status).start()
         try:
-            for status in self.finder.scan_directory(paths, recursive, min_size):
-                self.status_text.value = status
-                self.update()
-            
-            # Scan complete
-            self.duplicate_groups = self.finder.scan_directory(paths, recursive, min_size) # Re-run to get result? No, generator yields status then returns? 
-            # Wait, generator in python returns value via StopIteration but that's hard to get in for loop.
-            # I should modify scan_directory to yield status and then yield result or store result.
-            # Let's check duplicate_finder.py again. 
-            # It returns list at the end. But generator return value is tricky.
-            # I will modify duplicate_finder.py to yield results as the last item or change how I call it.
-            # Actually, let's fix duplicate_finder.py to yield a special object or just store it.
-            # Or better: yield status strings, and the last yield is the result list?
-            # No, type hint says Generator[str, None, List[DuplicateGroup]].
-            # To get the return value of a generator:
-            # gen = finder.scan_directory(...)
-            # for status in gen: ...
-            # result = gen.value (only works if caught StopIteration)
-            
-            # Let's adjust this method to just consume the generator properly.
             gen = self.finder.scan_directory(paths, recursive, min_size)
             try:
                 while True:
-                    status = next(gen)
-                    self.status_text.value = status
-                    self.update()
+                    reporter.report(next(gen))
             except StopIteration as e:
-                self.duplicate_groups = e.value
+                self.results = DuplicateResults(e.value)
+                self.revalidating = False
+                self.scanned_paths = paths
+                self.scan_complete = not self.finder.stop_requested
+            reporter.stop(flush=False)
+            self.finder.save_results(paths, self.results.groups, self.scan_complete)
                 
             self.show_results()
             
         except Exception as e:
+            reporter.stop(flush=False)
             self.status_text.value = f"Error: {str(e)}"
             self.update()
 
@@ -203,32 +295,63 @@ class DuplicatesView(ft.Container):
         self.update()
 
     def show_results(self):
+        self.config_container.visible = False
         self.scanning_container.visible = False
         self.results_container.visible = True
         
+        # Sorting and filtering happen on the model; only the first page gets controls
+        self.visible_groups = self.results.ordered(self.sort_dropdown.value, (self.folder_filter.value or "").strip())
+        self.rendered_count = 0
         self.results_list.controls.clear()
+        self.checkboxes.clear()
         
-        total_dupes = sum(len(g.files) - 1 for g in self.duplicate_groups)
-        total_size = sum(g.size * (len(g.files) - 1) for g in self.duplicate_groups)
-        self.results_summary.value = f"Found {len(self.duplicate_groups)} groups ({total_dupes} duplicates). Potential savings: {total_size / 1024 / 1024:.2f} MB"
-        
-        for group in self.duplicate_groups:
-            self.results_list.controls.append(self.create_group_card(group))
+        summary = f"Found {len(self.results)} groups ({self.results.total_duplicates} duplicates). Potential savings: {self.results.potential_savings / 1024 / 1024:.2f} MB"
+        if len(self.visible_groups) != len(self.results):
+            summary += f" - showing {len(self.visible_groups)}"
+        if not self.scan_complete:
+            summary += " - scan cancelled, results are incomplete"
+        self.results_summary.value = summary
         
+        self.update_delete_btn()
+        self.render_more()
+
+    def render_more(self):
+        """Builds the cards of the next page of visible groups."""
+        # Scroll events may arrive concurrently
+        with self.render_lock:
+            if self.results_list.controls and self.results_list.controls[-1] is self.load_more_btn:
+                self.results_list.controls.pop()
+            
+            end = min(self.rendered_count + self.PAGE_SIZE, len(self.visible_groups))
+            for group_index in self.visible_groups[self.rendered_count:end]:
+                self.results_list.controls.append(self.create_group_card(group_index, self.results.groups[group_index]))
+            self.rendered_count = end
+            
+            if self.rendered_count < len(self.visible_groups):
+                self.results_list.controls.append(self.load_more_btn)
         self.update()
 
-    def create_group_card(self, group: DuplicateGroup):
+    def on_results_scroll(self, e: ft.OnScrollEvent):
+        if self.rendered_count >= len(self.visible_groups):
+            return
+        # Build the next page before the user reaches the end of the list
+        if e.max_scroll_extent and e.pixels >= e.max_scroll_extent - 600:
+            self.render_more()
+
+    def create_group_card(self, group_index: int, group: DuplicateGroup):
         files_column = ft.Column()
-        for file in group.files:
+        for file_index, file in enumerate(group.files):
+            checkbox = ft.Checkbox(
+                label=f"{file.path} ({file.size/1024:.1f} KB)", 
+                value=self.results.is_selected(group_index, file_index),
+                data=(group_index, file_index),
+                on_change=self.on_selection_change,
+                expand=True
+            )
+            self.checkboxes[(group_index, file_index)] = checkbox
             files_column.controls.append(
                 ft.Row([
-                    ft.Checkbox(
-                        label=f"{file.path} ({file.size/1024:.1f} KB)", 
-                        value=False,
-                        data=file,
-                        on_change=self.on_selection_change,
-                        expand=True
-                    ),
+                    checkbox,
                     ft.IconButton(
                         icon=ft.Icons.OPEN_IN_NEW,
                         tooltip="Open File",
@@ -270,72 +393,90 @@ class DuplicatesView(ft.Container):
             self.page.update()
 
     def on_selection_change(self, e):
-        # Enable delete button if any checked
-        any_checked = False
-        for card in self.results_list.controls:
-            # Access the column of files (index 2: after header row and divider)
-            files_col = card.content.content.controls[2]
-            for row in files_col.controls:
-                # Checkbox is the first item in the Row
-                checkbox = row.controls[0]
-                if checkbox.value:
-                    any_checked = True
-                    break
-            if any_checked: break
-            
-        self.delete_btn.disabled = not any_checked
+        group_index, file_index = e.control.data
+        self.results.set_selected(group_index, file_index, e.control.value)
+        self.update_delete_btn()
+        self.delete_btn.update()
+
+    def update_delete_btn(self):
+        # Saved results must be checked against the disk before deleting anything
+        self.delete_btn.disabled = self.revalidating or self.results.selected_count == 0
+
+    def refresh_selection(self):
+        """Pushes the model selection to the rendered checkboxes."""
+        for (group_index, file_index), checkbox in self.checkboxes.items():
+            checkbox.value = self.results.is_selected(group_index, file_index)
+        self.update_delete_btn()
         self.update()
 
     def select_all(self, select: bool):
-        for card in self.results_list.controls:
-            files_col = card.content.content.controls[2]
-            for row in files_col.controls:
-                checkbox = row.controls[0]
-                checkbox.value = select
-        self.on_selection_change(None)
+        self.results.select_all(select)
+        self.refresh_selection()
 
     def select_smart(self, criteria: str):
-        for i, card in enumerate(self.results_list.controls):
-            group = self.duplicate_groups[i]
-            files_col = card.content.content.controls[2]
-            
-            # Sort files in group based on criteria
-            if criteria == "newest":
-                # Keep newest unchecked, check others
-                sorted_files = sorted(group.files, key=lambda x: x.modified, reverse=True)
-                keep_file = sorted_files[0]
-            elif criteria == "oldest":
-                # Keep oldest unchecked, check others
-                sorted_files = sorted(group.files, key=lambda x: x.modified)
-                keep_file = sorted_files[0]
-            
-            for row in files_col.controls:
-                checkbox = row.controls[0]
-                file = checkbox.data
-                checkbox.value = (file != keep_file)
-                
-        self.on_selection_change(None)
+        self.results.apply_rule(KEEP_RULES[criteria])
+        self.refresh_selection()
+
+    def on_keep_folder_selected(self, e: ft.FilePickerResultEvent):
+        if e.path:
+            self.results.apply_rule(keep_under(e.path))
+            self.refresh_selection()
 
     def delete_selected(self, e):
-        files_to_delete = []
-        for card in self.results_list.controls:
-            files_col = card.content.content.controls[2]
-            for row in files_col.controls:
-                checkbox = row.controls[0]
-                if checkbox.value:
-                    files_to_delete.append(checkbox.data.path)
-        
-        count = 0
-        for path in files_to_delete:
-            if self.finder.delete_file(path):
-                count += 1
+        files_to_delete = self.results.selected_paths()
+        if not files_to_delete:
+            return
+
+        self.scanning_title.value = "Deleting..."
+        self.progress_bar.value = 0
+        self.status_text.value = f"Moving {len(files_to_delete)} files to trash..."
+        self.results_container.visible = False
+        self.scanning_container.visible = True
+        self.update()
+
+        self.scan_thread = threading.Thread(target=self.run_delete, args=(files_to_delete,), daemon=True)
+        self.scan_thread.start()
+
+    def set_delete_progress(self, status: str, progress: float):
+        self.status_text.value = status
+        self.progress_bar.value = progress
+        self.update()
+
+    def run_delete(self, files_to_delete):
+        deleted = []
+        batch_size = DuplicateFinder.TRASH_BATCH_SIZE
+        error = None
+        with ProgressReporter(lambda state: self.set_delete_progress(*state)) as reporter:
+            gen = self.finder.delete_files(files_to_delete, batch_size)
+            try:
+                batches = 0
+                while True:
+                    status = next(gen)
+                    batches += 1
+                    reporter.report((status, min(batches * batch_size / len(files_to_delete), 1.0)))
+            except StopIteration as e:
+                deleted = e.value
+            except Exception as e:
+                error = e
+        if error is not None:
+            self.status_text.value = f"Error: {str(error)}"
+            self.update()
+            return
+
+        self.results.remove_paths(set(deleted))
+        if len(self.results):
+            self.finder.save_results(self.scanned_paths, self.results.groups, self.scan_complete)
+        else:
+            self.finder.clear_results()
         
         # Show snackbar
-        self.page.snack_bar = ft.SnackBar(ft.Text(f"Moved {count} files to trash"))
+        self.page.snack_bar = ft.SnackBar(ft.Text(f"Moved {len(deleted)} files to trash"))
         self.page.snack_bar.open = True
         
-        # Reset view
-        self.config_container.visible = True
-        self.results_container.visible = False
-        self.duplicate_groups = []
-        self.update()
+        if len(self.results):
+            self.show_results()
+        else:
+            # Nothing left to review: reset view
+            self.config_container.visible = True
+            self.scanning_container.visible = False
+            self.update()
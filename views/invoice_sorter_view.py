@@ -1,9 +1,13 @@
 import flet as ft
 import os
 import threading
-from typing import List, Dict
+from typing import List, Dict, Optional
 from utils.styles import ColorPalette, TextStyles
 from utils.invoice_detector import InvoiceDetector, InvoiceResult
+from utils.invoice_engine import InvoiceAnalysisEngine, default_worker_count
+from utils.invoice_watcher import DownloadsWatcher
+from utils.invoice_mover import BatchMover
+from utils.invoice_timing import TimingReport
 from utils.settings_manager import settings
 
 
@@ -14,14 +18,28 @@ class InvoiceSorterView(ft.Container):
         super().__init__(expand=True)
         self.page = page
         self.detector = InvoiceDetector()
+        self.engine: Optional[InvoiceAnalysisEngine] = None
+        self.watcher: Optional[DownloadsWatcher] = None
+        self.mover = BatchMover(self.detector.get_invoices_folder())
         self.scan_results: List[InvoiceResult] = []
         self.selected_invoices: Dict[str, bool] = {}  # file_path -> selected
+        self.timing_report = TimingReport()
         self.settings_visible = False
         
         # UI Components
         self.status_text = ft.Text("", style=TextStyles.CAPTION)
         self.progress_bar = ft.ProgressBar(visible=False, color=ColorPalette.PRIMARY)
         
+        # Where the time of the last scan went, per analysis stage
+        self.timings_text = ft.Text("", style=TextStyles.CAPTION, color=ColorPalette.TEXT_SECONDARY, expand=True)
+        self.export_timings_btn = ft.IconButton(
+            icon=ft.Icons.TIMER_OUTLINED,
+            icon_color=ColorPalette.TEXT_SECONDARY,
+            tooltip="Exporter les temps d'analyse (JSON)",
+            on_click=self.export_timings,
+        )
+        self.timings_row = ft.Row([self.timings_text, self.export_timings_btn], visible=False)
+        
         # Settings panel components
         self.company_input = ft.TextField(
             label="Ajouter une société",
@@ -34,6 +52,32 @@ class InvoiceSorterView(ft.Container):
         self.companies_list = ft.ListView(spacing=5, height=200)
         self._refresh_companies_list()
         
+        max_workers = max(os.cpu_count() or 1, 1)
+        self.workers_slider = ft.Slider(
+            min=1,
+            max=max_workers,
+            divisions=max(max_workers - 1, 1),
+            value=min(default_worker_count(), max_workers),
+            label="{value}",
+            active_color=ColorPalette.PRIMARY,
+            on_change_end=self._set_workers,
+            expand=True,
+        )
+        
+        self.recursive_checkbox = ft.Checkbox(
+            label="Inclure les sous-dossiers de Téléchargements",
+            value=settings.get("invoice_scan_recursive", True),
+            active_color=ColorPalette.PRIMARY,
+            on_change=lambda e: settings.set("invoice_scan_recursive", bool(e.control.value)),
+        )
+        
+        self.trash_duplicates_checkbox = ft.Checkbox(
+            label="Mettre à la corbeille les factures déjà classées",
+            value=settings.get("invoice_trash_duplicates", False),
+            active_color=ColorPalette.PRIMARY,
+            on_change=lambda e: settings.set("invoice_trash_duplicates", bool(e.control.value)),
+        )
+        
         # Stats
         self.stats_row = ft.Row([
             self._create_stat_card("📁", "0", "Fichiers scannés", ref_name="scanned"),
@@ -54,6 +98,24 @@ class InvoiceSorterView(ft.Container):
             on_click=self.start_scan,
         )
         
+        # Watch mode: sort new downloads as they arrive
+        self.watch_switch = ft.Switch(
+            label="Tri automatique",
+            value=False,
+            active_color=ColorPalette.PRIMARY,
+            tooltip="Trier les nouvelles factures dès leur téléchargement",
+            on_change=self.toggle_watch,
+        )
+        
+        # Cancel button (visible while scanning)
+        self.cancel_btn = ft.OutlinedButton(
+            "Annuler",
+            icon=ft.Icons.STOP,
+            style=ft.ButtonStyle(color=ColorPalette.ERROR),
+            on_click=self.cancel_scan,
+            visible=False,
+        )
+        
         # Sort button
         self.sort_btn = ft.ElevatedButton(
             "Trier les factures sélectionnées",
@@ -68,6 +130,14 @@ class InvoiceSorterView(ft.Container):
             disabled=True
         )
         
+        # Undo button (visible when the last sort can be undone)
+        self.undo_btn = ft.TextButton(
+            "Annuler le dernier tri",
+            icon=ft.Icons.UNDO,
+            on_click=self.undo_last_sort,
+            visible=self.mover.last_journal() is not None,
+        )
+        
         # Select all checkbox
         self.select_all_checkbox = ft.Checkbox(
             label="Tout sélectionner",
@@ -76,6 +146,36 @@ class InvoiceSorterView(ft.Container):
             active_color=ColorPalette.PRIMARY,
         )
         
+        # Catalog search toggle button
+        self.search_btn = ft.IconButton(
+            icon=ft.Icons.MANAGE_SEARCH,
+            icon_color=ColorPalette.TEXT_SECONDARY,
+            tooltip="Rechercher dans les factures classées",
+            on_click=self._toggle_search,
+        )
+        
+        # Catalog search panel (collapsible)
+        self.search_input = ft.TextField(
+            label="Rechercher une facture classée",
+            hint_text="Ex: EDF 142,50  ou  OVH 2024-03",
+            border_color=ColorPalette.BORDER,
+            focused_border_color=ColorPalette.PRIMARY,
+            prefix_icon=ft.Icons.SEARCH,
+            on_change=self._search_catalog,
+        )
+        self.search_results = ft.ListView(spacing=5, height=220)
+        self.search_panel = ft.Container(
+            content=ft.Column([
+                self.search_input,
+                self.search_results,
+            ]),
+            bgcolor=ColorPalette.SURFACE,
+            border_radius=10,
+            padding=15,
+            visible=False,
+            border=ft.border.all(1, ColorPalette.BORDER),
+        )
+        
         # Settings toggle button
         self.settings_btn = ft.IconButton(
             icon=ft.Icons.SETTINGS,
@@ -119,6 +219,20 @@ class InvoiceSorterView(ft.Container):
                     border_radius=8,
                     padding=10,
                 ),
+                ft.Container(height=10),
+                ft.Row([
+                    ft.Icon(ft.Icons.FOLDER_OPEN, color=ColorPalette.PRIMARY),
+                    self.recursive_checkbox,
+                ]),
+                ft.Row([
+                    ft.Icon(ft.Icons.CONTENT_COPY, color=ColorPalette.PRIMARY),
+                    self.trash_duplicates_checkbox,
+                ]),
+                ft.Row([
+                    ft.Icon(ft.Icons.MEMORY, color=ColorPalette.PRIMARY),
+                    ft.Text("Processus d'analyse en parallèle", style=TextStyles.BODY),
+                    self.workers_slider,
+                ]),
             ]),
             bgcolor=ColorPalette.SURFACE,
             border_radius=10,
@@ -145,14 +259,18 @@ class InvoiceSorterView(ft.Container):
                         ft.Text(f"Source: {downloads_path}", style=TextStyles.CAPTION),
                         ft.Text(f"Destination: {invoices_path}", style=TextStyles.CAPTION),
                     ], expand=True),
+                    self.watch_switch,
+                    self.search_btn,
                     self.settings_btn,
+                    self.cancel_btn,
                     self.scan_btn,
                 ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                 
                 ft.Container(height=15),
                 
-                # Settings panel (hidden by default)
+                # Settings and search panels (hidden by default)
                 self.settings_panel,
+                self.search_panel,
                 
                 # Stats cards
                 self.stats_row,
@@ -162,6 +280,7 @@ class InvoiceSorterView(ft.Container):
                 # Progress
                 self.progress_bar,
                 self.status_text,
+                self.timings_row,
                 
                 ft.Divider(color=ColorPalette.BORDER),
                 
@@ -169,6 +288,7 @@ class InvoiceSorterView(ft.Container):
                 ft.Row([
                     self.select_all_checkbox,
                     ft.Container(expand=True),
+                    self.undo_btn,
                     self.sort_btn,
                 ]),
                 
@@ -224,6 +344,40 @@ class InvoiceSorterView(ft.Container):
         self.settings_btn.icon_color = ColorPalette.PRIMARY if self.settings_visible else ColorPalette.TEXT_SECONDARY
         self.update()
     
+    def _toggle_search(self, e=None):
+        """Toggle catalog search panel visibility."""
+        self.search_panel.visible = not self.search_panel.visible
+        self.search_btn.icon_color = ColorPalette.PRIMARY if self.search_panel.visible else ColorPalette.TEXT_SECONDARY
+        self.update()
+    
+    def _search_catalog(self, e=None):
+        """Search the filed invoices as the user types."""
+        query = self.search_input.value.strip()
+        self.search_results.controls.clear()
+        entries = self.detector.catalog.search(query) if query else []
+        for entry in entries:
+            details = " · ".join(filter(None, [
+                entry.company,
+                ", ".join(f"{amount} €" for amount in entry.amounts[:3]),
+                ", ".join(entry.dates[:2]),
+            ]))
+            self.search_results.controls.append(
+                ft.Container(
+                    content=ft.Column([
+                        ft.Text(os.path.basename(entry.path), style=TextStyles.BODY, weight=ft.FontWeight.BOLD, max_lines=1),
+                        ft.Text(details, style=TextStyles.CAPTION, max_lines=1),
+                        ft.Text(entry.snippet, style=TextStyles.CAPTION, max_lines=2, italic=True),
+                        ft.Text(entry.path, style=TextStyles.CAPTION, max_lines=1, selectable=True),
+                    ], spacing=2),
+                    bgcolor=ColorPalette.CONTAINER_BG,
+                    border_radius=5,
+                    padding=ft.padding.symmetric(horizontal=10, vertical=6),
+                )
+            )
+        if query and not entries:
+            self.search_results.controls.append(ft.Text("Aucune facture trouvée", style=TextStyles.CAPTION))
+        self.update()
+    
     def _refresh_companies_list(self):
         """Refresh the companies list UI."""
         self.companies_list.controls.clear()
@@ -254,6 +408,10 @@ class InvoiceSorterView(ft.Container):
                     )
                 )
     
+    def _set_workers(self, e):
+        """Save the number of analysis worker processes."""
+        settings.set("invoice_workers", int(e.control.value))
+    
     def _add_company(self, e=None):
         """Add a company to the predefined list."""
         company = self.company_input.value.strip()
@@ -288,45 +446,113 @@ class InvoiceSorterView(ft.Container):
             self.page.update()
         self.update()
     
+    def will_unmount(self):
+        self._stop_watch()
+    
+    def toggle_watch(self, e):
+        """Start or stop sorting new downloads automatically."""
+        if self.watch_switch.value:
+            self.watcher = self.detector.watch_downloads(on_result=self._on_watched_file)
+            self.status_text.value = "👀 Surveillance de Téléchargements activée"
+        else:
+            self._stop_watch()
+            self.status_text.value = "Surveillance de Téléchargements désactivée"
+        self.update()
+    
+    def _stop_watch(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+    
+    def _on_watched_file(self, result: InvoiceResult, dest_path: Optional[str]):
+        """Called from the watcher thread for every new download."""
+        if dest_path:
+            message = f"📥 {result.file_name} → {os.path.basename(os.path.dirname(dest_path))}"
+        elif result.duplicate_of:
+            message = f"{result.file_name}: déjà classée dans {os.path.basename(os.path.dirname(result.duplicate_of))}"
+            if settings.get("invoice_trash_duplicates", False):
+                message += " (mise à la corbeille)"
+        elif result.is_invoice:
+            message = f"❌ {result.file_name}: facture non déplacée"
+        else:
+            message = f"{result.file_name}: pas une facture"
+        
+        def show():
+            self.status_text.value = message
+            if dest_path:
+                self.page.snack_bar = ft.SnackBar(content=ft.Text(message), bgcolor=ColorPalette.SURFACE)
+                self.page.snack_bar.open = True
+                self.page.update()
+        self._update_ui_safe(show)
+    
     def start_scan(self, e):
         """Start scanning the Downloads folder."""
         self.scan_btn.disabled = True
         self.sort_btn.disabled = True
+        self.cancel_btn.visible = True
         self.progress_bar.visible = True
+        self.progress_bar.value = None
         self.status_text.value = "Recherche des fichiers..."
         self.results_list.controls.clear()
         self.scan_results.clear()
         self.selected_invoices.clear()
+        self.timing_report = TimingReport()
+        self.timings_row.visible = False
+        self._update_stats()
         self.update()
         
         # Start scanning in background thread
+        self.engine = InvoiceAnalysisEngine(self.detector, int(self.workers_slider.value))
         threading.Thread(target=self._scan_files, daemon=True).start()
     
+    def cancel_scan(self, e):
+        """Stop the running scan; results already received are kept."""
+        if self.engine:
+            self.engine.cancel()
+        self.status_text.value = "Annulation..."
+        self.update()
+    
     def _scan_files(self):
         """Background task to scan files."""
         try:
-            # Get list of files
-            files = self.detector.scan_downloads_folder()
-            total_files = len(files)
+            # Invoices filed since the last scan must be recognized as
+            # duplicates. The index is refreshed alongside the analysis so
+            # that results do not wait for the invoices folder to be hashed
+            index_ready = threading.Event()
             
-            if total_files == 0:
-                self._update_ui_safe(lambda: self._show_message("Aucun fichier trouvé dans Téléchargements"))
-                return
+            def refresh_index():
+                try:
+                    self.detector.refresh_invoice_index()
+                finally:
+                    index_ready.set()
+            
+            threading.Thread(target=refresh_index, daemon=True).start()
+            trash_duplicates = settings.get("invoice_trash_duplicates", False)
+            
+            # Files are analyzed while the folders are still being walked
+            discovery = {"found": 0, "done": False}
+            
+            def discover():
+                for file_path in self.detector.iter_downloads_folder():
+                    discovery["found"] += 1
+                    yield file_path
+                discovery["done"] = True
             
             invoices_found = 0
             companies = set()
+            done = 0
             
-            for i, file_path in enumerate(files):
-                # Update progress
-                progress = (i + 1) / total_files
-                file_name = os.path.basename(file_path)
-                self._update_ui_safe(lambda p=progress, f=file_name: self._update_progress(p, f"Analyse: {f}"))
-                
-                # Analyze file
-                result = self.detector.analyze_file(file_path)
-                self.scan_results.append(result)
+            # Results arrive in completion order from the worker processes
+            for done, result in enumerate(self.engine.analyze(discover(), index_ready), 1):
+                self.timing_report.add(result.file_path, result.timings)
+                if result.duplicate_of and trash_duplicates:
+                    self.detector.trash_duplicate(result)
+                else:
+                    self.scan_results.append(result)
                 
-                if result.is_invoice:
+                if result.duplicate_of and not trash_duplicates:
+                    self._update_ui_safe(lambda r=result: self._add_result_item(r))
+                elif result.is_invoice:
                     invoices_found += 1
                     self.selected_invoices[result.file_path] = True
                     if result.company_name:
@@ -335,15 +561,58 @@ class InvoiceSorterView(ft.Container):
                     # Add to UI immediately
                     self._update_ui_safe(lambda r=result: self._add_result_item(r))
                 
-                # Update stats
-                self._update_ui_safe(lambda s=i+1, inv=invoices_found, c=len(companies): self._update_stats(s, inv, c))
+                # Update progress and stats (indeterminate until all files are found)
+                total_files = discovery["found"]
+                if discovery["done"]:
+                    progress, total_text = done / max(total_files, 1), str(total_files)
+                else:
+                    progress, total_text = None, f"{total_files}+"
+                self._update_ui_safe(lambda p=progress, d=done, t=total_text, f=result.file_name: self._update_progress(p, f"Analysé ({d}/{t}): {f}"))
+                self._update_ui_safe(lambda s=done, inv=invoices_found, c=len(companies): self._update_stats(s, inv, c))
+            
+            if done == 0 and not self.engine.cancelled:
+                self._update_ui_safe(lambda: self._show_message("Aucun fichier trouvé dans Téléchargements"))
+                return
+            
+            # Files analyzed before the index was ready are checked now
+            if self.engine.unchecked_files:
+                self._update_ui_safe(lambda: self._update_progress(None, "Recherche des factures déjà classées..."))
+                index_ready.wait()
+                invoices_found -= self._mark_filed_duplicates(set(self.engine.unchecked_files), trash_duplicates)
             
             # Finish
-            self._update_ui_safe(lambda: self._finish_scan(total_files, invoices_found))
+            scanned = done
+            self._update_ui_safe(lambda: self._finish_scan(scanned, invoices_found))
             
         except Exception as ex:
             self._update_ui_safe(lambda: self._show_error(str(ex)))
     
+    def _mark_filed_duplicates(self, paths: set, trash_duplicates: bool) -> int:
+        """Turns the scan results of `paths` that are copies of filed invoices
+        into duplicates (or trashes them); returns how many were invoices."""
+        replaced = {}
+        for path in paths:
+            filed = self.detector.check_filed(path)
+            if filed:
+                replaced[path] = filed
+        if not replaced:
+            return 0
+        
+        were_invoices = 0
+        results = []
+        for result in self.scan_results:
+            filed = replaced.get(result.file_path)
+            if filed is None:
+                results.append(result)
+                continue
+            were_invoices += result.is_invoice
+            self.selected_invoices.pop(result.file_path, None)
+            if not (trash_duplicates and self.detector.trash_duplicate(filed)[0]):
+                results.append(filed)
+        self.scan_results = results
+        self._update_ui_safe(self._rebuild_results_list)
+        return were_invoices
+    
     def _update_ui_safe(self, func):
         """Safely update UI from background thread."""
         try:
@@ -361,25 +630,44 @@ class InvoiceSorterView(ft.Container):
         """Show a message in status."""
         self.status_text.value = message
         self.progress_bar.visible = False
+        self.cancel_btn.visible = False
         self.scan_btn.disabled = False
     
     def _show_error(self, error: str):
         """Show an error message."""
         self.status_text.value = f"❌ Erreur: {error}"
         self.progress_bar.visible = False
+        self.cancel_btn.visible = False
         self.scan_btn.disabled = False
     
     def _finish_scan(self, total: int, invoices: int):
         """Finish the scan and update UI."""
         self.progress_bar.visible = False
+        self.cancel_btn.visible = False
         self.scan_btn.disabled = False
         self.sort_btn.disabled = invoices == 0
         
-        if invoices > 0:
+        if self.engine and self.engine.cancelled:
+            self.status_text.value = f"Scan annulé: {invoices} factures trouvées sur {total} fichiers analysés"
+            self.select_all_checkbox.value = invoices > 0
+        elif invoices > 0:
             self.status_text.value = f"✅ Scan terminé: {invoices} factures trouvées sur {total} fichiers"
             self.select_all_checkbox.value = True
         else:
             self.status_text.value = f"Scan terminé: aucune facture détectée sur {total} fichiers"
+        
+        summary = self.timing_report.summary_text()
+        self.timings_text.value = f"⏱️ {summary}" if summary else ""
+        self.timings_row.visible = bool(summary)
+    
+    def export_timings(self, e):
+        """Save the per-stage timings of the last scan as JSON."""
+        try:
+            path = self.timing_report.save()
+            self.status_text.value = f"⏱️ Temps d'analyse exportés: {path}"
+        except OSError as ex:
+            self.status_text.value = f"❌ Erreur: {ex}"
+        self.update()
     
     def _add_result_item(self, result: InvoiceResult):
         """Add a result item to the list."""
@@ -388,6 +676,9 @@ class InvoiceSorterView(ft.Container):
     
     def _create_result_item(self, result: InvoiceResult) -> ft.Container:
         """Create a visual item for an invoice result."""
+        if result.duplicate_of:
+            return self._create_duplicate_item(result)
+        
         # Confidence indicator
         confidence_color = ColorPalette.PRIMARY if result.confidence_score > 0.6 else ColorPalette.SECONDARY
         confidence_text = f"{int(result.confidence_score * 100)}%"
@@ -443,6 +734,38 @@ class InvoiceSorterView(ft.Container):
             padding=12,
         )
     
+    def _create_duplicate_item(self, result: InvoiceResult) -> ft.Container:
+        """Create a visual item for a file already filed in the invoices folder."""
+        return ft.Container(
+            content=ft.Row([
+                ft.Icon(ft.Icons.CONTENT_COPY, size=32, color=ColorPalette.TEXT_SECONDARY),
+                ft.Column([
+                    ft.Text(result.file_name, style=TextStyles.BODY, weight=ft.FontWeight.BOLD, max_lines=1),
+                    ft.Text(f"Déjà classée: {result.duplicate_of}", style=TextStyles.CAPTION, max_lines=1),
+                ], expand=True, spacing=2),
+                ft.IconButton(
+                    icon=ft.Icons.DELETE_OUTLINE,
+                    icon_color=ColorPalette.ERROR,
+                    tooltip="Mettre à la corbeille",
+                    on_click=lambda e, r=result: self._trash_duplicate(r),
+                ),
+            ], alignment=ft.MainAxisAlignment.START, spacing=10),
+            bgcolor=ColorPalette.SURFACE,
+            border_radius=8,
+            padding=12,
+        )
+    
+    def _trash_duplicate(self, result: InvoiceResult):
+        """Send a copy of an already filed invoice to the trash."""
+        success, message = self.detector.trash_duplicate(result)
+        if success:
+            self.scan_results = [r for r in self.scan_results if r is not result]
+            self._rebuild_results_list()
+            self.status_text.value = f"🗑️ {result.file_name} mis à la corbeille"
+        else:
+            self.status_text.value = f"❌ Erreur: {message}"
+        self.update()
+    
     def _update_company_name(self, result: InvoiceResult, new_name: str):
         """Update the company name for a result."""
         result.company_name = new_name
@@ -480,7 +803,7 @@ class InvoiceSorterView(ft.Container):
         """Rebuild the results list with current data."""
         self.results_list.controls.clear()
         for result in self.scan_results:
-            if result.is_invoice:
+            if result.is_invoice or result.duplicate_of:
                 self.results_list.controls.append(self._create_result_item(result))
     
     def sort_invoices(self, e):
@@ -500,36 +823,106 @@ class InvoiceSorterView(ft.Container):
         moved_count = 0
         error_count = 0
         
+        # Finish sorts interrupted by a crash before planning a new one
+        resumed = []
+        for journal in self.mover.incomplete_journals():
+            for outcome in self.mover.resume(journal):
+                if outcome.success:
+                    resumed.append((outcome.source, outcome.dest))
+        if resumed:
+            self.detector.record_filed(resumed)
+        
         selected_results = [r for r in self.scan_results 
                           if r.is_invoice and self.selected_invoices.get(r.file_path, False)]
+        # Copies within the selection are filed once
+        copies = self.detector.find_batch_copies([r.file_path for r in selected_results])
         
-        total = len(selected_results)
+        # All destinations are planned at once, then moved in one journaled batch
+        moves = self.mover.plan(
+            (r.file_path, self.detector.company_folder(r.company_name))
+            for r in selected_results if r.file_path not in copies
+        )
+        total = len(moves)
         
-        for i, result in enumerate(selected_results):
-            company = self.detector.normalize_company_name(result.company_name)
-            success, message = self.detector.move_invoice(result.file_path, company)
-            
-            if success:
+        filed = []
+        for i, outcome in enumerate(self.mover.run(moves), 1):
+            if outcome.success:
                 moved_count += 1
+                filed.append((outcome.source, outcome.dest))
                 # Remove from list
-                self.selected_invoices.pop(result.file_path, None)
+                self.selected_invoices.pop(outcome.source, None)
             else:
                 error_count += 1
-                print(f"Error moving {result.file_name}: {message}")
+                print(f"Error moving {os.path.basename(outcome.source)}: {outcome.error}")
             
-            progress = (i + 1) / total
-            self._update_ui_safe(lambda p=progress: self._update_progress(p, f"Déplacement en cours... {i+1}/{total}"))
+            progress = i / total
+            self._update_ui_safe(lambda p=progress, i=i: self._update_progress(p, f"Déplacement en cours... {i}/{total}"))
+        
+        self.detector.record_filed(filed, {r.file_path: r for r in selected_results})
+        
+        # The remaining copies are now duplicates of a filed invoice
+        dest_of = dict(filed)
+        trash_duplicates = settings.get("invoice_trash_duplicates", False)
+        trashed = set()
+        for result in selected_results:
+            first = copies.get(result.file_path)
+            if first not in dest_of:
+                continue
+            result.is_invoice = False
+            result.duplicate_of = dest_of[first]
+            self.selected_invoices.pop(result.file_path, None)
+            if trash_duplicates and self.detector.trash_duplicate(result)[0]:
+                trashed.add(result.file_path)
+        if trashed:
+            self.scan_results = [r for r in self.scan_results if r.file_path not in trashed]
         
         # Finish
         self._update_ui_safe(lambda: self._finish_sort(moved_count, error_count))
     
+    def undo_last_sort(self, e):
+        """Move the invoices of the last sort back to their original folder."""
+        self.undo_btn.disabled = True
+        self.sort_btn.disabled = True
+        self.scan_btn.disabled = True
+        self.progress_bar.visible = True
+        self.progress_bar.value = None
+        self.status_text.value = "Annulation du dernier tri..."
+        self.update()
+        threading.Thread(target=self._undo_last_sort, daemon=True).start()
+    
+    def _undo_last_sort(self):
+        """Background task to undo the last sort."""
+        restored = 0
+        errors = 0
+        unfiled = []
+        for outcome in self.mover.undo():
+            if outcome.success:
+                restored += 1
+                unfiled.append(outcome.source)
+            else:
+                errors += 1
+                print(f"Error restoring {os.path.basename(outcome.source)}: {outcome.error}")
+        self.detector.forget_filed(unfiled)
+        
+        def finish():
+            self.progress_bar.visible = False
+            self.scan_btn.disabled = False
+            self.undo_btn.disabled = False
+            self.undo_btn.visible = self.mover.last_journal() is not None
+            self.sort_btn.disabled = not any(self.selected_invoices.values())
+            if errors > 0:
+                self.status_text.value = f"↩️ {restored} factures remises à leur emplacement d'origine, ❌ {errors} erreurs"
+            else:
+                self.status_text.value = f"↩️ {restored} factures remises à leur emplacement d'origine"
+        self._update_ui_safe(finish)
+    
     def _finish_sort(self, moved: int, errors: int):
         """Finish the sort operation."""
         self.progress_bar.visible = False
         self.scan_btn.disabled = False
         
         # Remove moved items from results
-        self.scan_results = [r for r in self.scan_results if r.file_path in self.selected_invoices]
+        self.scan_results = [r for r in self.scan_results if r.file_path in self.selected_invoices or r.duplicate_of]
         self._rebuild_results_list()
         
         # Update stats
@@ -544,6 +937,7 @@ class InvoiceSorterView(ft.Container):
         
         # Disable sort if no more selected
         self.sort_btn.disabled = remaining == 0
+        self.undo_btn.visible = moved > 0 or self.undo_btn.visible
         
         # Show snackbar
         self.page.snack_bar = ft.SnackBar(
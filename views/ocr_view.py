@@ -6,6 +6,9 @@ from utils.styles import ColorPalette, TextStyles
 from utils.ocr_helper import OCRHelper
 
 class OCRView(ft.Container):
+    # Screenshots OCR'd per tesseract run
+    OCR_BATCH_SIZE = 8
+
     def __init__(self, page: ft.Page, file_picker: ft.FilePicker):
         super().__init__(expand=True)
         self.page = page
@@ -113,12 +116,16 @@ class OCRView(ft.Container):
         threading.Thread(target=self.process_files).start()
 
     def process_files(self):
-        for data in self.files_data:
-            if data['status'] == 'pending':
+        while True:
+            batch = [data for data in self.files_data if data['status'] == 'pending'][:self.OCR_BATCH_SIZE]
+            if not batch:
+                break
+            for data in batch:
                 data['status'] = 'processing'
-                self.update_list_safe()
-                
-                text = self.ocr_helper.extract_text(data['path'])
+            self.update_list_safe()
+            
+            texts = self.ocr_helper.extract_texts([data['path'] for data in batch])
+            for data, text in zip(batch, texts):
                 data['text_preview'] = text[:50] + "..." if text else "No text found"
                 
                 data['new_name'] = self.ocr_helper.generate_filename(
@@ -128,7 +135,7 @@ class OCRView(ft.Container):
                 )
                 
                 data['status'] = 'done'
-                self.update_list_safe()
+            self.update_list_safe()
         
         # Enable rename button if we have processed files
         self.apply_btn.disabled = False